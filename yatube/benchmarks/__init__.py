@@ -0,0 +1,8 @@
+"""
+Бенчмарки проекта.
+
+Запускаются из директории с manage.py, например:
+    python -m benchmarks.pagination --posts 1000000
+Каждый бенчмарк работает на отдельной тестовой базе данных и не трогает
+рабочую базу проекта.
+"""
@@ -0,0 +1,131 @@
+"""
+Общий кеш SQLite против LocMemCache в нескольких рабочих процессах.
+
+Каждый процесс запрашивает одни и те же холодные фрагменты через
+get_or_set, «рендер» фрагмента занимает --render-ms. Считается, сколько
+раз фрагменты были отрендерены, и время чтения горячего ключа.
+
+Отдельно измеряются задержки потока запросов к фрагменту, который
+истекает каждые --timeout-ms: с get_or_set запрос на границе ждёт
+рендера, с get_or_set_stale получает устаревший фрагмент.
+
+    python -m benchmarks.cache --workers 4
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+
+from .utils import measure, setup_django, summary
+
+BACKENDS = {
+    'locmem': 'django.core.cache.backends.locmem.LocMemCache',
+    'sqlite': 'core.cache.SQLiteCache',
+}
+
+
+def make_cache(backend, location):
+    from django.utils.module_loading import import_string
+
+    return import_string(BACKENDS[backend])(location, {})
+
+
+def worker(backend, location, fragments, render_ms, repeat, barrier,
+           renders, queue):
+    setup_django()
+    cache = make_cache(backend, location)
+
+    def render():
+        with renders.get_lock():
+            renders.value += 1
+        time.sleep(render_ms / 1000)
+        return 'x' * 10000
+
+    barrier.wait()
+    started = time.perf_counter()
+    for number in range(fragments):
+        cache.get_or_set(f'fragment{number}', render)
+    cold = (time.perf_counter() - started) * 1000
+    queue.put({'cold_ms': cold,
+               'get_ms': measure(lambda: cache.get('fragment0'), repeat)})
+
+
+def run(backend, workers, fragments, render_ms, repeat):
+    context = multiprocessing.get_context('spawn')
+    barrier = context.Barrier(workers)
+    renders = context.Value('i', 0)
+    queue = context.Queue()
+    with tempfile.TemporaryDirectory() as directory:
+        location = os.path.join(directory, 'cache.sqlite3')
+        processes = [
+            context.Process(target=worker, args=(
+                backend, location, fragments, render_ms, repeat, barrier,
+                renders, queue))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        results = [queue.get() for _ in processes]
+        for process in processes:
+            process.join()
+    return {
+        'backend': backend,
+        'renders': renders.value,
+        'cold_ms': summary([result['cold_ms'] for result in results]),
+        'get_ms': summary([timing for result in results
+                           for timing in result['get_ms']]),
+    }
+
+
+def boundary(stale, render_ms, timeout_ms, requests):
+    from django.core.cache.backends.locmem import LocMemCache
+
+    from core.cache import get_or_set_stale, revalidator
+
+    cache = LocMemCache(f'boundary-{stale}', {})
+    cache.clear()
+
+    def render():
+        time.sleep(render_ms / 1000)
+        return 'x' * 10000
+
+    timeout = timeout_ms / 1000
+    if stale:
+        def get():
+            return get_or_set_stale(cache, 'fragment', render, timeout, 60)
+    else:
+        def get():
+            return cache.get_or_set('fragment', render, timeout)
+    get()
+    timings = []
+    for _ in range(requests):
+        timings.extend(measure(get, 1))
+        time.sleep(0.001)
+    revalidator.wait()
+    return {'mode': 'stale' if stale else 'get_or_set',
+            'request_ms': summary(timings)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--fragments', type=int, default=20)
+    parser.add_argument('--render-ms', type=float, default=20)
+    parser.add_argument('--repeat', type=int, default=1000)
+    parser.add_argument('--timeout-ms', type=float, default=100)
+    parser.add_argument('--requests', type=int, default=2000)
+    args = parser.parse_args()
+    setup_django()
+    results = [run(backend, args.workers, args.fragments, args.render_ms,
+                   args.repeat)
+               for backend in BACKENDS]
+    results += [boundary(stale, args.render_ms, args.timeout_ms,
+                         args.requests)
+                for stale in (False, True)]
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
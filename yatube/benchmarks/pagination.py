@@ -0,0 +1,75 @@
+"""
+Сравнение паджинации LIMIT/OFFSET и по ключу на больших лентах.
+
+    python -m benchmarks.pagination --posts 1000000
+"""
+import argparse
+import json
+
+from .utils import benchmark_database, measure, setup_django, summary
+
+DEPTHS = (1, 10, 100, 1000, 10000, 50000, 100000)
+
+
+def seed_posts(total, batch_size=10000):
+    from posts.models import Post, User
+
+    author = User.objects.create_user(username='bench_author')
+    created = 0
+    while created < total:
+        size = min(batch_size, total - created)
+        Post.objects.bulk_create(
+            Post(text=f'Пост №{created + i}', author=author)
+            for i in range(size)
+        )
+        created += size
+
+
+def run(total, per_page, repeat):
+    from django.core.paginator import Paginator
+    from posts.models import Post
+    from posts.paginators import FORWARD, CursorPaginator
+
+    queryset = Post.objects.all()
+    max_page = (total - 1) // per_page + 1
+    results = []
+    for depth in (d for d in DEPTHS if d <= max_page):
+        def offset_page():
+            paginator = Paginator(queryset.order_by('-pub_date', '-id'),
+                                  per_page)
+            list(paginator.get_page(depth))
+
+        paginator = CursorPaginator(queryset, per_page)
+        cursor = None
+        if depth > 1:
+            # Последняя запись предыдущей страницы задаёт курсор.
+            anchor = paginator.object_list[(depth - 1) * per_page - 1]
+            cursor = paginator.encode_cursor(FORWARD, anchor, depth)
+
+        def cursor_page():
+            paginator = CursorPaginator(queryset, per_page)
+            list(paginator.get_page(cursor=cursor))
+
+        results.append({
+            'page': depth,
+            'offset_ms': summary(measure(offset_page, repeat)),
+            'cursor_ms': summary(measure(cursor_page, repeat)),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    setup_django()
+    with benchmark_database():
+        seed_posts(args.posts)
+        results = run(args.posts, args.per_page, args.repeat)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""
+Накладные расходы на запрос в профилях настроек development и
+production (YATUBE_ENV).
+
+Каждый профиль запускается в отдельном процессе: настройки читаются
+при импорте. Страницы запрашиваются авторизованным пользователем, так
+что кеш страниц для анонимов не участвует, а фрагменты лент после
+первого запроса берутся из кеша - остаются отладочные инструменты,
+загрузка шаблонов и открытие соединений с базой данных.
+
+    python -m benchmarks.runtime --posts 1000
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from io import StringIO
+
+from .utils import benchmark_database, measure, setup_django, summary
+
+PROFILES = ('development', 'production')
+
+
+def seed(posts):
+    from django.core.management import call_command
+    from posts.models import Comment, Group, Post, User
+
+    author = User.objects.create_user(username='bench_author')
+    group = Group.objects.create(title='Группа', slug='bench',
+                                 description='Группа для бенчмарка')
+    Post.objects.bulk_create(
+        Post(text=f'Запись №{number}\nвторая строка', author=author,
+             group=group)
+        for number in range(posts)
+    )
+    post = Post.objects.order_by('-pk').first()
+    Comment.objects.bulk_create(
+        Comment(post=post, author=author, text=f'Комментарий №{number}')
+        for number in range(20)
+    )
+    call_command('render_text_html', stdout=StringIO())
+    return author, group, post
+
+
+def worker(posts, repeat, directory):
+    setup_django()
+    from django.conf import settings
+    from django.test import Client
+    from django.urls import reverse
+
+    # Файл, а не база в памяти: иначе не видно цены соединения.
+    settings.DATABASES['default']['TEST'] = {
+        'NAME': os.path.join(directory, 'benchmark.sqlite3')}
+    with benchmark_database():
+        author, group, post = seed(posts)
+        client = Client()
+        client.force_login(author)
+        urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': group.slug}),
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}),
+        )
+        results = {}
+        for url in urls:
+            client.get(url)
+            results[url] = summary(measure(lambda: client.get(url),
+                                           repeat))
+    return results
+
+
+def run(profile, posts, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            YATUBE_ENV=profile,
+            YATUBE_SECRET_KEY='benchmark',
+            YATUBE_CACHE_PATH=os.path.join(directory, 'cache.sqlite3'),
+        )
+        output = subprocess.run(
+            [sys.executable, '-m', 'benchmarks.runtime', '--worker',
+             '--posts', str(posts), '--repeat', str(repeat),
+             '--directory', directory],
+            env=env, stdout=subprocess.PIPE, check=True,
+        ).stdout
+    return {'profile': profile, 'request_ms': json.loads(output)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=1000)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--worker', action='store_true',
+                        help=argparse.SUPPRESS)
+    parser.add_argument('--directory', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        print(json.dumps(worker(args.posts, args.repeat, args.directory)))
+        return
+    results = [run(profile, args.posts, args.repeat)
+               for profile in PROFILES]
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
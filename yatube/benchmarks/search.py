@@ -0,0 +1,105 @@
+"""
+Время поиска по полнотекстовому индексу записей.
+
+Тексты собираются из словаря со степенным (Ципфа) распределением слов,
+поэтому среди запросов есть и редкие, и очень частые слова.
+
+    python -m benchmarks.search --posts 1000000
+"""
+import argparse
+import json
+import random
+from io import StringIO
+from itertools import accumulate
+
+from .utils import benchmark_database, measure, setup_django, summary
+
+VOCABULARY = 50000
+WORDS_PER_POST = 30
+# ранги слов словаря, по которым ищем: от частых к редким
+QUERY_RANKS = (10, 100, 1000, 10000)
+
+
+def word(rank):
+    return f'слово{rank}'
+
+
+def seed_posts(total, batch_size=10000, seed=1):
+    from posts.models import Post, User
+
+    rng = random.Random(seed)
+    ranks = range(1, VOCABULARY + 1)
+    cum_weights = list(accumulate(1 / rank for rank in ranks))
+    author = User.objects.create_user(username='bench_author')
+    created = 0
+    while created < total:
+        size = min(batch_size, total - created)
+        Post.objects.bulk_create(
+            Post(text=' '.join(
+                word(rank)
+                for rank in rng.choices(ranks, cum_weights=cum_weights,
+                                        k=WORDS_PER_POST)
+            ), author=author)
+            for _ in range(size)
+        )
+        created += size
+
+
+def count_matches(terms):
+    from django.db import connection
+    from posts.search import SQLiteFTSBackend
+
+    table = SQLiteFTSBackend.table
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'SELECT count(*) FROM {table} WHERE {table} MATCH %s',
+            [' '.join(f'"{term}"' for term in terms)],
+        )
+        return cursor.fetchone()[0]
+
+
+def run(per_page, repeat):
+    from posts.search import get_backend, parse_query, search_posts
+
+    backend = get_backend()
+    queries = [word(rank) for rank in QUERY_RANKS]
+    queries.append(f'{word(QUERY_RANKS[1])} {word(QUERY_RANKS[2])}')
+    results = []
+    for query in queries:
+        terms = parse_query(query)
+        first = search_posts(query, per_page=per_page)
+        results.append({
+            'query': query,
+            'matches': count_matches(terms),
+            'index_ms': summary(measure(
+                lambda: backend.search(terms, per_page + 1), repeat)),
+            'page_ms': summary(measure(
+                lambda: list(search_posts(query, per_page=per_page)),
+                repeat)),
+            'next_page_ms': summary(measure(
+                lambda: list(search_posts(query, first.next_cursor,
+                                          per_page=per_page)),
+                repeat)) if first.has_next() else None,
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--posts', type=int, default=1000000)
+    parser.add_argument('--per-page', type=int, default=10)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    setup_django()
+    from django.core.management import call_command
+
+    with benchmark_database():
+        seed_posts(args.posts)
+        call_command('rebuild_search_index', batch_size=10000,
+                     stdout=StringIO())
+        results = run(args.per_page, args.repeat)
+    print(json.dumps(results, indent=2, ensure_ascii=False))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,192 @@
+"""
+Сквозной бенчмарк представлений: каждый маршрут posts.urls, users.urls
+и about.urls запрашивается тестовым клиентом на базе, заполненной
+generate_data.
+
+Для каждого маршрута записываются перцентили времени ответа, число и
+время SQL-запросов, попадания и промахи кеша и время рендеринга
+шаблонов (core.instrumentation). Запросы идут от имени самого
+популярного автора: у него самый большой профиль и лента подписок.
+
+Результат пишется в JSON. С --baseline результат сравнивается с
+прошлым запуском: метрики COMPARED, выросшие больше чем на
+--threshold, считаются регрессией, и команда завершается с кодом 1.
+С --database данные создаются один раз и переиспользуются.
+
+    python -m benchmarks.views --posts 100000 --output views.json
+    python -m benchmarks.views --posts 100000 --baseline views.json
+"""
+import argparse
+import json
+import sys
+import tempfile
+import time
+from contextlib import ExitStack
+from io import StringIO
+
+from .utils import benchmark_database, setup_django, summary
+
+URLCONFS = ('posts.urls', 'users.urls', 'about.urls')
+COMPARED = ('p50', 'p95', 'queries')
+
+
+def seed(users, posts, seed_value):
+    from django.core.management import call_command
+    from posts.models import Post
+
+    if Post.objects.exists():
+        return
+    call_command('generate_data', users=users, posts=posts,
+                 seed=seed_value, stdout=StringIO())
+
+
+def fixtures():
+    """Значения параметров маршрутов."""
+    from django.contrib.auth.tokens import default_token_generator
+    from django.db.models import Count
+    from django.utils.encoding import force_bytes
+    from django.utils.http import urlsafe_base64_encode
+    from posts.models import Group, Post, User
+
+    user = User.objects.order_by('-counters__followers_count').first()
+    post = (Post.objects.filter(author=user)
+            .annotate(comments_total=Count('comments'))
+            .order_by('-comments_total').first())
+    group = Group.objects.order_by('-posts_count').first()
+    return user, {
+        'slug': group.slug,
+        'post_id': post.pk,
+        'username': user.username,
+        'uidb64': urlsafe_base64_encode(force_bytes(user.pk)),
+        'token': default_token_generator.make_token(user),
+    }
+
+
+def routes(values):
+    """(имя маршрута, адрес) для всех маршрутов URLCONFS."""
+    from django.urls import reverse
+    from django.utils.module_loading import import_module
+
+    for urlconf in URLCONFS:
+        module = import_module(urlconf)
+        for pattern in module.urlpatterns:
+            name = f'{module.app_name}:{pattern.name}'
+            kwargs = {key: values[key]
+                      for key in pattern.pattern.converters}
+            yield name, reverse(name, kwargs=kwargs)
+
+
+def run_route(client, user, url, repeat):
+    from core.instrumentation import collect
+
+    timings, stats = [], []
+    for number in range(repeat + 1):
+        # logout и смена пароля сбрасывают сессию.
+        if '_auth_user_id' not in client.session:
+            client.force_login(user)
+        with collect() as request_stats:
+            started = time.perf_counter()
+            response = client.get(url)
+            elapsed = (time.perf_counter() - started) * 1000
+        if number:
+            # Первый запрос прогревает кеш и не учитывается.
+            timings.append(elapsed)
+            stats.append(request_stats)
+
+    def mean(field, scale=1):
+        return sum(getattr(item, field) for item in stats) * scale / repeat
+
+    result = summary(timings)
+    result.update(
+        status=response.status_code,
+        queries=mean('queries'),
+        query_ms=mean('query_time', 1000),
+        cache_hits=mean('cache_hits'),
+        cache_misses=mean('cache_misses'),
+        cache_writes=mean('cache_writes'),
+        cache_ms=mean('cache_time', 1000),
+        template_ms=mean('template_time', 1000),
+    )
+    return result
+
+
+def run(args):
+    from django.test import Client
+
+    seed(args.users, args.posts, args.seed)
+    user, values = fixtures()
+    client = Client()
+    return {
+        name: run_route(client, user, url, args.repeat)
+        for name, url in routes(values)
+    }
+
+
+def compare(results, baseline, threshold):
+    """Список регрессий: (маршрут, метрика, было, стало)."""
+    regressions = []
+    for name, old in baseline['views'].items():
+        new = results['views'].get(name)
+        if new is None:
+            continue
+        for metric in COMPARED:
+            if new[metric] > old[metric] * (1 + threshold):
+                regressions.append((name, metric, old[metric],
+                                    new[metric]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--posts', type=int, default=100000)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--database',
+                        help='файл SQLite, который сохраняется между '
+                             'запусками')
+    parser.add_argument('--output', help='куда записать результат')
+    parser.add_argument('--baseline', help='результат прошлого запуска')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='допустимый рост метрик, доля')
+    args = parser.parse_args()
+    setup_django()
+    from django.conf import settings
+
+    # Рабочие процессы миниатюр не видят тестовую базу: миниатюры
+    # создаются сразу, в прогревочном запросе.
+    settings.THUMBNAIL_WORKERS = 0
+    with ExitStack() as stack:
+        if args.database:
+            settings.DATABASES['default']['TEST'] = {'NAME': args.database}
+            settings.MEDIA_ROOT = f'{args.database}-media'
+        else:
+            settings.MEDIA_ROOT = stack.enter_context(
+                tempfile.TemporaryDirectory())
+        stack.enter_context(benchmark_database(keepdb=bool(args.database)))
+        results = {
+            'settings': {'users': args.users, 'posts': args.posts,
+                         'seed': args.seed, 'repeat': args.repeat,
+                         'debug': settings.DEBUG},
+            'views': run(args),
+        }
+    output = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(output)
+    else:
+        print(output)
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for name, metric, old, new in regressions:
+            print(f'{name}: {metric} {old:.2f} -> {new:.2f}',
+                  file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
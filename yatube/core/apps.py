@@ -1,5 +1,14 @@
 from django.apps import AppConfig
+from django.db.backends.signals import connection_created
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import querylog
+        from .db import apply_sqlite_pragmas
+        connection_created.connect(apply_sqlite_pragmas,
+                                   dispatch_uid='core.sqlite_pragmas')
+        connection_created.connect(querylog.install,
+                                   dispatch_uid='core.querylog')
@@ -0,0 +1,326 @@
+"""
+Кеш в файле SQLite, общий для всех процессов на одной машине.
+
+В отличие от LocMemCache, сброс версии ленты в одном рабочем процессе
+виден всем остальным, а внешний сервис (memcached, Redis) не нужен.
+Операции, меняющие значение по текущему (add, incr), выполняются в
+транзакции BEGIN IMMEDIATE и атомарны между процессами.
+
+get_or_set работает как single-flight: холодный ключ вычисляет только
+процесс, захвативший блокировку, остальные ждут его результат.
+
+get_or_set_stale (с любым бэкендом) ещё grace секунд после истечения
+отдаёт устаревшее значение, а новое вычисляет один фоновый поток.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'core.cache.SQLiteCache',
+            'LOCATION': '/var/tmp/yatube-cache.sqlite3',
+        }
+    }
+"""
+import logging
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд держится блокировка вычисления и как часто её
+# проверяют ждущие процессы.
+LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.01
+# Просроченные и лишние записи удаляются раз в CULL_EVERY записей.
+CULL_EVERY = 100
+
+
+class SQLiteCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        self.location = location
+        options = params.get('OPTIONS', {})
+        self.lock_timeout = options.get('LOCK_TIMEOUT', LOCK_TIMEOUT)
+        self._local = threading.local()
+
+    @property
+    def _connection(self):
+        # Соединение SQLite нельзя передавать между потоками и процессами.
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.connection = self._connect()
+            local.pid = os.getpid()
+        return local.connection
+
+    def _connect(self):
+        directory = os.path.dirname(self.location)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        connection = sqlite3.connect(self.location, timeout=30,
+                                     isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS cache ('
+            'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL'
+            ') WITHOUT ROWID'
+        )
+        connection.execute(
+            'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)'
+        )
+        return connection
+
+    @contextmanager
+    def _transaction(self):
+        connection = self._connection
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            yield connection
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+    @staticmethod
+    def _alive(connection, key):
+        row = connection.execute(
+            'SELECT value, expires FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] <= time.time()):
+            return None
+        return row
+
+    def _make_key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._make_key(key, version)
+        with self._transaction() as connection:
+            if self._alive(connection, key) is not None:
+                return False
+            self._store(connection, key, value, timeout)
+        return True
+
+    def get(self, key, default=None, version=None):
+        row = self._alive(self._connection, self._make_key(key, version))
+        return default if row is None else pickle.loads(row[0])
+
+    def _store(self, connection, key, value, timeout):
+        connection.execute(
+            'INSERT OR REPLACE INTO cache (key, value, expires) '
+            'VALUES (?, ?, ?)',
+            (key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL),
+             self.get_backend_timeout(timeout)),
+        )
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._make_key(key, version)
+        with self._transaction() as connection:
+            self._store(connection, key, value, timeout)
+            self._cull(connection)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self._make_key(key, version)
+        with self._transaction() as connection:
+            if self._alive(connection, key) is None:
+                return False
+            connection.execute(
+                'UPDATE cache SET expires = ? WHERE key = ?',
+                (self.get_backend_timeout(timeout), key),
+            )
+        return True
+
+    def delete(self, key, version=None):
+        self._connection.execute(
+            'DELETE FROM cache WHERE key = ?',
+            (self._make_key(key, version),),
+        )
+
+    def has_key(self, key, version=None):
+        key = self._make_key(key, version)
+        return self._alive(self._connection, key) is not None
+
+    def incr(self, key, delta=1, version=None):
+        key = self._make_key(key, version)
+        with self._transaction() as connection:
+            row = self._alive(connection, key)
+            if row is None:
+                raise ValueError("Key '%s' not found" % key)
+            value = pickle.loads(row[0]) + delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, pickle.HIGHEST_PROTOCOL), key),
+            )
+        return value
+
+    def get_many(self, keys, version=None):
+        made = {self._make_key(key, version): key for key in keys}
+        if not made:
+            return {}
+        rows = self._connection.execute(
+            'SELECT key, value FROM cache WHERE key IN ({}) '
+            'AND (expires IS NULL OR expires > ?)'.format(
+                ', '.join('?' * len(made))),
+            (*made, time.time()),
+        ).fetchall()
+        return {made[key]: pickle.loads(value) for key, value in rows}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        with self._transaction() as connection:
+            for key, value in data.items():
+                self._store(connection, self._make_key(key, version),
+                            value, timeout)
+            self._cull(connection)
+        return []
+
+    def delete_many(self, keys, version=None):
+        with self._transaction() as connection:
+            connection.executemany(
+                'DELETE FROM cache WHERE key = ?',
+                [(self._make_key(key, version),) for key in keys],
+            )
+
+    def clear(self):
+        self._connection.execute('DELETE FROM cache')
+
+    def _cull(self, connection):
+        local = self._local
+        local.writes = getattr(local, 'writes', 0) + 1
+        if local.writes % CULL_EVERY:
+            return
+        connection.execute('DELETE FROM cache WHERE expires <= ?',
+                           (time.time(),))
+        count = connection.execute('SELECT count(*) FROM cache').fetchone()
+        if count[0] <= self._max_entries:
+            return
+        # Вытесняем записи, которые и так истекли бы раньше других.
+        connection.execute(
+            'DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+            'ORDER BY expires IS NULL, expires LIMIT ?)',
+            (count[0] // self._cull_frequency or 1,),
+        )
+
+    def get_or_set(self, key, default, timeout=DEFAULT_TIMEOUT,
+                   version=None):
+        """
+        Возвращает значение ключа, а при его отсутствии вычисляет
+        default ровно в одном процессе (single-flight).
+        """
+        value = self.get(key, version=version)
+        if value is not None or default is None:
+            return value
+        lock = f'{key}:single-flight'
+        locked = self.add(lock, os.getpid(), self.lock_timeout,
+                          version=version)
+        if not locked:
+            value = self._wait(key, lock, version)
+            if value is not None:
+                return value
+        try:
+            value = default() if callable(default) else default
+            self.set(key, value, timeout, version=version)
+        finally:
+            if locked:
+                self.delete(lock, version=version)
+        return value
+
+    def _wait(self, key, lock, version):
+        deadline = time.monotonic() + self.lock_timeout
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL_INTERVAL)
+            value = self.get(key, version=version)
+            if value is not None:
+                return value
+            if not self.has_key(lock, version=version):
+                # Вычислявший процесс упал или значение не сохранилось.
+                return self.get(key, version=version)
+        return None
+
+    def close(self, **kwargs):
+        # Соединение живёт всё время работы потока: открывать файл на
+        # каждый запрос дороже, чем держать его.
+        pass
+
+
+class Revalidator:
+    """Один фоновый поток, по очереди пересчитывающий значения кеша."""
+
+    def __init__(self):
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix='cache-revalidate')
+            return self._executor
+
+    def submit(self, func):
+        return self._get_executor().submit(self._run, func)
+
+    @staticmethod
+    def _run(func):
+        try:
+            func()
+        except Exception:
+            logger.exception('Cache revalidation failed')
+        finally:
+            # Поток живёт долго, соединения с БД не должны висеть.
+            connections.close_all()
+
+    def wait(self):
+        """Дожидается выполнения уже поставленных задач."""
+        self.submit(lambda: None).result()
+
+
+revalidator = Revalidator()
+
+
+def get_or_set_stale(cache, key, default, timeout, grace, version=None):
+    """
+    Как cache.get_or_set, но после timeout значение ещё grace секунд
+    отдаётся устаревшим, а новое вычисляет фоновый поток: ждёт
+    вычисления только запрос с холодным ключом. Пересчёт ключа
+    запускает один процесс - тот, кто первым добавил блокировку.
+    default должен быть вызываемым.
+    """
+    computed = False
+
+    def fresh():
+        nonlocal computed
+        computed = True
+        expires = None if timeout is None else time.time() + timeout
+        return expires, default()
+
+    hard_timeout = None if timeout is None else timeout + grace
+    expires, value = cache.get_or_set(key, fresh, hard_timeout,
+                                      version=version)
+    if computed or expires is None or expires > time.time():
+        return value
+    lock = f'{key}:revalidate'
+    if cache.add(lock, os.getpid(), LOCK_TIMEOUT, version=version):
+        def revalidate():
+            try:
+                cache.set(key, fresh(), hard_timeout, version=version)
+            finally:
+                cache.delete(lock, version=version)
+        revalidator.submit(revalidate)
+    return value
+
+
+def peek_stale(cache, key, version=None):
+    """
+    Значение, сохранённое get_or_set_stale (в том числе устаревшее), или
+    None. Ничего не вычисляет и не записывает.
+    """
+    entry = cache.get(key, version=version)
+    return None if entry is None else entry[1]
@@ -0,0 +1,16 @@
+"""Настройка новых соединений с базой данных."""
+from django.conf import settings
+
+
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    """
+    Обработчик connection_created: выполняет SQLITE_PRAGMAS. При
+    CONN_MAX_AGE соединение живёт между запросами, поэтому PRAGMA
+    выполняются редко.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    pragmas = getattr(settings, 'SQLITE_PRAGMAS', {})
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name} = {value}')
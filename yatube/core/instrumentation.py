@@ -0,0 +1,185 @@
+"""
+Счётчики обработки одного запроса: запросы к базе данных, операции
+кеша и рендеринг шаблонов.
+
+collect() включает сбор в текущем потоке и отдаёт Stats, которые
+заполняются до выхода из блока. Запросы к базе считает
+execute_wrapper соединений. Кеш и шаблоны считают обёртки методов
+бэкендов из CACHES и Template.render: install() ставит их один раз на
+процесс, и вне collect() обёртка только проверяет thread-local.
+Вложенные вызовы (get_many через get, include внутри шаблона)
+учитываются один раз, по внешнему.
+"""
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections
+from django.template.base import Template
+from django.utils.module_loading import import_string
+
+CACHE_WRITES = ('set', 'set_many', 'add', 'delete', 'delete_many', 'incr',
+                'touch')
+
+_state = threading.local()
+_install_lock = threading.Lock()
+_installed = False
+_missing = object()
+
+
+class Stats:
+    """Счётчики одного запроса, время в секундах."""
+
+    FIELDS = ('queries', 'query_time', 'cache_hits', 'cache_misses',
+              'cache_writes', 'cache_time', 'template_time')
+    __slots__ = FIELDS
+
+    def __init__(self):
+        for name in self.FIELDS:
+            setattr(self, name, 0)
+
+    def add(self, other):
+        for name in self.FIELDS:
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+
+
+def current():
+    """Stats текущего сбора в потоке или None."""
+    return getattr(_state, 'stats', None)
+
+
+def _begin(kind):
+    """Stats, если идёт сбор и вызов kind не вложен в такой же."""
+    stats = getattr(_state, 'stats', None)
+    if stats is None or getattr(_state, kind, False):
+        return None
+    setattr(_state, kind, True)
+    return stats
+
+
+def _end(kind, stats, field, started):
+    setattr(_state, kind, False)
+    setattr(stats, field,
+            getattr(stats, field) + time.perf_counter() - started)
+
+
+def _wrap_get(method):
+    @wraps(method)
+    def get(self, key, default=None, version=None):
+        stats = _begin('cache')
+        if stats is None:
+            return method(self, key, default, version=version)
+        started = time.perf_counter()
+        try:
+            value = method(self, key, _missing, version=version)
+        finally:
+            _end('cache', stats, 'cache_time', started)
+        if value is _missing:
+            stats.cache_misses += 1
+            return default
+        stats.cache_hits += 1
+        return value
+    return get
+
+
+def _wrap_get_many(method):
+    @wraps(method)
+    def get_many(self, keys, version=None):
+        stats = _begin('cache')
+        if stats is None:
+            return method(self, keys, version=version)
+        keys = list(keys)
+        started = time.perf_counter()
+        try:
+            values = method(self, keys, version=version)
+        finally:
+            _end('cache', stats, 'cache_time', started)
+        stats.cache_hits += len(values)
+        stats.cache_misses += len(keys) - len(values)
+        return values
+    return get_many
+
+
+def _wrap_write(method):
+    @wraps(method)
+    def write(self, *args, **kwargs):
+        stats = _begin('cache')
+        if stats is None:
+            return method(self, *args, **kwargs)
+        started = time.perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            _end('cache', stats, 'cache_time', started)
+            stats.cache_writes += 1
+    return write
+
+
+def _wrap_render(method):
+    @wraps(method)
+    def render(self, context):
+        stats = _begin('template')
+        if stats is None:
+            return method(self, context)
+        started = time.perf_counter()
+        try:
+            return method(self, context)
+        finally:
+            _end('template', stats, 'template_time', started)
+    return render
+
+
+def install():
+    """Ставит обёртки кеша и шаблонов; повторный вызов ничего не делает."""
+    global _installed
+    if _installed:
+        return
+    with _install_lock:
+        if _installed:
+            return
+        backends = {import_string(options['BACKEND'])
+                    for options in settings.CACHES.values()}
+        for backend in backends:
+            backend.get = _wrap_get(backend.get)
+            backend.get_many = _wrap_get_many(backend.get_many)
+            for name in CACHE_WRITES:
+                setattr(backend, name, _wrap_write(getattr(backend, name)))
+        Template.render = _wrap_render(Template.render)
+        _installed = True
+
+
+def _count_query(execute, sql, params, many, context):
+    stats = getattr(_state, 'stats', None)
+    if stats is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.queries += 1
+        stats.query_time += time.perf_counter() - started
+
+
+@contextmanager
+def collect():
+    """
+    Собирает Stats кода внутри блока. Вложенный сбор получает свои
+    Stats и по выходе добавляет их к внешним.
+    """
+    install()
+    outer = current()
+    stats = Stats()
+    _state.stats = stats
+    try:
+        with ExitStack() as stack:
+            if outer is None:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_count_query))
+            yield stats
+    finally:
+        _state.stats = outer
+        if outer is not None:
+            outer.add(stats)
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.replicas import copy_database, get_replicas
+
+
+class Command(BaseCommand):
+    help = 'Копирует основную базу SQLite в файлы реплик'
+
+    def handle(self, *args, **options):
+        source = connections[DEFAULT_DB_ALIAS].settings_dict['NAME']
+        for alias in get_replicas():
+            connection = connections[alias]
+            # Открытое соединение продолжило бы читать старый файл.
+            connection.close()
+            copy_database(source, connection.settings_dict['NAME'])
+            self.stdout.write(self.style.SUCCESS(
+                f'{alias}: {connection.settings_dict["NAME"]}'
+            ))
@@ -0,0 +1,190 @@
+"""
+Метрики запросов по представлениям в формате Prometheus.
+
+MetricsMiddleware стоит первым в MIDDLEWARE и для каждого запроса
+записывает в registry длительность (гистограмма), число и время
+SQL-запросов, операции кеша, время рендеринга шаблонов и размер ответа
+(core.instrumentation). Метрики помечены именем представления
+(posts:index); страницы из кеша страниц и 404 разрешаются по адресу
+запроса отдельно.
+
+Метрики копятся в памяти процесса под одной блокировкой: на запрос
+это одно её взятие и несколько сложений. Счётчики у каждого процесса
+сервера свои, и /metrics/ отдаёт только счётчики ответившего процесса.
+Поэтому Prometheus должен опрашивать каждый процесс отдельно (свой
+адрес или порт на процесс), а не общий адрес за балансировщиком, и
+суммировать их сам.
+
+Показатели, которые копятся вне запросов (например, LRU-кеш миниатюр),
+приложения отдают через register_collector.
+
+Отдаёт метрики представление core.views.metrics: staff, по токену
+METRICS_TOKEN или с адресов METRICS_ALLOWED_IPS.
+"""
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from .instrumentation import Stats, collect
+
+PREFIX = 'yatube'
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5,
+                    10)
+UNRESOLVED = 'unresolved'
+# Суммы по представлению: (имя метрики, поле Stats, описание).
+TOTALS = (
+    ('db_queries_total', 'queries', 'Число SQL-запросов.'),
+    ('db_query_seconds_total', 'query_time', 'Время SQL-запросов.'),
+    ('cache_hits_total', 'cache_hits', 'Попадания в кеш.'),
+    ('cache_misses_total', 'cache_misses', 'Промахи кеша.'),
+    ('cache_writes_total', 'cache_writes', 'Записи в кеш.'),
+    ('cache_seconds_total', 'cache_time', 'Время операций кеша.'),
+    ('template_seconds_total', 'template_time',
+     'Время рендеринга шаблонов.'),
+)
+
+
+def is_enabled():
+    return getattr(settings, 'METRICS_ENABLED', True)
+
+
+class ViewMetrics:
+    __slots__ = ('statuses', 'buckets', 'duration', 'stats',
+                 'response_bytes')
+
+    def __init__(self):
+        self.statuses = {}
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.duration = 0
+        self.stats = Stats()
+        self.response_bytes = 0
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, status, duration, stats, size):
+        bucket = bisect_left(DURATION_BUCKETS, duration)
+        with self._lock:
+            metrics = self._views.get(view)
+            if metrics is None:
+                metrics = self._views[view] = ViewMetrics()
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.buckets[bucket] += 1
+            metrics.duration += duration
+            metrics.stats.add(stats)
+            metrics.response_bytes += size
+
+    def clear(self):
+        with self._lock:
+            self._views = {}
+
+    def snapshot(self):
+        """Копия метрик: {представление: ViewMetrics}."""
+        with self._lock:
+            copies = {}
+            for view, metrics in self._views.items():
+                copy = ViewMetrics()
+                copy.statuses = dict(metrics.statuses)
+                copy.buckets = list(metrics.buckets)
+                copy.duration = metrics.duration
+                copy.stats.add(metrics.stats)
+                copy.response_bytes = metrics.response_bytes
+                copies[view] = copy
+            return copies
+
+
+registry = Registry()
+# Функции без аргументов, возвращающие (имя, тип, описание, значение).
+collectors = []
+
+
+def register_collector(collector):
+    """Добавляет в /metrics/ показатели, которые вернёт collector."""
+    if collector not in collectors:
+        collectors.append(collector)
+
+
+def _label(value):
+    return (str(value).replace('\\', r'\\').replace('"', r'\"')
+            .replace('\n', r'\n'))
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_label(value)}"'
+                          for name, value in labels.items()) + '}'
+
+
+def _header(lines, name, kind, description):
+    lines.append(f'# HELP {PREFIX}_{name} {description}')
+    lines.append(f'# TYPE {PREFIX}_{name} {kind}')
+
+
+def render(views=None):
+    """Метрики в текстовом формате Prometheus."""
+    views = sorted((views or registry.snapshot()).items())
+    lines = []
+    _header(lines, 'requests_total', 'counter', 'Обработанные запросы.')
+    for view, metrics in views:
+        for status, count in sorted(metrics.statuses.items()):
+            lines.append(f'{PREFIX}_requests_total'
+                         f'{_labels(view=view, status=status)} {count}')
+    _header(lines, 'request_duration_seconds', 'histogram',
+            'Длительность обработки запроса.')
+    name = f'{PREFIX}_request_duration_seconds'
+    for view, metrics in views:
+        total = 0
+        for bound, count in zip(DURATION_BUCKETS + ('+Inf',),
+                                metrics.buckets):
+            total += count
+            lines.append(f'{name}_bucket{_labels(view=view, le=bound)} '
+                         f'{total}')
+        lines.append(f'{name}_sum{_labels(view=view)} {metrics.duration}')
+        lines.append(f'{name}_count{_labels(view=view)} {total}')
+    for metric, field, description in TOTALS:
+        _header(lines, metric, 'counter', description)
+        for view, metrics in views:
+            lines.append(f'{PREFIX}_{metric}{_labels(view=view)} '
+                         f'{getattr(metrics.stats, field)}')
+    _header(lines, 'response_bytes_total', 'counter',
+            'Размер тел ответов.')
+    for view, metrics in views:
+        lines.append(f'{PREFIX}_response_bytes_total{_labels(view=view)} '
+                     f'{metrics.response_bytes}')
+    for collector in collectors:
+        for metric, kind, description, value in collector():
+            _header(lines, metric, kind, description)
+            lines.append(f'{PREFIX}_{metric} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        try:
+            match = resolve(request.path_info)
+        except Resolver404:
+            return UNRESOLVED
+    return match.view_name
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_enabled():
+            return self.get_response(request)
+        started = time.perf_counter()
+        with collect() as stats:
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+        size = 0 if response.streaming else len(response.content)
+        registry.observe(view_name(request), response.status_code,
+                         duration, stats, size)
+        return response
@@ -0,0 +1,123 @@
+"""
+Кеш целых страниц для анонимных читателей.
+
+PageCacheMiddleware стоит в MIDDLEWARE сразу за MetricsMiddleware:
+закешированная страница отдаётся до сессий, аутентификации, CSRF и
+самого представления.
+Кешируются только GET-запросы без cookie сессии, ключ - адрес с
+параметрами из PAGE_CACHE_PARAMS (номер страницы и курсор): прочие
+параметры (метки рекламных кампаний, ?nocache=...) не размножают
+записи кеша. Представление разрешает кеширование страницы,
+помечая её тегами (tag); purge сбрасывает все страницы с тегом.
+
+Теги версионированы так же, как области кеша лент (core.versions): в
+записи хранятся версии её тегов, purge увеличивает версию, и запись с
+устаревшей версией считается промахом.
+
+Включается настройкой PAGE_CACHE_ENABLED, время жизни страницы -
+PAGE_CACHE_TIMEOUT секунд.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe, urlencode
+
+from . import replicas, versions
+
+# Тег всех страниц: purge(ALL_PAGES) сбрасывает весь кеш страниц.
+ALL_PAGES = 'pages'
+PAGE_KEY = 'page:{}'
+TAG_KEY = 'page-tag:{}'
+# Параметры запроса, от которых зависит страница.
+PAGE_CACHE_PARAMS = ('page', 'cursor')
+
+
+def is_enabled():
+    return getattr(settings, 'PAGE_CACHE_ENABLED', False)
+
+
+def tag(request, *tags):
+    """
+    Разрешает кешировать ответ на запрос с тегами tags. Ответ,
+    прочитанный с реплики, не кешируется (core.replicas).
+    """
+    if replicas.is_replica_read():
+        return
+    request.page_cache_tags = (ALL_PAGES,) + tags
+
+
+def purge(*tags):
+    """Сбрасывает все закешированные страницы с тегами tags."""
+    versions.bump(TAG_KEY.format(name) for name in tags)
+
+
+def _page_key(request):
+    params = sorted((name, value)
+                    for name, value in request.GET.items()
+                    if name in PAGE_CACHE_PARAMS)
+    url = request.build_absolute_uri(request.path)
+    if params:
+        url = f'{url}?{urlencode(params)}'
+    return PAGE_KEY.format(hashlib.md5(url.encode()).hexdigest())
+
+
+def _is_cacheable_request(request):
+    return (is_enabled()
+            and request.method == 'GET'
+            and settings.SESSION_COOKIE_NAME not in request.COOKIES)
+
+
+def _is_cacheable_response(request, response):
+    user = getattr(request, 'user', None)
+    return (getattr(request, 'page_cache_tags', None)
+            and response.status_code == 200
+            and not response.streaming
+            and not response.cookies
+            and not (user and user.is_authenticated))
+
+
+def get_page(request):
+    """Закешированный ответ на запрос или None."""
+    entry = cache.get(_page_key(request))
+    if entry is None:
+        return None
+    tags, response = entry
+    current = cache.get_many([TAG_KEY.format(name) for name in tags])
+    for name, version in tags.items():
+        if current.get(TAG_KEY.format(name)) != version:
+            return None
+    return response
+
+
+def set_page(request, response):
+    tags = request.page_cache_tags
+    current = versions.get_or_add([TAG_KEY.format(name) for name in tags])
+    entry = ({name: current[TAG_KEY.format(name)] for name in tags},
+             response)
+    cache.set(_page_key(request), entry,
+              getattr(settings, 'PAGE_CACHE_TIMEOUT', 600))
+
+
+class PageCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _is_cacheable_request(request):
+            return self.get_response(request)
+        response = get_page(request)
+        if response is not None:
+            # Условный запрос обрабатываем так же, как представление.
+            return get_conditional_response(
+                request,
+                etag=response.get('ETag'),
+                last_modified=parse_http_date_safe(
+                    response.get('Last-Modified', '')),
+                response=response,
+            )
+        response = self.get_response(request)
+        if _is_cacheable_response(request, response):
+            set_page(request, response)
+        return response
@@ -0,0 +1,199 @@
+"""
+Профилирование отдельных запросов сэмплированием стека.
+
+ProfilerMiddleware профилирует запрос, если его запросил staff
+(параметр ?profile или заголовок X-Profile), а также каждый
+PROFILER_SAMPLE_RATE-й запрос (0 - не профилировать). Пока запрос
+обрабатывается, отдельный поток раз в PROFILER_INTERVAL секунд
+снимает стек потока запроса. Результат записывается в PROFILER_DIR в
+формате collapsed stacks ("кадр;кадр;...;кадр число"), который читают
+flamegraph.pl и speedscope. Имя файла профиля, запрошенного staff,
+возвращается в заголовке X-Profile. В PROFILER_DIR остаются только
+PROFILER_KEEP_FILES самых новых профилей: более старые удаляются при
+записи нового.
+
+Пока запрос занят вычислениями, поток-сэмплер получает GIL не чаще
+sys.getswitchinterval() (5 мс). Для профиля, запрошенного staff,
+интервал переключения потоков на время запроса снижается до
+PROFILER_INTERVAL. Это настройка всего процесса: она замедляет и
+соседние запросы в тех же потоках. Поэтому профили по
+PROFILER_SAMPLE_RATE её не трогают и снимаются с шагом не меньше
+sys.getswitchinterval().
+"""
+import datetime
+import itertools
+import logging
+import os
+import sys
+import threading
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+
+from .metrics import view_name
+
+PARAM = 'profile'
+HEADER = 'HTTP_X_PROFILE'
+RESPONSE_HEADER = 'X-Profile'
+
+logger = logging.getLogger(__name__)
+
+_requests = itertools.count(1)
+_switch_lock = threading.Lock()
+_switch_users = 0
+_switch_interval = None
+
+
+def profiles_dir():
+    return getattr(settings, 'PROFILER_DIR', 'profiles')
+
+
+def sample_interval():
+    return getattr(settings, 'PROFILER_INTERVAL', 0.001)
+
+
+def sample_rate():
+    return getattr(settings, 'PROFILER_SAMPLE_RATE', 0)
+
+
+def keep_files():
+    return getattr(settings, 'PROFILER_KEEP_FILES', 100)
+
+
+def _short_path(path):
+    for prefix in sorted(filter(None, sys.path), key=len, reverse=True):
+        if path.startswith(prefix + os.sep):
+            return path[len(prefix) + 1:]
+    return path
+
+
+@lru_cache(maxsize=4096)
+def _frame_label(code):
+    return (f'{code.co_name} '
+            f'({_short_path(code.co_filename)}:{code.co_firstlineno})')
+
+
+def _lower_switch_interval(interval):
+    global _switch_users, _switch_interval
+    with _switch_lock:
+        if not _switch_users:
+            _switch_interval = sys.getswitchinterval()
+            sys.setswitchinterval(min(interval, _switch_interval))
+        _switch_users += 1
+
+
+def _restore_switch_interval():
+    global _switch_users
+    with _switch_lock:
+        _switch_users -= 1
+        if not _switch_users:
+            sys.setswitchinterval(_switch_interval)
+
+
+class StackSampler:
+    """
+    Снимает стек потока thread_id, пока открыт блок with. С
+    lower_switch_interval на это время снижает интервал переключения
+    потоков процесса до interval.
+    """
+
+    def __init__(self, thread_id, interval, lower_switch_interval=True):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.lower_switch_interval = lower_switch_interval
+        self.stacks = Counter()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self):
+        if self.lower_switch_interval:
+            _lower_switch_interval(self.interval)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stopped.set()
+        self._thread.join()
+        if self.lower_switch_interval:
+            _restore_switch_interval()
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self._collapse(frame)] += 1
+
+    @staticmethod
+    def _collapse(frame):
+        labels = []
+        while frame is not None:
+            labels.append(_frame_label(frame.f_code))
+            frame = frame.f_back
+        return ';'.join(reversed(labels))
+
+    def collapsed(self):
+        return ''.join(f'{stack} {count}\n'
+                       for stack, count in sorted(self.stacks.items()))
+
+
+def save(sampler, request):
+    """Записывает профиль запроса и возвращает имя файла."""
+    directory = profiles_dir()
+    os.makedirs(directory, exist_ok=True)
+    moment = datetime.datetime.now().strftime('%Y%m%dT%H%M%S%f')
+    view = view_name(request).replace(':', '_')
+    name = f'{moment}-{view}-{os.getpid()}.folded'
+    with open(os.path.join(directory, name), 'w') as file:
+        file.write(sampler.collapsed())
+    rotate(directory, keep_files())
+    return name
+
+
+def rotate(directory, keep):
+    """Удаляет профили в directory, кроме keep самых новых."""
+    # Имена начинаются со времени записи.
+    names = sorted(name for name in os.listdir(directory)
+                   if name.endswith('.folded'))
+    for name in names[:max(len(names) - keep, 0)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            # Удалён другим процессом сервера.
+            pass
+
+
+def is_requested(request):
+    user = getattr(request, 'user', None)
+    return ((PARAM in request.GET or HEADER in request.META)
+            and user is not None and user.is_staff)
+
+
+def is_sampled():
+    rate = sample_rate()
+    return rate > 0 and next(_requests) % rate == 0
+
+
+class ProfilerMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        requested = is_requested(request)
+        if not requested and not is_sampled():
+            return self.get_response(request)
+        interval = sample_interval()
+        if not requested:
+            interval = max(interval, sys.getswitchinterval())
+        with StackSampler(threading.get_ident(), interval,
+                          lower_switch_interval=requested) as sampler:
+            response = self.get_response(request)
+        try:
+            name = save(sampler, request)
+        except OSError:
+            # Профиль не должен ломать сам запрос.
+            logger.exception('Profile of %s was not saved', request.path)
+            return response
+        if requested:
+            response[RESPONSE_HEADER] = name
+        return response
@@ -0,0 +1,206 @@
+"""
+Журнал медленных SQL-запросов и поиск повторяющихся запросов.
+
+install() ставит на каждое новое соединение execute_wrapper, поэтому
+он работает и в запросах, и в командах manage.py. Запрос дольше
+SLOW_QUERY_SECONDS пишется в лог core.querylog с представлением (или
+командой), нормализованным текстом и планом (EXPLAIN для SELECT).
+
+QueryLogMiddleware считает нормализованные запросы каждого HTTP-запроса
+и предупреждает, если один и тот же выполнен больше
+QUERY_DUPLICATE_LIMIT раз (QUERY_DUPLICATE_BUDGETS задаёт бюджет
+отдельным представлениям): так выглядит N+1 в шаблоне. Разовую
+работу вне логики представления (создание миниатюр без пула процессов)
+оборачивают в ignored(), и её запросы не считаются. При
+QUERY_DUPLICATE_STRICT вместо предупреждения поднимается
+DuplicateQueriesError; тестовый раннер core.testing.StrictQueriesRunner
+включает его, и тест такого представления падает.
+
+Обёртка ставится в начало execute_wrappers: execute_wrapper() снимает
+при выходе последнюю обёртку, и соединение, открытое внутри такого
+блока (core.instrumentation.collect), иначе потеряло бы чужую.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DatabaseError
+
+from .metrics import view_name
+
+logger = logging.getLogger(__name__)
+
+_state = threading.local()
+
+_SPACES = re.compile(r'\s+')
+_IN_LIST = re.compile(r'\bIN \(\s*\?(?:\s*,\s*\?)*\s*\)', re.IGNORECASE)
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+
+
+class DuplicateQueriesError(AssertionError):
+    """Представление повторило запрос больше своего бюджета."""
+
+
+def is_enabled():
+    return getattr(settings, 'QUERY_LOG_ENABLED', True)
+
+
+def slow_query_seconds():
+    return getattr(settings, 'SLOW_QUERY_SECONDS', 0.1)
+
+
+def duplicate_budget(view):
+    budgets = getattr(settings, 'QUERY_DUPLICATE_BUDGETS', {})
+    return budgets.get(view, getattr(settings, 'QUERY_DUPLICATE_LIMIT', 5))
+
+
+def is_strict():
+    return getattr(settings, 'QUERY_DUPLICATE_STRICT', False)
+
+
+@lru_cache(maxsize=1024)
+def normalize(sql):
+    """
+    Текст запроса без значений: литералы и параметры заменены на ?,
+    списки IN (?, ?, ...) любой длины - на (...). Текст запроса с
+    параметрами %s повторяется, поэтому результат запоминается.
+    """
+    sql = _STRING.sub('?', sql).replace('%s', '?')
+    sql = _NUMBER.sub('?', sql)
+    sql = _SPACES.sub(' ', sql).strip()
+    return _IN_LIST.sub('IN (...)', sql)
+
+
+def explain(connection, sql, params):
+    """Строки плана SELECT или пустой список."""
+    if sql.lstrip()[:6].upper() != 'SELECT':
+        return []
+    if connection.vendor == 'sqlite':
+        prefix = 'EXPLAIN QUERY PLAN'
+    else:
+        prefix = connection.ops.explain_query_prefix()
+    _state.explaining = True
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(f'{prefix} {sql}', params)
+            return [str(row[-1]) for row in cursor.fetchall()]
+    except DatabaseError:
+        return []
+    finally:
+        _state.explaining = False
+
+
+class Scope:
+    """Нормализованные запросы одного HTTP-запроса."""
+
+    def __init__(self, request):
+        self.request = request
+        self.statements = Counter()
+
+    @property
+    def label(self):
+        return view_name(self.request)
+
+    def duplicates(self):
+        """{запрос: число выполнений} сверх бюджета представления."""
+        budget = duplicate_budget(self.label)
+        return {statement: count
+                for statement, count in self.statements.items()
+                if count > budget}
+
+
+def _command_label():
+    return ' '.join(os.path.basename(arg) for arg in sys.argv[:2])
+
+
+def _log_slow(connection, sql, params, statement, duration):
+    scope = getattr(_state, 'scope', None)
+    label = scope.label if scope is not None else _command_label()
+    plan = explain(connection, sql, params)
+    logger.warning(
+        'Slow query (%.1f ms) in %s: %s%s', duration * 1000, label,
+        statement, ''.join(f'\n    {line}' for line in plan),
+        extra={'view': label, 'duration': duration, 'sql': statement},
+    )
+
+
+def _watch(execute, sql, params, many, context):
+    if getattr(_state, 'explaining', False) or not is_enabled():
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        duration = time.perf_counter() - started
+        scope = getattr(_state, 'scope', None)
+        slow = duration >= slow_query_seconds()
+        if scope is not None or slow:
+            statement = normalize(sql)
+            if scope is not None and not getattr(_state, 'ignoring', False):
+                scope.statements[statement] += 1
+            if slow and not many:
+                _log_slow(context['connection'], sql, params, statement,
+                          duration)
+
+
+def install(sender, connection, **kwargs):
+    """Обработчик connection_created: ставит обёртку один раз."""
+    if _watch not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, _watch)
+
+
+@contextmanager
+def watch(request):
+    """Считает запросы внутри блока в Scope запроса request."""
+    outer = getattr(_state, 'scope', None)
+    scope = _state.scope = Scope(request)
+    try:
+        yield scope
+    finally:
+        _state.scope = outer
+
+
+@contextmanager
+def ignored():
+    """Запросы внутри блока не считаются в повторы HTTP-запроса."""
+    outer = getattr(_state, 'ignoring', False)
+    _state.ignoring = True
+    try:
+        yield
+    finally:
+        _state.ignoring = outer
+
+
+def report(scope):
+    duplicates = scope.duplicates()
+    if not duplicates:
+        return
+    message = f'Duplicate queries in {scope.label}:' + ''.join(
+        f'\n    {count}x {statement}'
+        for statement, count in sorted(duplicates.items(),
+                                       key=lambda item: -item[1])
+    )
+    if is_strict():
+        raise DuplicateQueriesError(message)
+    logger.warning('%s', message, extra={'view': scope.label})
+
+
+class QueryLogMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not is_enabled():
+            return self.get_response(request)
+        with watch(request) as scope:
+            response = self.get_response(request)
+        report(scope)
+        return response
@@ -0,0 +1,137 @@
+"""
+Чтение лент с реплик базы данных.
+
+Представления, помеченные read_from_replica, выполняют все запросы на
+чтение на одной из реплик DATABASE_REPLICAS, выбранной на весь запрос.
+Остальные представления и любые записи работают с основной базой
+(default).
+
+Чтобы пользователь сразу видел свои изменения, ReplicaPinMiddleware
+после запроса с записью в базу ставит cookie на REPLICA_PIN_SECONDS:
+пока она есть, его запросы читают основную базу. Закрепляют только
+записи в приложения REPLICA_PIN_APPS (то, что показывают ленты):
+вход (last_login в auth) и сессии сами по себе пользователя не
+закрепляют.
+
+Реплика может отставать от версий кеша (core.versions): сброс версии
+уже виден, а новая запись на реплику ещё не пришла. Поэтому при чтении
+с реплики кеш только читается - страница не помечается для кеша
+страниц (core.pagecache.tag), а фрагмент ({% fragment_cache %}) не
+записывается, иначе устаревший HTML лёг бы под новую версию.
+
+Для локальной проверки репликами служат копии файла SQLite, которые
+обновляет команда sync_replicas.
+"""
+import random
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import wraps
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+PIN_COOKIE = 'db_pin'
+
+_state = threading.local()
+
+
+def get_replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+def pin_seconds():
+    return getattr(settings, 'REPLICA_PIN_SECONDS', 30)
+
+
+def pin_apps():
+    return getattr(settings, 'REPLICA_PIN_APPS', ('posts',))
+
+
+def is_pinned(request):
+    return PIN_COOKIE in request.COOKIES
+
+
+def is_replica_read():
+    """Истина внутри блока чтения с реплики."""
+    return getattr(_state, 'replica', None) is not None
+
+
+@contextmanager
+def replica_reads(alias):
+    """Направляет чтение в блоке на реплику alias."""
+    previous = getattr(_state, 'replica', None)
+    _state.replica = alias
+    try:
+        yield
+    finally:
+        _state.replica = previous
+
+
+def _load_user(request):
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_authenticated
+
+
+def read_from_replica(view):
+    """
+    Декоратор представления: чтение на случайной реплике, если
+    пользователь недавно ничего не записывал.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        replicas = get_replicas()
+        if not replicas or is_pinned(request):
+            return view(request, *args, **kwargs)
+        # Сессию и пользователя читаем из основной базы: на реплику
+        # новая сессия могла ещё не попасть.
+        _load_user(request)
+        with replica_reads(random.choice(replicas)):
+            return view(request, *args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return getattr(_state, 'replica', None)
+
+    def db_for_write(self, model, **hints):
+        if model._meta.app_label in pin_apps():
+            _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaPinMiddleware:
+    """Закрепляет за записавшим пользователем основную базу."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        _state.wrote = False
+        response = self.get_response(request)
+        if _state.wrote and get_replicas():
+            response.set_cookie(PIN_COOKIE, '1', max_age=pin_seconds(),
+                                httponly=True,
+                                samesite=settings.SESSION_COOKIE_SAMESITE)
+        return response
+
+
+def copy_database(source, target):
+    """Копирует файл SQLite source в target через backup API."""
+    source_db = sqlite3.connect(source)
+    target_db = sqlite3.connect(target)
+    try:
+        source_db.backup(target_db)
+    finally:
+        target_db.close()
+        source_db.close()
@@ -0,0 +1,114 @@
+"""
+Тег {% fragment_cache %} - то же, что {% cache %}, но фрагмент
+вычисляется через cache.get_or_set. С бэкендом core.cache.SQLiteCache
+холодный фрагмент рендерит один процесс, остальные ждут результат.
+
+С аргументом stale=<секунды> истёкший фрагмент ещё столько секунд
+отдаётся как есть, а новый рендерится в фоновом потоке
+(core.cache.get_or_set_stale).
+
+При чтении с реплики (core.replicas) фрагмент только читается из кеша:
+реплика может отставать от версий в ключе.
+"""
+from django import template
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.template.context import RenderContext
+from django.templatetags.cache import CacheNode
+
+from core import replicas
+from core.cache import get_or_set_stale, peek_stale
+
+register = template.Library()
+
+OPTIONS = ('using=', 'stale=')
+
+
+class FragmentCacheNode(CacheNode):
+    def __init__(self, nodelist, expire_time_var, fragment_name, vary_on,
+                 cache_name, stale_var=None):
+        super().__init__(nodelist, expire_time_var, fragment_name, vary_on,
+                         cache_name)
+        self.stale_var = stale_var
+
+    def resolve_expire_time(self, context):
+        try:
+            expire_time = self.expire_time_var.resolve(context)
+            return None if expire_time is None else int(expire_time)
+        except (template.VariableDoesNotExist, TypeError, ValueError):
+            raise template.TemplateSyntaxError(
+                f'"fragment_cache" tag got an invalid timeout: '
+                f'{self.expire_time_var.var!r}'
+            )
+
+    def resolve_grace(self, context):
+        try:
+            return int(self.stale_var.resolve(context))
+        except (template.VariableDoesNotExist, TypeError, ValueError):
+            raise template.TemplateSyntaxError(
+                f'"fragment_cache" tag got an invalid stale time: '
+                f'{self.stale_var.var!r}'
+            )
+
+    def resolve_cache(self, context):
+        name = 'template_fragments'
+        if self.cache_name:
+            name = self.cache_name.resolve(context)
+        try:
+            return caches[name]
+        except InvalidCacheBackendError:
+            if self.cache_name:
+                raise template.TemplateSyntaxError(
+                    f'Invalid cache name for fragment_cache tag: {name!r}')
+            return caches['default']
+
+    def render(self, context):
+        expire_time = self.resolve_expire_time(context)
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        key = make_template_fragment_key(self.fragment_name, vary_on)
+        cache = self.resolve_cache(context)
+        if replicas.is_replica_read():
+            if self.stale_var is None:
+                cached = cache.get(key)
+            else:
+                cached = peek_stale(cache, key)
+            if cached is None:
+                return self.nodelist.render(context)
+            return cached
+        if self.stale_var is None:
+            return cache.get_or_set(
+                key, lambda: self.nodelist.render(context), expire_time)
+        # Фоновый поток рендерит фрагмент после ответа, когда контекст
+        # запроса уже разобран: рендерим копию.
+        snapshot = context.new(context.flatten())
+        snapshot.render_context = RenderContext()
+        return get_or_set_stale(
+            cache, key, lambda: self.nodelist.render(snapshot),
+            expire_time, self.resolve_grace(context))
+
+
+@register.tag('fragment_cache')
+def do_fragment_cache(parser, token):
+    """
+    {% fragment_cache [expire_time] [fragment_name] [var1] .. %}
+        ...
+    {% endfragment_cache %}
+
+    Аргументы те же, что у {% cache %}, включая using="...", и
+    stale=<секунды> в конце.
+    """
+    nodelist = parser.parse(('endfragment_cache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            f'{tokens[0]!r} tag requires at least 2 arguments.')
+    options = {}
+    while len(tokens) > 3 and tokens[-1].startswith(OPTIONS):
+        name, value = tokens.pop().split('=', 1)
+        options[name] = parser.compile_filter(value)
+    return FragmentCacheNode(
+        nodelist, parser.compile_filter(tokens[1]), tokens[2],
+        [parser.compile_filter(bit) for bit in tokens[3:]],
+        options.get('using'), options.get('stale'),
+    )
@@ -0,0 +1,97 @@
+from django.db import connection
+from django.test import override_settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+
+class CaptureQueryPlans:
+    """
+    Контекстный менеджер, собирающий `EXPLAIN QUERY PLAN` (SQLite)
+    для каждого SELECT, выполненного внутри блока.
+
+    Атрибут `plans` - список пар (sql, строки плана).
+    """
+
+    def __init__(self, using=connection):
+        self.connection = using
+        self.queries = []
+        self.plans = []
+
+    def __enter__(self):
+        self._wrapper = self.connection.execute_wrapper(self._record)
+        self._wrapper.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._wrapper.__exit__(exc_type, exc_value, traceback)
+        if exc_type is None:
+            self.plans = [
+                (sql, self.explain(sql, params))
+                for sql, params in self.queries
+            ]
+
+    def _record(self, execute, sql, params, many, context):
+        result = execute(sql, params, many, context)
+        # Упавшие запросы (например, ожидаемые OperationalError) не
+        # объясняем.
+        if not many and sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return result
+
+    def explain(self, sql, params):
+        with self.connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+            return [row[-1] for row in cursor.fetchall()]
+
+
+def is_full_scan_with_sort(plan, table):
+    """
+    Истина, если план читает всю таблицу `table` и сортирует результат
+    во временном B-дереве: признак отсутствия подходящего индекса.
+    """
+    full_scan = any(
+        words[:1] == ['SCAN'] and table in words and 'USING' not in words
+        for words in (line.split() for line in plan)
+    )
+    temp_sort = any('USE TEMP B-TREE FOR ORDER BY' in line for line in plan)
+    return full_scan and temp_sort
+
+
+class QueryBudgetMixin:
+    """
+    Примесь для TestCase: проверка, что запрос к странице укладывается
+    в заданное число SQL-запросов. Возврат N+1 в шаблоне ломает тест.
+    """
+
+    def assertQueryBudget(self, budget, url, data=None, client=None):
+        client = client or self.client
+        with CaptureQueriesContext(connection) as captured:
+            response = client.get(url, data)
+        executed = len(captured.captured_queries)
+        if executed > budget:
+            queries = '\n'.join(
+                f'{number}. {query["sql"]}'
+                for number, query in enumerate(captured.captured_queries, 1)
+            )
+            self.fail(
+                f'{url}: {executed} SQL-запросов при бюджете {budget}:\n'
+                f'{queries}'
+            )
+        return response
+
+
+class StrictQueriesRunner(DiscoverRunner):
+    """
+    Тестовый раннер с QUERY_DUPLICATE_STRICT: представление, повторившее
+    SQL-запрос больше бюджета (core.querylog), роняет тест
+    DuplicateQueriesError.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._strict = override_settings(QUERY_DUPLICATE_STRICT=True)
+        self._strict.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._strict.disable()
+        super().teardown_test_environment(**kwargs)
@@ -0,0 +1,203 @@
+import multiprocessing
+import shutil
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.core.cache.backends.locmem import LocMemCache
+from django.template import Context, Template
+from django.test import SimpleTestCase
+
+from core.cache import SQLiteCache, get_or_set_stale, revalidator
+
+
+def make_cache(location, **options):
+    return SQLiteCache(location, {'OPTIONS': options})
+
+
+def incr_many(location, times):
+    cache = make_cache(location)
+    for _ in range(times):
+        cache.incr('counter')
+
+
+def compute_once(location, counter, barrier):
+    cache = make_cache(location)
+
+    def compute():
+        with counter.get_lock():
+            counter.value += 1
+        time.sleep(0.2)
+        return 'value'
+
+    barrier.wait()
+    return cache.get_or_set('fragment', compute, DEFAULT_TIMEOUT)
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.location = f'{self.directory}/cache.sqlite3'
+        self.cache = make_cache(self.location)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_basic_operations(self):
+        self.cache.set('key', {'a': 1})
+        self.assertEqual(self.cache.get('key'), {'a': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 'value'))
+        self.cache.set_many({'x': 1, 'y': 2})
+        self.assertEqual(self.cache.get_many(['x', 'y', 'z']),
+                         {'x': 1, 'y': 2})
+        self.assertEqual(self.cache.incr('x', 10), 11)
+        self.cache.delete_many(['x', 'y'])
+        self.assertIsNone(self.cache.get('x'))
+        self.cache.clear()
+        self.assertFalse(self.cache.has_key('key'))
+
+    def test_expired_value_is_missing(self):
+        self.cache.set('key', 'value', 1)
+        with mock.patch('core.cache.time.time',
+                        return_value=time.time() + 2):
+            self.assertIsNone(self.cache.get('key'))
+            self.assertTrue(self.cache.add('key', 'new'))
+
+    def test_incr_is_atomic_between_processes(self):
+        self.cache.set('counter', 0)
+        context = multiprocessing.get_context('spawn')
+        processes = [context.Process(target=incr_many,
+                                     args=(self.location, 50))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(self.cache.get('counter'), 200)
+
+    def test_get_or_set_computes_once_between_processes(self):
+        context = multiprocessing.get_context('spawn')
+        counter = context.Value('i', 0)
+        barrier = context.Barrier(4)
+        processes = [context.Process(target=compute_once,
+                                     args=(self.location, counter, barrier))
+                     for _ in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        self.assertEqual(counter.value, 1)
+        self.assertEqual(self.cache.get('fragment'), 'value')
+
+    def test_get_or_set_computes_once_between_threads(self):
+        calls = []
+        results = []
+
+        def compute():
+            calls.append(1)
+            time.sleep(0.1)
+            return 'value'
+
+        threads = [threading.Thread(target=lambda: results.append(
+            self.cache.get_or_set('fragment', compute)))
+            for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ['value'] * 5)
+
+    def test_get_or_set_recomputes_after_failure(self):
+        def fail():
+            raise RuntimeError
+
+        with self.assertRaises(RuntimeError):
+            self.cache.get_or_set('fragment', fail)
+        self.assertEqual(self.cache.get_or_set('fragment', 'value'), 'value')
+
+    def test_cull_keeps_max_entries(self):
+        cache = make_cache(self.location, MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        cache.set_many({f'key{number}': number for number in range(100)})
+        with mock.patch('core.cache.CULL_EVERY', 1):
+            cache.set('last', 'value')
+        self.assertLessEqual(
+            len(cache.get_many([f'key{number}' for number in range(100)])),
+            50)
+
+
+class StaleWhileRevalidateTests(SimpleTestCase):
+    def setUp(self):
+        self.cache = LocMemCache('stale', {})
+        self.cache.clear()
+        self.values = iter(['first', 'second', 'third'])
+        self.calls = 0
+
+    def tearDown(self):
+        revalidator.wait()
+
+    def compute(self):
+        self.calls += 1
+        return next(self.values)
+
+    def get(self):
+        return get_or_set_stale(self.cache, 'key', self.compute, 0, 60)
+
+    def test_stale_value_is_served_while_revalidating(self):
+        self.assertEqual(self.get(), 'first')
+        self.assertEqual(self.get(), 'first')
+        revalidator.wait()
+        self.assertEqual(self.calls, 2)
+        self.assertEqual(self.get(), 'second')
+
+    def test_one_revalidation_at_a_time(self):
+        self.get()
+        self.cache.add('key:revalidate', 1)
+        self.assertEqual(self.get(), 'first')
+        revalidator.wait()
+        self.assertEqual(self.calls, 1)
+
+    def test_failed_revalidation_keeps_stale_value(self):
+        self.get()
+        with mock.patch.object(self, 'compute', side_effect=RuntimeError):
+            with self.assertLogs('core.cache', 'ERROR'):
+                self.get()
+                revalidator.wait()
+        self.assertEqual(self.get(), 'first')
+        revalidator.wait()
+        self.assertFalse(self.cache.has_key('key:revalidate'))
+
+    def test_fresh_value_is_not_revalidated(self):
+        get_or_set_stale(self.cache, 'key', self.compute, 60, 60)
+        get_or_set_stale(self.cache, 'key', self.compute, 60, 60)
+        revalidator.wait()
+        self.assertEqual(self.calls, 1)
+
+
+class FragmentCacheTagTests(SimpleTestCase):
+    def test_fragment_is_rendered_once(self):
+        template = Template(
+            '{% load fragment_cache %}'
+            '{% fragment_cache 20 test_fragment key %}{{ value }}'
+            '{% endfragment_cache %}'
+        )
+        self.assertEqual(template.render(Context({'key': 1, 'value': 'a'})),
+                         'a')
+        self.assertEqual(template.render(Context({'key': 1, 'value': 'b'})),
+                         'a')
+        self.assertEqual(template.render(Context({'key': 2, 'value': 'b'})),
+                         'b')
+
+    def test_stale_fragment_is_rendered_in_background(self):
+        template = Template(
+            '{% load fragment_cache %}'
+            '{% fragment_cache 0 test_stale_fragment stale=60 %}{{ value }}'
+            '{% endfragment_cache %}'
+        )
+        self.assertEqual(template.render(Context({'value': 'a'})), 'a')
+        self.assertEqual(template.render(Context({'value': 'b'})), 'a')
+        revalidator.wait()
+        self.assertEqual(template.render(Context({'value': 'c'})), 'b')
@@ -0,0 +1,56 @@
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import TestCase
+
+from core.instrumentation import collect, current
+from posts.models import Group
+
+
+class CollectTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_counts_queries(self):
+        with collect() as stats:
+            list(Group.objects.all())
+            Group.objects.count()
+        self.assertEqual(stats.queries, 2)
+        self.assertGreater(stats.query_time, 0)
+        with self.assertNumQueries(1):
+            list(Group.objects.all())
+        self.assertEqual(stats.queries, 2)
+
+    def test_counts_cache_operations(self):
+        with collect() as stats:
+            cache.get('missing')
+            cache.set('key', 'value')
+            cache.get('key')
+            cache.get_many(['key', 'other'])
+        self.assertEqual(stats.cache_hits, 2)
+        self.assertEqual(stats.cache_misses, 2)
+        self.assertEqual(stats.cache_writes, 1)
+
+    def test_cache_default_is_kept(self):
+        with collect():
+            self.assertEqual(cache.get('missing', 'default'), 'default')
+            cache.set('none', None)
+            self.assertIsNone(cache.get('none', 'default'))
+
+    def test_counts_template_render(self):
+        inner = Template('{{ value }}')
+        outer = Template('{% include inner %}')
+        with collect() as stats:
+            outer.render(Context({'inner': inner, 'value': 1}))
+        self.assertGreater(stats.template_time, 0)
+
+    def test_nested_collect_adds_to_outer(self):
+        with collect() as outer:
+            Group.objects.count()
+            with collect() as inner:
+                Group.objects.count()
+                cache.get('missing')
+            self.assertIs(current(), outer)
+        self.assertEqual(inner.queries, 1)
+        self.assertEqual(outer.queries, 2)
+        self.assertEqual(outer.cache_misses, 1)
+        self.assertIsNone(current())
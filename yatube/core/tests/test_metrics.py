@@ -0,0 +1,107 @@
+from http import HTTPStatus
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.instrumentation import Stats
+from core.metrics import Registry, registry, render
+from posts.models import User
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='user')
+        cls.staff = User.objects.create_user(username='staff',
+                                             is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        registry.clear()
+        self.client = Client()
+        self.staff_client = Client()
+        self.staff_client.force_login(MetricsTests.staff)
+
+    def scrape(self):
+        response = self.staff_client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        return response.content.decode()
+
+    def test_requests_are_recorded_by_view(self):
+        self.client.get(reverse('posts:index'))
+        self.client.get(reverse('posts:index'))
+        self.client.get('/missing/')
+        text = self.scrape()
+        self.assertIn(
+            'yatube_requests_total{view="posts:index",status="200"} 2',
+            text)
+        self.assertIn(
+            'yatube_requests_total{view="unresolved",status="404"} 1',
+            text)
+        self.assertIn('yatube_request_duration_seconds_count'
+                      '{view="posts:index"} 2', text)
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram',
+                      text)
+
+    def test_endpoint_is_staff_only(self):
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+        self.client.force_login(MetricsTests.user)
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_bearer_token(self):
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer wrong')
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    @override_settings(METRICS_ALLOWED_IPS=['10.0.0.0/8'])
+    def test_allowed_network(self):
+        response = self.client.get(reverse('metrics'),
+                                   REMOTE_ADDR='10.1.2.3')
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        response = self.client.get(reverse('metrics'),
+                                   REMOTE_ADDR='192.168.0.1')
+        self.assertEqual(response.status_code, HTTPStatus.FOUND)
+
+    @override_settings(METRICS_ENABLED=False)
+    def test_disabled(self):
+        self.client.get(reverse('posts:index'))
+        self.assertEqual(registry.snapshot(), {})
+
+
+class RenderTests(TestCase):
+    def test_histogram_is_cumulative(self):
+        metrics = Registry()
+        stats = Stats()
+        stats.queries = 3
+        metrics.observe('posts:index', 200, 0.003, stats, 100)
+        metrics.observe('posts:index', 200, 0.02, stats, 50)
+        metrics.observe('posts:index', 500, 20, stats, 0)
+        text = render(metrics.snapshot())
+        for line in (
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="0.005"} 1',
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="0.025"} 2',
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="10"} 2',
+            'yatube_request_duration_seconds_bucket'
+            '{view="posts:index",le="+Inf"} 3',
+            'yatube_db_queries_total{view="posts:index"} 9',
+            'yatube_response_bytes_total{view="posts:index"} 150',
+            'yatube_requests_total{view="posts:index",status="500"} 1',
+        ):
+            self.assertIn(line, text)
+
+    def test_labels_are_escaped(self):
+        metrics = Registry()
+        metrics.observe('a"b\\c', 200, 0.1, Stats(), 0)
+        self.assertIn('view="a\\"b\\\\c"', render(metrics.snapshot()))
@@ -0,0 +1,120 @@
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.profiling import RESPONSE_HEADER, StackSampler
+from posts.models import User
+
+TEMP_PROFILER_DIR = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def busy_loop(seconds):
+    finish = time.perf_counter() + seconds
+    while time.perf_counter() < finish:
+        pass
+
+
+class StackSamplerTests(TestCase):
+    def test_collapsed_stacks(self):
+        with StackSampler(threading.get_ident(), 0.001) as sampler:
+            busy_loop(0.1)
+        lines = sampler.collapsed().splitlines()
+        self.assertTrue(lines)
+        for line in lines:
+            self.assertRegex(line, r'^\S.* \d+$')
+        self.assertTrue(any(
+            re.search(r';busy_loop \(\S*test_profiling.py:\d+\) \d+$', line)
+            for line in lines
+        ))
+
+
+@override_settings(PROFILER_DIR=TEMP_PROFILER_DIR)
+class ProfilerMiddlewareTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='user')
+        cls.staff = User.objects.create_user(username='staff',
+                                             is_staff=True)
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_PROFILER_DIR, ignore_errors=True)
+
+    def setUp(self):
+        cache.clear()
+        shutil.rmtree(TEMP_PROFILER_DIR, ignore_errors=True)
+        self.client = Client()
+
+    def profiles(self):
+        if not os.path.isdir(TEMP_PROFILER_DIR):
+            return []
+        return os.listdir(TEMP_PROFILER_DIR)
+
+    def test_staff_requests_profile(self):
+        self.client.force_login(ProfilerMiddlewareTests.staff)
+        response = self.client.get(reverse('posts:index'), {'profile': ''})
+        name = response[RESPONSE_HEADER]
+        self.assertIn('posts_index', name)
+        self.assertEqual(self.profiles(), [name])
+        response = self.client.get(reverse('posts:index'),
+                                   HTTP_X_PROFILE='1')
+        self.assertIn(RESPONSE_HEADER, response)
+
+    def test_profile_is_staff_only(self):
+        self.client.force_login(ProfilerMiddlewareTests.user)
+        response = self.client.get(reverse('posts:index'), {'profile': ''})
+        self.assertNotIn(RESPONSE_HEADER, response)
+        self.assertEqual(self.profiles(), [])
+
+    @override_settings(PROFILER_SAMPLE_RATE=3)
+    def test_every_nth_request_is_sampled(self):
+        for _ in range(6):
+            response = self.client.get(reverse('posts:index'))
+            self.assertNotIn(RESPONSE_HEADER, response)
+        self.assertEqual(len(self.profiles()), 2)
+
+    @override_settings(PROFILER_SAMPLE_RATE=1, PROFILER_KEEP_FILES=2)
+    def test_only_newest_profiles_are_kept(self):
+        os.makedirs(TEMP_PROFILER_DIR)
+        old = os.path.join(TEMP_PROFILER_DIR, '19700101T000000-old.folded')
+        open(old, 'w').close()
+        for _ in range(3):
+            self.client.get(reverse('posts:index'))
+        profiles = self.profiles()
+        self.assertEqual(len(profiles), 2)
+        self.assertNotIn(os.path.basename(old), profiles)
+
+    @override_settings(PROFILER_SAMPLE_RATE=1)
+    def test_sampled_request_keeps_switch_interval(self):
+        """Сэмплирование по PROFILER_SAMPLE_RATE не трогает процесс."""
+        with mock.patch.object(sys, 'setswitchinterval') as setter:
+            self.client.get(reverse('posts:index'))
+        setter.assert_not_called()
+        self.client.force_login(ProfilerMiddlewareTests.staff)
+        with mock.patch.object(sys, 'setswitchinterval') as setter:
+            self.client.get(reverse('posts:index'), {'profile': ''})
+        self.assertEqual(setter.call_count, 2)
+
+    def test_failed_save_keeps_response(self):
+        self.client.force_login(ProfilerMiddlewareTests.staff)
+        path = os.path.join(TEMP_PROFILER_DIR, 'file')
+        os.makedirs(TEMP_PROFILER_DIR)
+        open(path, 'w').close()
+        with override_settings(PROFILER_DIR=path), \
+                self.assertLogs('core.profiling', 'ERROR'):
+            response = self.client.get(reverse('posts:index'),
+                                       {'profile': ''})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn(RESPONSE_HEADER, response)
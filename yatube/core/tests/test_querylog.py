@@ -0,0 +1,103 @@
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from core.querylog import (DuplicateQueriesError, _command_label, _watch,
+                           ignored, install, normalize, watch)
+from posts.models import Follow, Post, User
+
+
+class NormalizeTests(TestCase):
+    def test_values_are_replaced(self):
+        self.assertEqual(
+            normalize('SELECT  "a"."id" FROM "a"\n'
+                      "WHERE \"a\".\"id\" IN (%s, %s, %s) AND x = 'it''s' "
+                      'LIMIT 21'),
+            'SELECT "a"."id" FROM "a" WHERE "a"."id" IN (...) AND x = ? '
+            'LIMIT ?',
+        )
+        self.assertEqual(normalize('SELECT * FROM "t" WHERE "t"."id" IN (%s)'),
+                         normalize('SELECT * FROM "t" WHERE "t"."id" IN '
+                                   '(%s, %s)'))
+        self.assertEqual(normalize('SELECT "U0"."id" FROM "T3"'),
+                         'SELECT "U0"."id" FROM "T3"')
+
+    def test_normalize_is_cached(self):
+        normalize.cache_clear()
+        normalize('SELECT * FROM "t" WHERE "t"."id" = %s')
+        normalize('SELECT * FROM "t" WHERE "t"."id" = %s')
+        self.assertEqual(normalize.cache_info().hits, 1)
+
+    def test_install_puts_wrapper_first_once(self):
+        def other(execute, sql, params, many, context):
+            return execute(sql, params, many, context)
+        connection = SimpleNamespace(execute_wrappers=[other])
+        install(None, connection)
+        install(None, connection)
+        self.assertEqual(connection.execute_wrappers, [_watch, other])
+
+
+class QueryLogTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='user')
+        cls.author = User.objects.create_user(username='author')
+        Post.objects.create(author=cls.author, text='Текст')
+        Follow.objects.create(user=cls.user, author=cls.author)
+
+    def setUp(self):
+        cache.clear()
+        self.client = Client()
+        self.client.force_login(QueryLogTests.user)
+        self.profile = reverse('posts:profile', args=('author',))
+
+    @override_settings(SLOW_QUERY_SECONDS=0)
+    def test_slow_query_is_logged_with_view_and_plan(self):
+        with self.assertLogs('core.querylog', 'WARNING') as logs:
+            self.client.get(reverse('posts:index'))
+        messages = [record.getMessage() for record in logs.records]
+        self.assertTrue(any(
+            'in posts:index: SELECT' in message
+            and ('SCAN' in message or 'SEARCH' in message)
+            for message in messages
+        ))
+        self.assertEqual(logs.records[0].view, 'posts:index')
+
+    @override_settings(SLOW_QUERY_SECONDS=0)
+    def test_slow_query_outside_request(self):
+        with self.assertLogs('core.querylog', 'WARNING') as logs:
+            Post.objects.count()
+        self.assertIn(f'in {_command_label()}: SELECT COUNT(*)',
+                      logs.records[0].getMessage())
+
+    @override_settings(QUERY_DUPLICATE_STRICT=False,
+                       QUERY_DUPLICATE_BUDGETS={'posts:profile': 1})
+    def test_duplicates_are_logged(self):
+        with self.assertLogs('core.querylog', 'WARNING') as logs:
+            response = self.client.get(self.profile)
+        self.assertEqual(response.status_code, 200)
+        message = logs.records[0].getMessage()
+        self.assertIn('Duplicate queries in posts:profile:', message)
+        self.assertIn('2x SELECT (?) AS "a" FROM "posts_follow"', message)
+
+    @override_settings(QUERY_DUPLICATE_STRICT=True,
+                       QUERY_DUPLICATE_BUDGETS={'posts:profile': 1})
+    def test_strict_mode_fails_request(self):
+        with self.assertRaises(DuplicateQueriesError):
+            self.client.get(self.profile)
+
+    def test_ignored_queries_are_not_counted(self):
+        with watch(None) as scope:
+            Post.objects.count()
+            with ignored():
+                Post.objects.count()
+                Post.objects.exists()
+        self.assertEqual(sum(scope.statements.values()), 1)
+
+    @override_settings(QUERY_DUPLICATE_STRICT=True)
+    def test_default_budget(self):
+        response = self.client.get(self.profile)
+        self.assertEqual(response.status_code, 200)
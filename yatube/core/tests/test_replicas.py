@@ -0,0 +1,122 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.sessions.models import Session
+from django.db import DEFAULT_DB_ALIAS
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.test import RequestFactory, SimpleTestCase, override_settings
+
+from core import pagecache
+from core.replicas import (PIN_COOKIE, ReplicaPinMiddleware, ReplicaRouter,
+                           copy_database, read_from_replica, replica_reads)
+from posts.models import Post, User
+
+router = ReplicaRouter()
+
+
+@read_from_replica
+def routed_view(request):
+    return HttpResponse(router.db_for_read(Post) or DEFAULT_DB_ALIAS)
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTests(SimpleTestCase):
+    def request(self, **cookies):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies)
+        request.user = AnonymousUser()
+        return request
+
+    def test_reads_inside_replica_block(self):
+        self.assertIsNone(router.db_for_read(Post))
+        with replica_reads('replica'):
+            self.assertEqual(router.db_for_read(Post), 'replica')
+            self.assertEqual(router.db_for_write(Post), DEFAULT_DB_ALIAS)
+        self.assertIsNone(router.db_for_read(Post))
+
+    def test_view_reads_from_replica(self):
+        self.assertEqual(routed_view(self.request()).content, b'replica')
+
+    def test_pinned_user_reads_primary(self):
+        response = routed_view(self.request(**{PIN_COOKIE: '1'}))
+        self.assertEqual(response.content, DEFAULT_DB_ALIAS.encode())
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas(self):
+        response = routed_view(self.request())
+        self.assertEqual(response.content, DEFAULT_DB_ALIAS.encode())
+
+    def test_write_pins_user(self):
+        def write(request):
+            router.db_for_write(Post)
+            return HttpResponse()
+
+        response = ReplicaPinMiddleware(write)(self.request())
+        self.assertIn(PIN_COOKIE, response.cookies)
+        response = ReplicaPinMiddleware(
+            lambda request: HttpResponse())(self.request())
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_login_does_not_pin_user(self):
+        """last_login и сессия не закрепляют основную базу."""
+        def login(request):
+            router.db_for_write(User)
+            router.db_for_write(Session)
+            return HttpResponse()
+
+        response = ReplicaPinMiddleware(login)(self.request())
+        self.assertNotIn(PIN_COOKIE, response.cookies)
+
+    def test_replica_read_does_not_fill_caches(self):
+        """С реплики кеш страниц и фрагментов только читается."""
+        template = Template(
+            '{% load fragment_cache %}'
+            '{% fragment_cache 20 replica_fragment %}{{ value }}'
+            '{% endfragment_cache %}'
+            '{% fragment_cache 20 replica_stale stale=60 %}{{ value }}'
+            '{% endfragment_cache %}'
+        )
+        request = self.request()
+        with replica_reads('replica'):
+            pagecache.tag(request, 'index')
+            self.assertEqual(template.render(Context({'value': 'a'})), 'aa')
+            self.assertEqual(template.render(Context({'value': 'b'})), 'bb')
+        self.assertFalse(hasattr(request, 'page_cache_tags'))
+        self.assertEqual(template.render(Context({'value': 'c'})), 'cc')
+        with replica_reads('replica'):
+            self.assertEqual(template.render(Context({'value': 'd'})), 'cc')
+
+    def test_no_migrations_on_replica(self):
+        self.assertFalse(router.allow_migrate('replica', 'posts'))
+        self.assertIsNone(router.allow_migrate(DEFAULT_DB_ALIAS, 'posts'))
+
+
+class CopyDatabaseTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_copy_replaces_replica(self):
+        source = os.path.join(self.directory, 'primary.sqlite3')
+        target = os.path.join(self.directory, 'replica.sqlite3')
+        with sqlite3.connect(target) as db:
+            db.execute('CREATE TABLE old (id INTEGER)')
+        with sqlite3.connect(source) as db:
+            db.execute('CREATE TABLE posts (text TEXT)')
+            db.execute("INSERT INTO posts VALUES ('запись')")
+        copy_database(source, target)
+        db = sqlite3.connect(target)
+        try:
+            self.assertEqual(db.execute('SELECT text FROM posts').fetchall(),
+                             [('запись',)])
+            self.assertEqual(db.execute(
+                "SELECT count(*) FROM sqlite_master WHERE name = 'old'"
+            ).fetchone(), (0,))
+        finally:
+            db.close()
@@ -0,0 +1,39 @@
+import os
+import subprocess
+import sys
+
+from django.conf import settings
+from django.test import SimpleTestCase
+
+
+class EnvironmentTests(SimpleTestCase):
+    def load_settings(self, environment, code='import yatube.settings'):
+        return subprocess.run(
+            [sys.executable, '-c', code],
+            cwd=settings.BASE_DIR,
+            env=dict(os.environ, YATUBE_ENV=environment),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+
+    def test_unknown_environment_is_rejected(self):
+        result = self.load_settings('prod')
+        self.assertNotEqual(result.returncode, 0)
+        self.assertIn(b'ImproperlyConfigured', result.stderr)
+
+    def test_known_environment(self):
+        self.assertEqual(self.load_settings('development').returncode, 0)
+
+    def test_duplicate_queries_strict_under_pytest(self):
+        """pytest-django получает строгий режим из настроек."""
+        code = ('import {}yatube.settings; '
+                'print(yatube.settings.QUERY_DUPLICATE_STRICT)')
+        for environment, imports, strict in (
+            ('development', 'pytest, ', b'True'),
+            ('production', 'pytest, ', b'False'),
+            ('development', '', b'False'),
+        ):
+            with self.subTest(environment=environment, imports=imports):
+                result = self.load_settings(environment,
+                                            code.format(imports))
+                self.assertEqual(result.stdout.strip(), strict)
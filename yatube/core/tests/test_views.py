@@ -1,6 +1,11 @@
 from http import HTTPStatus
 
-from django.test import TestCase
+from django.db import connection
+from django.http import Http404
+from django.test import RequestFactory, TestCase, override_settings
+
+from core.db import apply_sqlite_pragmas
+from core.views import media
 
 
 class ViewTestClass(TestCase):
@@ -8,3 +13,28 @@ class ViewTestClass(TestCase):
         response = self.client.get('/nonexist-page/')
         self.assertEqual(response.status_code, HTTPStatus.NOT_FOUND)
         self.assertTemplateUsed(response, 'core/404.html')
+
+
+@override_settings(MEDIA_ACCEL_REDIRECT='/protected-media/')
+class MediaViewTests(TestCase):
+    def test_media_is_sent_by_web_server(self):
+        request = RequestFactory().get('/media/posts/image.jpg')
+        response = media(request, 'posts/image.jpg')
+        self.assertEqual(response['X-Accel-Redirect'],
+                         '/protected-media/posts/image.jpg')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response.content, b'')
+
+    def test_path_outside_media_root(self):
+        request = RequestFactory().get('/media/')
+        with self.assertRaises(Http404):
+            media(request, 'posts/../../db.sqlite3')
+
+
+class SQLitePragmasTests(TestCase):
+    @override_settings(SQLITE_PRAGMAS={'cache_size': -1234})
+    def test_pragmas_are_applied(self):
+        apply_sqlite_pragmas(sender=None, connection=connection)
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA cache_size')
+            self.assertEqual(cursor.fetchone()[0], -1234)
@@ -0,0 +1,49 @@
+"""
+Версии для сброса кеша без перебора ключей.
+
+Запись кеша хранит версии своих областей (тегов), а сброс области
+увеличивает её версию: запись с устаревшей версией считается промахом.
+Так сбрасываются ленты (posts.cache) и целые страницы (core.pagecache).
+
+Версия - счётчик, который bump увеличивает атомарно (cache.incr).
+Новый счётчик начинается с текущего времени в миллисекундах, чтобы не
+совпасть со старыми значениями после вытеснения из кеша.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def now():
+    """Текущее время в миллисекундах - начальное значение версии."""
+    return int(time.time() * 1000)
+
+
+def get_or_add(keys):
+    """
+    Значения ключей {ключ: значение}; недостающие добавляются текущим
+    временем. add не перетирает значение, записанное другим процессом
+    между get_many и add.
+    """
+    values = cache.get_many(keys)
+    missing = [key for key in keys if key not in values]
+    if missing:
+        started = now()
+        for key in missing:
+            cache.add(key, started, None)
+        values.update(cache.get_many(missing))
+        for key in missing:
+            values.setdefault(key, started)
+    return values
+
+
+def bump(keys):
+    """Атомарно увеличивает версии ключей."""
+    for key in set(keys):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Ключа нет: начинаем с текущего времени. Если его успел
+            # добавить другой процесс, увеличиваем его версию.
+            if not cache.add(key, now(), None):
+                cache.incr(key)
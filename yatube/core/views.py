@@ -1,6 +1,15 @@
+import ipaddress
+import mimetypes
+import posixpath
 from http import HTTPStatus
 
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.http import Http404, HttpResponse
 from django.shortcuts import render
+from django.utils.crypto import constant_time_compare
+
+from . import metrics as request_metrics
 
 
 def page_not_found(request, exception):
@@ -19,3 +28,54 @@ def server_error(request):
 
 def permission_denied(request, exception):
     return render(request, 'core/403.html', status=HTTPStatus.FORBIDDEN)
+
+
+def media(request, path):
+    """
+    Медиафайл в production: файл отдаёт веб-сервер по внутреннему
+    адресу из MEDIA_ACCEL_REDIRECT, процесс Django его не читает.
+    """
+    path = posixpath.normpath(path).lstrip('/')
+    if path.startswith('..'):
+        raise Http404
+    response = HttpResponse(
+        content_type=mimetypes.guess_type(path)[0]
+        or 'application/octet-stream'
+    )
+    response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT + path
+    return response
+
+
+def _has_metrics_token(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    header = request.META.get('HTTP_AUTHORIZATION', '')
+    return bool(token) and constant_time_compare(header, f'Bearer {token}')
+
+
+def _from_metrics_network(request):
+    try:
+        address = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    return any(address in ipaddress.ip_network(network, strict=False)
+               for network in getattr(settings, 'METRICS_ALLOWED_IPS', ()))
+
+
+def _render_metrics(request):
+    return HttpResponse(request_metrics.render(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
+
+
+_staff_metrics = staff_member_required(_render_metrics)
+
+
+def metrics(request):
+    """
+    Метрики запросов этого процесса для Prometheus. Доступны staff,
+    запросу с заголовком Authorization: Bearer <METRICS_TOKEN> и
+    адресам из METRICS_ALLOWED_IPS; остальных отправляет на вход.
+    """
+    if _has_metrics_token(request) or _from_metrics_network(request):
+        return _render_metrics(request)
+    return _staff_metrics(request)
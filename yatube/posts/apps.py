@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = 'posts'
+
+    def ready(self):
+        from core.metrics import register_collector
+
+        from . import signals  # noqa: F401
+        from .thumbnails import cache_metrics
+        register_collector(cache_metrics)
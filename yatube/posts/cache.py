@@ -0,0 +1,111 @@
+"""
+Версионированные ключи кеша лент.
+
+Каждая лента описывается набором областей (scope): `index`,
+`group:<id>`, `author:<id>`, `follower:<id>` (подписки одного
+читателя; лента подписок зависит и от областей его авторов,
+posts.timeline.follow_scopes). Ключ фрагмента
+включает текущие версии своих областей, поэтому для сброса ленты
+достаточно увеличить версию области - O(1) вне зависимости от числа
+закешированных страниц. Устаревшие записи вытесняются по TTL.
+
+Версии ведёт core.versions. Время последнего изменения области для
+Last-Modified хранится отдельно под MODIFIED_KEY.
+
+Области сбрасываются сигналами моделей (posts.signals), поэтому правки
+из админки и ORM видны в лентах так же, как правки через формы.
+"""
+import datetime
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core import versions as cache_versions
+from core.cache import get_or_set_stale
+
+from .paginators import estimate_count
+
+ALL_FEEDS = 'feeds'
+# Область только для валидаторов условных запросов (posts.conditional).
+DELETED_POSTS = 'deleted-posts'
+VERSION_KEY = 'feed-version:{}'
+MODIFIED_KEY = 'feed-modified:{}'
+COUNT_KEY = 'feed-count:{}'
+
+
+def get_versions(*scopes):
+    """Возвращает версии областей в порядке их перечисления."""
+    keys = [VERSION_KEY.format(scope) for scope in (ALL_FEEDS,) + scopes]
+    versions = cache_versions.get_or_add(keys)
+    return [versions[key] for key in keys]
+
+
+def get_state(*scopes):
+    """
+    Версии областей (как get_versions) и время их последнего изменения
+    одним обращением к кешу.
+    """
+    scopes = (ALL_FEEDS,) + scopes
+    version_keys = [VERSION_KEY.format(scope) for scope in scopes]
+    modified_keys = [MODIFIED_KEY.format(scope) for scope in scopes]
+    values = cache_versions.get_or_add(version_keys + modified_keys)
+    modified = max(values[key] for key in modified_keys)
+    return ([values[key] for key in version_keys],
+            datetime.datetime.fromtimestamp(modified / 1000,
+                                            tz=datetime.timezone.utc))
+
+
+def invalidate(*scopes):
+    """Сбрасывает все закешированные страницы указанных областей."""
+    cache_versions.bump(VERSION_KEY.format(scope) for scope in scopes)
+    now = cache_versions.now()
+    cache.set_many({MODIFIED_KEY.format(scope): now for scope in scopes},
+                   None)
+
+
+def feed_cache_key(request, *scopes):
+    """
+    Ключ фрагмента ленты: версии областей и позиция страницы
+    (курсор или номер).
+    """
+    position = (request.GET.get('cursor')
+                or request.GET.get('page')
+                or '1')
+    versions = get_versions(*scopes)
+    return ':'.join(
+        [*scopes, *(str(version) for version in versions), position]
+    )
+
+
+def cached_count(queryset, *scopes):
+    """
+    Число записей ленты для паджинатора. Хранится PAGINATOR_COUNT_TTL
+    секунд, ещё PAGINATOR_COUNT_GRACE секунд отдаётся устаревшим, пока
+    пересчитывается в фоне, и сбрасывается вместе с версиями областей
+    (в том числе при удалении записей). Для огромных таблиц без
+    фильтров берётся оценка из статистики SQLite.
+    """
+    versions = get_versions(*scopes, DELETED_POSTS)
+    # У ленты подписок по области на автора: ключ сжимаем.
+    key = COUNT_KEY.format(hashlib.md5(':'.join(
+        [*scopes, *(str(version) for version in versions)]
+    ).encode()).hexdigest())
+
+    def count():
+        estimate = estimate_count(queryset)
+        return queryset.count() if estimate is None else estimate
+
+    return get_or_set_stale(
+        cache, key, count,
+        getattr(settings, 'PAGINATOR_COUNT_TTL', 300),
+        getattr(settings, 'PAGINATOR_COUNT_GRACE', 600),
+    )
+
+
+def post_scopes(post):
+    """Области лент, в которых показывается запись."""
+    scopes = ['index', f'author:{post.author_id}']
+    if post.group_id:
+        scopes.append(f'group:{post.group_id}')
+    return scopes
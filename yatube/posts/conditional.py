@@ -0,0 +1,123 @@
+"""
+Валидаторы условных GET-запросов для лент и страницы записи.
+
+Функции вызываются декоратором django.views.decorators.http.condition
+до выборки страницы и рендеринга шаблона. Ленты описываются версиями
+областей кеша (posts.cache) и временем последней записи по индексу
+(..., -pub_date, -id); запись - полем Post.updated, которое меняется
+и при изменении комментариев, версиями областей её автора и группы и
+показанными на странице полями автора и группы. В ETag входит
+пользователь: шапка и кнопки на странице зависят от него.
+"""
+import hashlib
+from functools import wraps
+
+from django.views.decorators.http import condition
+from django.views.decorators.vary import vary_on_cookie
+
+from . import cache as feed_cache
+from .models import Follow, Group, Post, TimelineEntry, User
+from .timeline import follow_scopes
+
+
+def make_etag(request, *parts):
+    position = request.GET.get('cursor') or request.GET.get('page') or '1'
+    parts = (request.user.pk, position) + parts
+    return hashlib.md5(
+        ':'.join(str(part) for part in parts).encode()
+    ).hexdigest()
+
+
+def _newest(entries):
+    return (entries.order_by('-pub_date')
+            .values_list('pub_date', flat=True).first())
+
+
+def _feed_validators(request, scopes, entries, *parts):
+    versions, last_modified = feed_cache.get_state(
+        *scopes, feed_cache.DELETED_POSTS)
+    newest = _newest(entries)
+    if newest is not None:
+        last_modified = max(last_modified, newest)
+    return make_etag(request, *versions, newest, *parts), last_modified
+
+
+def index_validators(request):
+    return _feed_validators(request, ('index',), Post.objects.all())
+
+
+def group_validators(request, slug):
+    group = (Group.objects.filter(slug=slug)
+             .values_list('pk', 'title', 'description', 'posts_count')
+             .first())
+    if group is None:
+        return None, None
+    return _feed_validators(request, (f'group:{group[0]}',),
+                            Post.objects.filter(group_id=group[0]), *group)
+
+
+def profile_validators(request, username):
+    # Счётчики и кнопка подписки на странице автора меняются без
+    # новых записей.
+    author = (User.objects.filter(username=username)
+              .values_list('pk', 'counters__posts_count',
+                           'counters__followers_count').first())
+    if author is None:
+        return None, None
+    following = (request.user.is_authenticated
+                 and Follow.objects.filter(user=request.user,
+                                           author_id=author[0]).exists())
+    return _feed_validators(request, (f'author:{author[0]}',),
+                            Post.objects.filter(author_id=author[0]),
+                            *author, following)
+
+
+def follow_validators(request):
+    return _feed_validators(request, follow_scopes(request),
+                            TimelineEntry.objects.filter(user=request.user))
+
+
+def post_validators(request, post_id):
+    # Имя и счётчик записей автора, группа и готовность миниатюры
+    # меняются без Post.updated.
+    post = (Post.objects.filter(pk=post_id)
+            .values_list('updated', 'author_id', 'group_id',
+                         'image_variants', 'author__username',
+                         'author__first_name', 'author__last_name',
+                         'author__counters__posts_count', 'group__title',
+                         'group__slug').first())
+    if post is None:
+        return None, None
+    updated, author_id, group_id, *shown = post
+    scopes = [f'author:{author_id}']
+    if group_id:
+        scopes.append(f'group:{group_id}')
+    versions, last_modified = feed_cache.get_state(*scopes)
+    return (make_etag(request, updated, *versions, *shown),
+            max(updated, last_modified))
+
+
+def conditional(validators):
+    """
+    Декоратор представления: ETag и Last-Modified из функции
+    validators(request, *args, **kwargs) -> (etag, last_modified).
+    Валидаторы считаются один раз на запрос; ответ 304 возвращается
+    без вызова представления.
+    """
+    def decorator(view):
+        def get(request, *args, **kwargs):
+            if not hasattr(request, '_validators'):
+                request._validators = validators(request, *args, **kwargs)
+            return request._validators
+
+        @wraps(view)
+        @vary_on_cookie
+        @condition(
+            etag_func=lambda *args, **kwargs: get(*args, **kwargs)[0],
+            last_modified_func=lambda *args, **kwargs: get(
+                *args, **kwargs)[1],
+        )
+        def wrapper(request, *args, **kwargs):
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
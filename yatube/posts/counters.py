@@ -0,0 +1,100 @@
+"""
+Денормализованные счётчики записей, комментариев, подписок и длины
+ленты подписок (posts.timeline).
+
+Счётчики меняются атомарно выражениями F() в сигналах posts.signals.
+Если строки счётчиков пользователя ещё нет, при увеличении она
+создаётся пересчётом по базе, а уменьшение пропускается: счётчик
+не уходит в минус из-за пропущенных событий и не создаётся заново
+для удаляемого пользователя.
+"""
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+USER_COUNTERS = {
+    # поле счётчика: (модель, поле, ссылающееся на пользователя)
+    'posts_count': ('Post', 'author'),
+    'comments_count': ('Comment', 'author'),
+    'followers_count': ('Follow', 'author'),
+    'following_count': ('Follow', 'user'),
+    'timeline_count': ('TimelineEntry', 'user'),
+}
+
+
+def _count_subquery(model, field):
+    counted = (model.objects.order_by()
+               .filter(**{field: OuterRef('pk')})
+               .values(field)
+               .annotate(total=Count('pk'))
+               .values('total'))
+    return Coalesce(Subquery(counted, output_field=IntegerField()), 0)
+
+
+def change_user_counter(user_id, field, delta, apps=global_apps):
+    """Атомарно изменяет счётчик пользователя на delta."""
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    updated = UserCounters.objects.filter(user_id=user_id).update(
+        **{field: F(field) + delta}
+    )
+    if not updated and delta > 0:
+        rebuild_user_counters(user_id, apps=apps)
+
+
+def change_group_counter(group_id, delta, apps=global_apps):
+    Group = apps.get_model('posts', 'Group')
+    Group.objects.filter(pk=group_id).update(
+        posts_count=F('posts_count') + delta
+    )
+
+
+def rebuild_user_counters(user_id, apps=global_apps):
+    """Пересчитывает счётчики одного пользователя по базе."""
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    values = {}
+    for field, (model_name, user_field) in USER_COUNTERS.items():
+        model = apps.get_model('posts', model_name)
+        values[field] = model.objects.filter(**{user_field: user_id}).count()
+    UserCounters.objects.update_or_create(user_id=user_id, defaults=values)
+
+
+def recount_users(field, users, apps=global_apps):
+    """
+    Пересчитывает по базе один счётчик пользователей users (список id
+    или подзапрос) одним запросом UPDATE.
+    """
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    model_name, user_field = USER_COUNTERS[field]
+    UserCounters.objects.filter(user_id__in=users).update(**{
+        field: _count_subquery(apps.get_model('posts', model_name),
+                               user_field)
+    })
+
+
+def rebuild_counters(apps=global_apps):
+    """
+    Пересчитывает все счётчики пользователей и групп.
+    Возвращает число обработанных пользователей и групп.
+    """
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    Group = apps.get_model('posts', 'Group')
+    Post = apps.get_model('posts', 'Post')
+
+    missing = User.objects.filter(counters__isnull=True).values_list(
+        'pk', flat=True)
+    UserCounters.objects.bulk_create(
+        (UserCounters(user_id=pk) for pk in missing.iterator()),
+        # SQLite не принимает больше 500 строк в одном INSERT.
+        batch_size=500,
+    )
+    users = UserCounters.objects.update(**{
+        field: _count_subquery(apps.get_model('posts', model_name),
+                               user_field)
+        for field, (model_name, user_field) in USER_COUNTERS.items()
+    })
+    groups = Group.objects.update(
+        posts_count=_count_subquery(Post, 'group')
+    )
+    return users, groups
@@ -1,5 +1,6 @@
 from django import forms
 
+from . import thumbnails
 from .models import Comment, Post
 
 
@@ -8,6 +9,12 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('text', 'group', 'image')
 
+    def save(self, commit=True):
+        post = super().save(commit=commit)
+        if commit and 'image' in self.changed_data:
+            thumbnails.schedule(post.image.name)
+        return post
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
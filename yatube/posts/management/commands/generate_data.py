@@ -0,0 +1,79 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.counters import rebuild_counters
+from posts.search import get_backend, rebuild_index
+from posts.synthetic import Generator, fast_writes
+from posts.views import clear_posts_cache
+
+
+class Command(BaseCommand):
+    help = 'Создаёт синтетические данные для нагрузочного тестирования'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000)
+        parser.add_argument('--groups', type=int, default=100)
+        parser.add_argument('--posts', type=int, default=1000000)
+        parser.add_argument(
+            '--follows-per-user', type=int, default=20,
+            help='Среднее число подписок пользователя'
+        )
+        parser.add_argument(
+            '--comments-per-post', type=float, default=1.0,
+            help='Среднее число комментариев записи'
+        )
+        parser.add_argument(
+            '--image-share', type=float, default=0.1,
+            help='Доля записей с картинкой'
+        )
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='За сколько дней публикуются записи'
+        )
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Сколько строк создавать в одной транзакции'
+        )
+
+    def step(self, title, func):
+        started = time.perf_counter()
+        func()
+        self.stdout.write(
+            f'{title}: {time.perf_counter() - started:.1f} с'
+        )
+
+    def handle(self, *args, **options):
+        generator = Generator(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            follows_per_user=options['follows_per_user'],
+            comments_per_post=options['comments_per_post'],
+            image_share=options['image_share'],
+            days=options['days'],
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+        )
+        with fast_writes():
+            self.step('Пользователи', generator.create_users)
+            self.step('Группы', generator.create_groups)
+            self.step('Подписки', generator.create_follows)
+            self.step('Картинки', generator.create_images)
+            self.step('Записи', generator.create_posts)
+            self.step('Комментарии', generator.create_comments)
+            # bulk_create не отправляет сигналы: производные данные
+            # строятся отдельно. Созданные пользователи подписаны только
+            # друг на друга, так что другие ленты не меняются.
+            self.step('Ленты подписок', generator.create_timelines)
+            self.step('Счётчики', rebuild_counters)
+            self.step('Поисковый индекс', self.rebuild_search_index)
+        clear_posts_cache()
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано записей: {len(generator.post_ids)}'
+        ))
+
+    def rebuild_search_index(self):
+        get_backend().install()
+        rebuild_index()
@@ -0,0 +1,55 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+from posts.models import Post
+
+
+class Command(BaseCommand):
+    help = ('Создаёт миниатюры и копии для srcset картинок существующих '
+            'записей параллельно')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help='Число рабочих процессов'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько картинок передавать пулу за раз'
+        )
+        parser.add_argument(
+            '--missing', action='store_true',
+            help='Только картинки, у которых миниатюры ещё нет'
+        )
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='')
+        if options['missing']:
+            posts = posts.filter(image_variants='')
+        names = (posts.order_by().values_list('image', flat=True)
+                 .distinct().iterator())
+        done = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=options['workers'],
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=thumbnails.init_worker,
+        ) as pool:
+            while True:
+                batch = list(islice(names, options['batch_size']))
+                if not batch:
+                    break
+                for error in pool.map(thumbnails.generate_safely, batch,
+                                      chunksize=16):
+                    if error is None:
+                        done += 1
+                    else:
+                        failed += 1
+                        self.stderr.write(error)
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано миниатюр: {done}, ошибок: {failed}'
+        ))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики записей, комментариев и подписок'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            users, groups = rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитаны счётчики: пользователей {users}, групп {groups}'
+        ))
@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from posts.search import get_backend, rebuild_index
+
+
+class Command(BaseCommand):
+    help = 'Создаёт заново полнотекстовый индекс записей'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько записей индексировать в одной транзакции'
+        )
+
+    def handle(self, *args, **options):
+        get_backend().install()
+        total = rebuild_index(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Проиндексировано записей: {total}'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from posts.rendering import render_text_html
+
+
+class Command(BaseCommand):
+    help = 'Заполняет HTML текстов записей и комментариев'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк обновлять одним запросом'
+        )
+        parser.add_argument(
+            '--all', action='store_true', dest='everything',
+            help='Перерендерить все строки, а не только пустые'
+        )
+
+    def handle(self, *args, **options):
+        total = render_text_html(batch_size=options['batch_size'],
+                                 everything=options['everything'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Обновлено строк: {total}'
+        ))
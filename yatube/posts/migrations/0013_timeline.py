@@ -0,0 +1,84 @@
+# Generated by Django 2.2.16 on 2026-10-18 05:52
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+
+def fill_timelines(apps, schema_editor):
+    # Копия posts.timeline.rebuild_timelines на момент миграции: в
+    # ленту попадают последние записи авторов, у которых подписчиков не
+    # больше TIMELINE_FANOUT_LIMIT.
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    length = getattr(settings, 'TIMELINE_LENGTH', 1000)
+    fanout_authors = set(
+        UserCounters.objects.filter(
+            followers_count__lte=getattr(settings, 'TIMELINE_FANOUT_LIMIT',
+                                         10000))
+        .values_list('user_id', flat=True)
+    )
+    follows = Follow.objects.order_by('user_id').values_list('user_id',
+                                                             'author_id')
+    for user_id, author_id in follows.iterator():
+        if author_id not in fanout_authors:
+            continue
+        posts = (Post.objects.filter(author_id=author_id)
+                 .order_by('-pub_date', '-id')
+                 .values_list('pk', 'pub_date')[:length])
+        TimelineEntry.objects.bulk_create(
+            (TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+             for pk, pub_date in posts),
+            batch_size=500,
+            ignore_conflicts=True,
+        )
+    # Ограничиваем длину каждой ленты.
+    for user_id in (TimelineEntry.objects.order_by()
+                    .values_list('user_id', flat=True).distinct()):
+        entries = TimelineEntry.objects.filter(user_id=user_id)
+        boundary = (entries.order_by('-pub_date', '-post_id')
+                    .values_list('pub_date', 'post_id')[length:].first())
+        if boundary is None:
+            continue
+        pub_date, post_id = boundary
+        entries.filter(
+            models.Q(pub_date__lt=pub_date)
+            | models.Q(pub_date=pub_date, post_id__lte=post_id)
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0012_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(verbose_name='Дата публикации записи')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.Post', verbose_name='Запись')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Читатель')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты подписок',
+                'verbose_name_plural': 'Записи лент подписок',
+                'ordering': ('-pub_date', '-post'),
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'post'), name='timeline_user_post_unique'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
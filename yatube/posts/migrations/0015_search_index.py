@@ -0,0 +1,41 @@
+from django.db import migrations
+
+# Таблица бэкенда posts.search.SQLiteFTSBackend на момент миграции.
+# Другие бэкенды создают индекс командой rebuild_search_index.
+TABLE = 'posts_post_fts'
+TOKENIZER = 'unicode61 remove_diacritics 2'
+
+
+def install_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    Post = apps.get_model('posts', 'Post')
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {TABLE} '
+            f'USING fts5(text, tokenize="{TOKENIZER}")'
+        )
+        cursor.execute(
+            f'INSERT OR REPLACE INTO {TABLE} (rowid, text) '
+            f'SELECT id, text FROM {Post._meta.db_table}'
+        )
+
+
+def uninstall_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f'DROP TABLE IF EXISTS {TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0014_post_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_index, uninstall_index),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:12
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_timeline_counts(apps, schema_editor):
+    # Копия posts.counters.recount_users на момент миграции.
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    counted = (TimelineEntry.objects.order_by()
+               .filter(user=OuterRef('pk'))
+               .values('user')
+               .annotate(total=Count('pk'))
+               .values('total'))
+    UserCounters.objects.update(timeline_count=Coalesce(
+        Subquery(counted, output_field=IntegerField()), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0018_text_html'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usercounters',
+            name='timeline_count',
+            field=models.PositiveIntegerField(default=0, verbose_name='Записей в ленте подписок'),
+        ),
+        migrations.RunPython(fill_timeline_counts, migrations.RunPython.noop),
+    ]
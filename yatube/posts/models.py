@@ -1,5 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils.safestring import mark_safe
+
+from .rendering import render_text
 
 User = get_user_model()
 
@@ -10,6 +13,11 @@ class Group(models.Model):
                              help_text="Не более 200 символов")
     slug = models.SlugField("slug для url адреса группы", unique=True)
     description = models.TextField("Описание группы")
+    posts_count = models.PositiveIntegerField(
+        "Число записей",
+        default=0,
+        editable=False
+    )
 
     class Meta:
         verbose_name = "Группа записей"
@@ -20,13 +28,51 @@ class Group(models.Model):
         return self.title
 
 
-class Post(models.Model):
+class RenderedTextMixin:
+    """
+    Текст в HTML, сохранённый в text_html (posts.rendering). Заполняется
+    при каждом сохранении с загруженным текстом: из формы, админки или
+    ORM.
+    """
+
+    def render_text(self):
+        self.text_html = render_text(type(self).__name__, self.text)
+
+    def save(self, *args, **kwargs):
+        # Отложенный и не присвоенный текст не менялся.
+        if 'text' in self.__dict__:
+            self.render_text()
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'text' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'text_html'}
+        super().save(*args, **kwargs)
+
+    @property
+    def body(self):
+        if not self.text_html:
+            return render_text(type(self).__name__, self.text)
+        return mark_safe(self.text_html)
+
+
+class Post(RenderedTextMixin, models.Model):
     """Модель записи, создаваемой пользователем в сообществе"""
     text = models.TextField(
         'Текст записи',
         help_text='Введите текст поста'
     )
+    text_html = models.TextField(
+        'Текст в HTML',
+        blank=True,
+        default='',
+        editable=False,
+        help_text='Экранированный текст с <br>, готовый для шаблона'
+    )
     pub_date = models.DateTimeField("Дата публикации", auto_now_add=True)
+    updated = models.DateTimeField(
+        "Дата изменения",
+        auto_now=True,
+        help_text='Меняется и при изменении комментариев записи'
+    )
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -47,17 +93,45 @@ class Post(models.Model):
         upload_to='posts/',
         blank=True
     )
+    image_variants = models.TextField(
+        'Варианты картинки',
+        blank=True,
+        default='',
+        editable=False,
+        help_text='JSON со списком уменьшенных копий для srcset'
+    )
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(fields=('-pub_date', '-id'),
+                         name='post_pub_date_id_idx'),
+            models.Index(fields=('group', '-pub_date', '-id'),
+                         name='post_group_pub_date_idx'),
+            models.Index(fields=('author', '-pub_date', '-id'),
+                         name='post_author_pub_date_idx'),
+        )
         verbose_name = "Запись"
         verbose_name_plural = "Записи"
 
     def __str__(self):
         return self.text[:15]
 
+    def save(self, *args, **kwargs):
+        # Копии старой картинки не подходят новой, и её миниатюра не
+        # готова (posts.thumbnails.is_ready). _image_name запоминает
+        # posts.signals.
+        image = self.__dict__.get('image')
+        name = getattr(image, 'name', image)
+        if 'image' in self.__dict__ and name != self._image_name:
+            self.image_variants = ''
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None and 'image' in update_fields:
+                kwargs['update_fields'] = {*update_fields, 'image_variants'}
+        super().save(*args, **kwargs)
+
 
-class Comment(models.Model):
+class Comment(RenderedTextMixin, models.Model):
     post = models.ForeignKey(
         Post,
         on_delete=models.CASCADE,
@@ -74,6 +148,13 @@ class Comment(models.Model):
         'Текст комментария',
         help_text='Введите текст комментария'
     )
+    text_html = models.TextField(
+        'Текст в HTML',
+        blank=True,
+        default='',
+        editable=False,
+        help_text='Экранированный текст, готовый для шаблона'
+    )
     created = models.DateTimeField(
         "Дата публикации комментария",
         auto_now_add=True
@@ -81,6 +162,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ('-created',)
+        indexes = (
+            models.Index(fields=('post', '-created', '-id'),
+                         name='comment_post_created_id_idx'),
+        )
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
 
@@ -102,6 +187,85 @@ class Follow(models.Model):
 
     class Meta:
         ordering = ('user__username', 'author__username')
+        indexes = (
+            models.Index(fields=('user', 'author'),
+                         name='follow_user_author_idx'),
+        )
 
     def __str__(self):
         return f'{self.user.username} follows {self.author.username}'
+
+
+class UserCounters(models.Model):
+    """
+    Денормализованные счётчики пользователя. Обновляются сигналами
+    (posts.signals), пересчитываются командой rebuild_counters.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='counters',
+        verbose_name='Пользователь'
+    )
+    posts_count = models.PositiveIntegerField('Число записей', default=0)
+    comments_count = models.PositiveIntegerField(
+        'Число комментариев',
+        default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        'Число подписчиков',
+        default=0
+    )
+    following_count = models.PositiveIntegerField(
+        'Число подписок',
+        default=0
+    )
+    timeline_count = models.PositiveIntegerField(
+        'Записей в ленте подписок',
+        default=0
+    )
+
+    class Meta:
+        verbose_name = "Счётчики пользователя"
+        verbose_name_plural = "Счётчики пользователей"
+
+    def __str__(self):
+        return f'{self.user_id}: {self.posts_count} posts'
+
+
+class TimelineEntry(models.Model):
+    """
+    Запись материализованной ленты подписок: ссылка на пост автора,
+    на которого подписан пользователь. Заполняется при публикации
+    (posts.timeline), читается в follow_index.
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        verbose_name='Читатель'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name='Запись'
+    )
+    pub_date = models.DateTimeField("Дата публикации записи")
+
+    class Meta:
+        ordering = ('-pub_date', '-post')
+        constraints = (
+            models.UniqueConstraint(fields=('user', 'post'),
+                                    name='timeline_user_post_unique'),
+        )
+        indexes = (
+            models.Index(fields=('user', '-pub_date', '-post'),
+                         name='timeline_user_pub_date_idx'),
+        )
+        verbose_name = "Запись ленты подписок"
+        verbose_name_plural = "Записи лент подписок"
+
+    def __str__(self):
+        return f'{self.user_id} <- {self.post_id}'
@@ -0,0 +1,311 @@
+from django.conf import settings
+from django.core import signing
+from django.core.paginator import Page, Paginator
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+
+CURSOR_SALT = 'posts.cursor'
+FORWARD = 'n'
+BACKWARD = 'p'
+LAST = 'l'
+PAGE_WINDOW = 2
+
+
+def estimate_count(queryset):
+    """
+    Число строк таблицы по статистике ANALYZE (sqlite_stat1) для
+    запросов без фильтров, если таблица больше
+    PAGINATOR_ESTIMATE_THRESHOLD строк. Иначе None.
+    """
+    if queryset.query.has_filters():
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != 'sqlite':
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1',
+                [queryset.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+    except DatabaseError:
+        # Таблица sqlite_stat1 появляется только после ANALYZE.
+        return None
+    if row is None:
+        return None
+    rows = int(row[0].split()[0])
+    threshold = getattr(settings, 'PAGINATOR_ESTIMATE_THRESHOLD', 100000)
+    return rows if rows >= threshold else None
+
+
+class LazyRows:
+    """
+    Записи страницы, которые выбираются из базы при первом обращении
+    (итерация, len, индекс). Лента, целиком взятая из кеша фрагмента,
+    к ним не обращается, и запроса нет.
+    """
+
+    def __init__(self, load):
+        self._load = load
+        self._rows = None
+
+    def rows(self):
+        if self._rows is None:
+            self._rows = self._load()
+        return self._rows
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def __len__(self):
+        return len(self.rows())
+
+    def __getitem__(self, index):
+        return self.rows()[index]
+
+
+class CursorPaginator(Paginator):
+    """
+    Паджинатор по ключу (keyset), вместо LIMIT/OFFSET.
+
+    Страница выбирается условием на ключ сортировки (по умолчанию
+    `(pub_date, id)` по убыванию), поэтому запрос стоит одинаково
+    на любой глубине и не требует COUNT(*). Ссылки на соседние
+    страницы передаются непрозрачными подписанными токенами
+    `page_obj.next_cursor` и `page_obj.previous_cursor`.
+
+    Если передан count_func (например, закешированный COUNT), страница
+    получает окно номеров вокруг текущей `page_obj.page_window`,
+    ссылки на них `page_obj.page_links` (номер и курсор), число страниц
+    `page_obj.last_number` и курсор на последнюю страницу
+    `page_obj.last_cursor`. Курсор номера из окна - ключ крайней
+    записи текущей страницы и число страниц, которые надо пропустить:
+    их ключи читаются по индексу, без OFFSET. Последняя страница
+    выбирается с конца и содержит остаток count - (N - 1) * per_page
+    (с учётом orphans), так что её границы совпадают со страницами,
+    пройденными вперёд.
+
+    С lazy=True записи страницы - LazyRows: запрос выполняется при
+    первом обращении к ним или к has_next(), и тогда же уточняются
+    номер и курсоры страницы. Шаблон должен обращаться к записям раньше,
+    чем к ссылкам паджинатора. transform превращает выбранные строки в
+    объекты для шаблона (записи ленты подписок - в записи); курсоры
+    строятся по исходным строкам.
+    """
+
+    def __init__(self, object_list, per_page, keys=('pub_date', 'id'),
+                 count_func=None, lazy=False, transform=list, **kwargs):
+        object_list = object_list.order_by(*(f'-{key}' for key in keys))
+        super().__init__(object_list, per_page, **kwargs)
+        self.keys = keys
+        self.count_func = count_func
+        self.lazy = lazy
+        self.transform = transform
+        self._num_pages = None
+        self._pending = None
+
+    @cached_property
+    def count(self):
+        if self.count_func is not None:
+            return self.count_func()
+        return super().count
+
+    @property
+    def total_pages(self):
+        """Число страниц по count_func или None, если его нет."""
+        if self.count_func is None:
+            return None
+        hits = max(1, self.count - self.orphans)
+        return max(1, -(-hits // self.per_page))
+
+    @property
+    def num_pages(self):
+        # В режиме курсора общее число страниц неизвестно: известно лишь,
+        # есть ли страница после текущей.
+        if self._pending is not None:
+            self._pending.rows()
+        if self._num_pages is not None:
+            return self._num_pages
+        return super().num_pages
+
+    def get_page(self, number=None, cursor=None):
+        """
+        Возвращает страницу по курсору, а при его отсутствии -
+        по номеру страницы (для старых ссылок вида `?page=N`).
+        """
+        position = self.decode_cursor(cursor) if cursor else None
+        if position is None and number in (None, '', '1', 1):
+            position = FORWARD, None, 1, 0
+        if position is None:
+            page = super().get_page(number)
+            page.object_list = list(page.object_list)
+            self._set_cursors(page, page.object_list)
+            page.object_list = self.transform(page.object_list)
+            return page
+        direction, values, number, skip = position
+        if direction == FORWARD:
+            number = max(number, 1 if values is None else 2)
+        page = Page([], number, self)
+        self._set_cursors(page, [])
+        rows = LazyRows(lambda: self._load(page, direction, values, skip))
+        page.object_list = rows
+        if self.lazy:
+            self._pending = rows
+        else:
+            rows.rows()
+        return page
+
+    def _load(self, page, direction, values, skip=0):
+        self._pending = None
+        if skip:
+            values = self._skip(direction, values, skip * self.per_page)
+        if direction == LAST:
+            size = self._last_page_size()
+        elif direction == BACKWARD:
+            size = self.per_page
+        else:
+            # Остаток не больше orphans присоединяется к странице.
+            size = self.per_page + self.orphans
+        rows = list(self._ordered(direction, values)[:size + 1])
+        has_more = len(rows) > size
+        if direction == FORWARD and has_more:
+            size = self.per_page
+        rows = rows[:size]
+        number = page.number
+        if direction == LAST:
+            # Последняя страница - самые старые объекты.
+            rows.reverse()
+            number = max(self.total_pages or 1, 2) if has_more else 1
+            has_next = False
+        elif direction == BACKWARD:
+            rows.reverse()
+            number = max(number, 2) if has_more else 1
+            has_next = True
+        else:
+            has_next = has_more
+        self._num_pages = number + 1 if has_next else number
+        page.number = number
+        self._set_cursors(page, rows)
+        return self.transform(rows)
+
+    def _last_page_size(self):
+        total = self.total_pages or 1
+        size = self.count - (total - 1) * self.per_page
+        return min(max(size, 1), self.per_page + self.orphans)
+
+    def _skip(self, direction, values, rows):
+        # Ключ последней из rows записей после values: читаются только
+        # столбцы ключа.
+        skipped = list(self._ordered(direction, values)
+                       .values_list(*self.keys)[:rows])
+        return list(skipped[-1]) if skipped else values
+
+    def _ordered(self, direction, values):
+        descending = direction == FORWARD
+        lookup = 'lt' if descending else 'gt'
+        queryset = self.object_list
+        if values:
+            # Условие на первый ключ без OR позволяет базе начать чтение
+            # индекса сразу с нужной позиции.
+            queryset = queryset.filter(**{
+                f'{self.keys[0]}__{lookup}e': values[0]
+            })
+            condition = Q()
+            for index, key in enumerate(self.keys):
+                exact = dict(zip(self.keys[:index], values[:index]))
+                exact[f'{key}__{lookup}'] = values[index]
+                condition |= Q(**exact)
+            queryset = queryset.filter(condition)
+        ordering = [f'-{key}' if descending else key for key in self.keys]
+        return queryset.order_by(*ordering)
+
+    def _set_cursors(self, page, objects):
+        page.next_cursor = None
+        page.previous_cursor = None
+        page.last_cursor = None
+        page.page_window = [page.number]
+        page.page_links = [(page.number, None)]
+        page.last_number = page.number
+        if not objects:
+            return
+        if page.has_next():
+            page.next_cursor = self.encode_cursor(
+                FORWARD, objects[-1], page.number + 1)
+        if page.has_previous():
+            page.previous_cursor = self.encode_cursor(
+                BACKWARD, objects[0], page.number - 1)
+        total = self.total_pages
+        if total is None:
+            return
+        # Кеш числа записей может отставать: не меньше известного.
+        total = max(total, page.number + 1 if page.has_next()
+                    else page.number)
+        page.last_number = total
+        page.page_window = list(range(max(1, page.number - PAGE_WINDOW),
+                                      min(total, page.number + PAGE_WINDOW)
+                                      + 1))
+        page.page_links = [(number, self._window_cursor(page, objects,
+                                                        number))
+                           for number in page.page_window]
+        if page.has_next():
+            page.last_cursor = self.encode_cursor(LAST, None, total)
+
+    def _window_cursor(self, page, objects, number):
+        if number == page.number:
+            return None
+        if number == 1:
+            return self.encode_cursor(FORWARD, None, 1)
+        if number > page.number:
+            return self.encode_cursor(FORWARD, objects[-1], number,
+                                      skip=number - page.number - 1)
+        return self.encode_cursor(BACKWARD, objects[0], number,
+                                  skip=page.number - number - 1)
+
+    def encode_cursor(self, direction, obj, number, skip=0):
+        values = None
+        if obj is not None:
+            values = []
+            for key in self.keys:
+                value = getattr(obj, key)
+                if hasattr(value, 'isoformat'):
+                    value = value.isoformat()
+                values.append(value)
+        return signing.dumps([direction, values, number, skip],
+                             salt=CURSOR_SALT)
+
+    def decode_cursor(self, cursor):
+        """
+        Возвращает (направление, значения ключа, номер, число
+        пропускаемых страниц) или None.
+        """
+        try:
+            # В курсорах без четвёртого элемента страницы не пропускаются.
+            direction, values, number, *skip = signing.loads(
+                cursor, salt=CURSOR_SALT)
+            skip = max(int(skip[0]), 0) if skip else 0
+            if direction == LAST:
+                return direction, None, int(number), 0
+            if direction not in (FORWARD, BACKWARD):
+                return None
+            if values is None and direction == FORWARD:
+                return direction, None, int(number), 0
+            return (direction, self._parse_values(values), int(number),
+                    skip)
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+
+    def _parse_values(self, values):
+        if len(values) != len(self.keys):
+            raise ValueError('Cursor does not match paginator keys')
+        opts = self.object_list.model._meta
+        parsed = []
+        for key, value in zip(self.keys, values):
+            if opts.get_field(key).get_internal_type() == 'DateTimeField':
+                value = parse_datetime(value)
+                if value is None:
+                    raise ValueError('Invalid datetime in cursor')
+            parsed.append(value)
+        return parsed
@@ -0,0 +1,52 @@
+"""
+HTML текстов записей и комментариев, готовый для шаблона.
+
+Текст экранируется (у записей ещё и переводы строк заменяются на <br>)
+один раз при сохранении модели (RenderedTextMixin.save), и результат
+хранится в поле text_html. Шаблоны выводят его без фильтров через
+свойство body. Строки, созданные в обход save() (bulk_create,
+update()), заполняет команда render_text_html; пока поле пустое, body
+рендерит текст на лету.
+"""
+from django.apps import apps as global_apps
+from django.template.defaultfilters import linebreaksbr
+from django.utils.html import escape
+
+RENDERERS = {
+    'Post': lambda text: linebreaksbr(text, autoescape=True),
+    'Comment': escape,
+}
+
+
+def render_text(model_name, text):
+    return RENDERERS[model_name](text)
+
+
+def render_text_html(batch_size=1000, everything=False, apps=global_apps):
+    """
+    Заполняет text_html записей и комментариев пачками по batch_size.
+    По умолчанию только пустые, с everything=True - все. Возвращает
+    число обновлённых строк.
+    """
+    total = 0
+    for model_name in RENDERERS:
+        model = apps.get_model('posts', model_name)
+        rows = model.objects.order_by('pk')
+        if not everything:
+            rows = rows.filter(text_html='')
+        last_pk = 0
+        while True:
+            batch = list(rows.filter(pk__gt=last_pk)
+                         .values_list('pk', 'text')[:batch_size])
+            if not batch:
+                break
+            # bulk_update не трогает Post.updated: HTML тот же, что
+            # рендерился на лету.
+            model.objects.bulk_update(
+                [model(pk=pk, text_html=render_text(model_name, text))
+                 for pk, text in batch],
+                ['text_html'],
+            )
+            last_pk = batch[-1][0]
+            total += len(batch)
+    return total
@@ -0,0 +1,257 @@
+"""
+Полнотекстовый поиск по записям.
+
+Бэкенд выбирается настройкой POSTS_SEARCH_BACKEND. По умолчанию это
+SQLite FTS5: виртуальная таблица posts_post_fts, rowid которой равен id
+записи. Индекс обновляется сигналами сохранения и удаления Post
+(posts.signals); записи, созданные в обход сигналов (bulk_create,
+loaddata), добавляет команда rebuild_search_index.
+
+Результаты упорядочены по релевантности, а затем по id. Страницы
+выбираются по ключу (rank, id), следующая передаётся подписанным
+курсором, как в лентах. Чтобы запрос с частым словом не оценивал все
+подходящие записи, релевантность считается только для
+POSTS_SEARCH_WINDOW самых новых из них. Первая страница запоминает в
+курсоре id самой новой записи окна, и следующие страницы ранжируют то
+же окно, даже если появились новые записи. Если совпадений больше, чем
+помещается в окно, страница помечается truncated, и шаблон сообщает об
+этом пользователю.
+"""
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core import signing
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.utils.module_loading import import_string
+
+SEARCH_SALT = 'posts.search'
+MAX_TERMS = 10
+# rows - пары (id, rank); newest - id самой новой записи окна;
+# truncated - совпадений больше, чем search_window().
+SearchResult = namedtuple('SearchResult', 'rows newest truncated')
+
+
+def parse_query(query):
+    """Слова запроса в нижнем регистре, не больше MAX_TERMS."""
+    return re.findall(r'\w+', query.lower())[:MAX_TERMS]
+
+
+def search_window():
+    return getattr(settings, 'POSTS_SEARCH_WINDOW', 1000)
+
+
+class SearchBackend:
+    """
+    Интерфейс бэкенда поиска. Все методы принимают алиас базы данных,
+    в которой хранится индекс.
+    """
+
+    def install(self, using=DEFAULT_DB_ALIAS):
+        """Создаёт структуры индекса."""
+        raise NotImplementedError
+
+    def uninstall(self, using=DEFAULT_DB_ALIAS):
+        raise NotImplementedError
+
+    def index(self, posts, using=DEFAULT_DB_ALIAS):
+        """Добавляет или заменяет записи: итерируемое пар (id, текст)."""
+        raise NotImplementedError
+
+    def remove(self, post_ids, using=DEFAULT_DB_ALIAS):
+        raise NotImplementedError
+
+    def clear(self, using=DEFAULT_DB_ALIAS):
+        raise NotImplementedError
+
+    def optimize(self, using=DEFAULT_DB_ALIAS):
+        """Уплотняет индекс после массовой загрузки."""
+
+    def search(self, terms, limit, after=None, newest=None,
+               using=DEFAULT_DB_ALIAS):
+        """
+        Возвращает SearchResult с не больше чем limit парами (id, rank),
+        где меньший rank - более релевантная запись. after - пара
+        (rank, id), после которой начинается страница. Ранжируются не
+        больше search_window() самых новых совпадений с id не больше
+        newest. Если страница пуста, newest и truncated - None.
+        """
+        raise NotImplementedError
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """Индекс в виртуальной таблице SQLite FTS5."""
+
+    table = 'posts_post_fts'
+    tokenizer = 'unicode61 remove_diacritics 2'
+
+    def _execute(self, using, sql, params=(), many=False):
+        connection = connections[using]
+        if connection.vendor != 'sqlite':
+            return None
+        with connection.cursor() as cursor:
+            if many:
+                cursor.executemany(sql, params)
+                return None
+            cursor.execute(sql, params)
+            return cursor.fetchall()
+
+    def install(self, using=DEFAULT_DB_ALIAS):
+        self._execute(
+            using,
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} '
+            f'USING fts5(text, tokenize="{self.tokenizer}")'
+        )
+
+    def uninstall(self, using=DEFAULT_DB_ALIAS):
+        self._execute(using, f'DROP TABLE IF EXISTS {self.table}')
+
+    def index(self, posts, using=DEFAULT_DB_ALIAS):
+        self._execute(
+            using,
+            f'INSERT OR REPLACE INTO {self.table} (rowid, text) '
+            f'VALUES (%s, %s)',
+            list(posts),
+            many=True,
+        )
+
+    def remove(self, post_ids, using=DEFAULT_DB_ALIAS):
+        self._execute(
+            using,
+            f'DELETE FROM {self.table} WHERE rowid = %s',
+            [(pk,) for pk in post_ids],
+            many=True,
+        )
+
+    def clear(self, using=DEFAULT_DB_ALIAS):
+        self._execute(using, f'DELETE FROM {self.table}')
+
+    def optimize(self, using=DEFAULT_DB_ALIAS):
+        self._execute(
+            using,
+            f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')"
+        )
+
+    def search(self, terms, limit, after=None, newest=None,
+               using=DEFAULT_DB_ALIAS):
+        if not terms:
+            return SearchResult([], None, None)
+        # Каждое слово в кавычках: синтаксис FTS5 в запросе не работает.
+        match = ' '.join('"{}"'.format(term.replace('"', ''))
+                         for term in terms)
+        window = search_window()
+        params = [match]
+        bound = ''
+        if newest is not None:
+            bound = ' AND rowid <= %s'
+            params.append(newest)
+        # Новые совпадения FTS5 отдаёт по rowid без сортировки, и bm25
+        # вычисляется только для них. Лишнее совпадение за окном
+        # показывает, что окно неполное, и в выдачу не попадает.
+        sql = (f'SELECT id, score, newest, total FROM ('
+               f'SELECT id, score, '
+               f'ROW_NUMBER() OVER (ORDER BY id DESC) AS position, '
+               f'MAX(id) OVER () AS newest, COUNT(*) OVER () AS total '
+               f'FROM (SELECT rowid AS id, rank AS score FROM {self.table} '
+               f'WHERE {self.table} MATCH %s{bound} '
+               f'ORDER BY rowid DESC LIMIT %s)) WHERE position <= %s')
+        params += [window + 1, window]
+        if after is not None:
+            sql += ' AND (score > %s OR (score = %s AND id > %s))'
+            params += [after[0], after[0], after[1]]
+        sql += ' ORDER BY score, id LIMIT %s'
+        params.append(limit)
+        rows = self._execute(using, sql, params) or []
+        if not rows:
+            return SearchResult([], None, None)
+        return SearchResult([(pk, rank) for pk, rank, _, _ in rows],
+                            rows[0][2], rows[0][3] > window)
+
+
+@lru_cache(maxsize=None)
+def _load_backend(path):
+    return import_string(path)()
+
+
+def get_backend():
+    return _load_backend(getattr(settings, 'POSTS_SEARCH_BACKEND',
+                                 'posts.search.SQLiteFTSBackend'))
+
+
+def rebuild_index(batch_size=1000, using=DEFAULT_DB_ALIAS,
+                  apps=global_apps):
+    """Заполняет индекс заново всеми записями. Возвращает их число."""
+    Post = apps.get_model('posts', 'Post')
+    backend = get_backend()
+    backend.clear(using=using)
+    posts = Post.objects.using(using).order_by('pk')
+    last_pk = 0
+    total = 0
+    while True:
+        batch = list(posts.filter(pk__gt=last_pk)
+                     .values_list('pk', 'text')[:batch_size])
+        if not batch:
+            break
+        with transaction.atomic(using=using):
+            backend.index(batch, using=using)
+        last_pk = batch[-1][0]
+        total += len(batch)
+    backend.optimize(using=using)
+    return total
+
+
+class SearchPage:
+    """Страница результатов поиска."""
+
+    def __init__(self, object_list, number, next_cursor, truncated=False):
+        self.object_list = object_list
+        self.number = number
+        self.next_cursor = next_cursor
+        # Ранжированы только search_window() самых новых совпадений.
+        self.truncated = truncated
+        self.window = search_window()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _decode_cursor(cursor):
+    """(rank, id) после страницы, её номер, newest и truncated окна."""
+    try:
+        rank, pk, number, newest, truncated = signing.loads(
+            cursor, salt=SEARCH_SALT)
+        return (float(rank), int(pk)), int(number), int(newest), truncated
+    except (signing.BadSignature, TypeError, ValueError):
+        return None, 1, None, None
+
+
+def search_posts(query, cursor=None, per_page=10):
+    """Страница записей, подходящих под запрос, по релевантности."""
+    Post = global_apps.get_model('posts', 'Post')
+    after, number, newest, truncated = (
+        _decode_cursor(cursor) if cursor else (None, 1, None, None))
+    result = get_backend().search(parse_query(query), per_page + 1, after,
+                                  newest)
+    rows = result.rows
+    newest = result.newest or newest
+    if result.truncated is not None:
+        truncated = result.truncated
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        pk, rank = rows[-1]
+        next_cursor = signing.dumps(
+            [rank, pk, number + 1, newest, truncated], salt=SEARCH_SALT)
+    posts = Post.objects.select_related('author', 'group').in_bulk(
+        [pk for pk, rank in rows])
+    # Запись могла быть удалена между запросами к индексу и к таблице.
+    object_list = [posts[pk] for pk, rank in rows if pk in posts]
+    return SearchPage(object_list, number, next_cursor, bool(truncated))
@@ -0,0 +1,231 @@
+from django.conf import settings
+from django.db.models import DEFERRED, F
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core import pagecache
+
+from . import cache as feed_cache
+from . import counters, search, timeline
+from .thumbnails import thumbnail_cache
+from .models import Comment, Follow, Group, Post, UserCounters
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def create_user_counters(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        UserCounters.objects.get_or_create(user=instance)
+
+
+OWNER_FIELDS = ('author_id', 'group_id')
+
+
+@receiver(post_init, sender=Post)
+def remember_post_owner(sender, instance, **kwargs):
+    # Запоминаем автора и группу, чтобы при их смене перенести счётчики.
+    # Читаем из __dict__: отложенное поле в .only()/.defer() не загружаем.
+    instance._counted = tuple(instance.__dict__.get(field, DEFERRED)
+                              for field in OWNER_FIELDS)
+
+
+@receiver(pre_save, sender=Post)
+def load_post_owner(sender, instance, raw, using, **kwargs):
+    # Отложенное поле, которое потом присвоили, читаем из базы одним
+    # запросом перед сохранением.
+    assigned = [old is DEFERRED and field in instance.__dict__
+                for field, old in zip(OWNER_FIELDS, instance._counted)]
+    if raw or instance._state.adding or not any(assigned):
+        return
+    stored = sender._default_manager.using(using).filter(
+        pk=instance.pk).values_list(*OWNER_FIELDS).first()
+    if stored is None:
+        return
+    instance._counted = tuple(
+        value if load else old
+        for old, value, load in zip(instance._counted, stored, assigned)
+    )
+
+
+@receiver(post_init, sender=Post)
+def remember_post_image(sender, instance, **kwargs):
+    # Читаем из __dict__, чтобы не загружать отложенное поле.
+    image = instance.__dict__.get('image')
+    instance._image_name = getattr(image, 'name', image)
+
+
+@receiver(post_save, sender=Post)
+def evict_changed_image(sender, instance, raw, **kwargs):
+    old_name = instance._image_name
+    new_name = instance.__dict__.get('image')
+    new_name = getattr(new_name, 'name', new_name)
+    if old_name and old_name != new_name:
+        thumbnail_cache.evict(old_name)
+    instance._image_name = new_name
+
+
+@receiver(post_init, sender=Post)
+def remember_post_text(sender, instance, **kwargs):
+    instance._indexed_text = instance.__dict__.get('text')
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, created, raw, using, **kwargs):
+    if raw:
+        return
+    if created or instance._indexed_text != instance.text:
+        search.get_backend().index([(instance.pk, instance.text)],
+                                   using=using)
+        instance._indexed_text = instance.text
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, using, **kwargs):
+    search.get_backend().remove([instance.pk], using=using)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post(sender, instance, created, raw, **kwargs):
+    # Стоит до count_saved_post: тот обновляет _counted. Сбрасываем
+    # ленты и страницы, в том числе старые, если запись сменила автора
+    # или группу. Ленты подписок зависят от области автора.
+    if raw:
+        return
+    old_author, old_group = (None, None) if created else instance._counted
+    scopes = feed_cache.post_scopes(instance)
+    if old_author not in (None, DEFERRED):
+        scopes.append(f'author:{old_author}')
+    if old_group not in (None, DEFERRED):
+        scopes.append(f'group:{old_group}')
+    feed_cache.invalidate(*scopes)
+    pagecache.purge(*scopes, f'post:{instance.pk}')
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw, **kwargs):
+    if raw:
+        return
+    # Отложенное и не присвоенное поле остаётся DEFERRED в обоих
+    # кортежах, то есть считается неизменным.
+    old_author, old_group = (None, None) if created else instance._counted
+    new_author, new_group = instance._counted = tuple(
+        instance.__dict__.get(field, DEFERRED) for field in OWNER_FIELDS)
+    if old_author != new_author:
+        if old_author is not None:
+            counters.change_user_counter(old_author, 'posts_count', -1)
+        counters.change_user_counter(new_author, 'posts_count', 1)
+    if old_group != new_group:
+        if old_group is not None:
+            counters.change_group_counter(old_group, -1)
+        if new_group is not None:
+            counters.change_group_counter(new_group, 1)
+
+
+@receiver(post_save, sender=Post)
+def push_to_timelines(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        timeline.push_post(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def shorten_timelines(sender, instance, **kwargs):
+    # Записи лент удаляются каскадом без сигналов: уменьшаем длины
+    # лент, пока записи ещё есть.
+    UserCounters.objects.filter(
+        user__timeline__post=instance
+    ).update(timeline_count=F('timeline_count') - 1)
+
+
+@receiver(post_delete, sender=Post)
+def evict_deleted_image(sender, instance, **kwargs):
+    if instance._image_name:
+        thumbnail_cache.evict(instance._image_name)
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post(sender, instance, **kwargs):
+    # Сбрасываем ленты с записью (в том числе ленты подписок через
+    # область автора) и валидаторы условных запросов всех лент.
+    scopes = feed_cache.post_scopes(instance)
+    feed_cache.invalidate(feed_cache.DELETED_POSTS, *scopes)
+    pagecache.purge(*scopes, f'post:{instance.pk}')
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'posts_count', -1)
+    if instance.group_id is not None:
+        counters.change_group_counter(instance.group_id, -1)
+
+
+@receiver(post_save, sender=Group)
+def invalidate_saved_group(sender, instance, created, raw, **kwargs):
+    if not created and not raw:
+        feed_cache.invalidate(f'group:{instance.pk}')
+        pagecache.purge(f'group:{instance.pk}')
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+def invalidate_saved_user(sender, instance, created, raw, update_fields,
+                          **kwargs):
+    # Вход пользователя обновляет только last_login: ленты не меняются.
+    if created or raw or update_fields == {'last_login'}:
+        return
+    feed_cache.invalidate(f'author:{instance.pk}')
+    pagecache.purge(f'author:{instance.pk}')
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def touch_commented_post(sender, instance, **kwargs):
+    if not kwargs.get('raw'):
+        Post.objects.filter(pk=instance.post_id).update(
+            updated=timezone.now())
+        pagecache.purge(f'post:{instance.post_id}')
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        counters.change_user_counter(instance.author_id, 'comments_count', 1)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    counters.change_user_counter(instance.author_id, 'comments_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def purge_followed_profile(sender, instance, **kwargs):
+    # На странице автора - число подписчиков.
+    if not kwargs.get('raw'):
+        pagecache.purge(f'author:{instance.author_id}')
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        counters.change_user_counter(instance.user_id, 'following_count', 1)
+        counters.change_user_counter(instance.author_id,
+                                     'followers_count', 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    counters.change_user_counter(instance.user_id, 'following_count', -1)
+    counters.change_user_counter(instance.author_id, 'followers_count', -1)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def prune_timeline(sender, instance, **kwargs):
+    timeline.prune(instance.user_id, instance.author_id)
+    # Стоит после count_deleted_follow: число подписчиков уже уменьшено.
+    timeline.restore_fanout(instance.author_id)
@@ -0,0 +1,354 @@
+"""
+Синтетические данные для нагрузочного тестирования.
+
+Данные детерминированы: при одинаковых параметрах и seed получаются те
+же пользователи, группы, подписки, записи и комментарии.
+
+- Популярность авторов степенная (закон Ципфа): на немногих авторов
+  подписана большая часть читателей, и они же чаще пишут.
+- Записи публикуются сериями: автор пишет несколько записей подряд с
+  интервалом в минуты. Записи вставляются в порядке pub_date, так что
+  id растут вместе со временем публикации, как в настоящей базе.
+- Доля записей с картинками берёт их из небольшого набора файлов.
+- Комментариев больше у записей популярных авторов.
+
+Строки создаются bulk_create пачками в транзакциях. Сигналы при этом
+не срабатывают, поэтому text_html заполняется сразу, а счётчики,
+поисковый индекс и ленты подписок пересчитываются в конце.
+"""
+import datetime
+import heapq
+import random
+from array import array
+from contextlib import contextmanager
+from io import BytesIO
+from itertools import accumulate, islice
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from faker import Faker
+from PIL import Image, ImageDraw
+
+from . import timeline
+from .models import Comment, Follow, Group, Post, TimelineEntry, User
+from .rendering import RENDERERS, render_text
+
+IMAGE_DIR = 'posts/synthetic'
+IMAGE_SIZE = (1200, 800)
+# Показатели степенных распределений популярности и активности.
+POPULARITY_EXPONENT = 1.1
+ACTIVITY_EXPONENT = 0.8
+GROUP_EXPONENT = 1.0
+GROUP_SHARE = 0.7
+# Записи одной серии и паузы между ними.
+BURST_MEAN = 4
+BURST_GAP_SECONDS = 600
+COMMENT_DELAY_SECONDS = 3600
+SENTENCES = 2000
+
+
+def zipf_weights(count, exponent):
+    """Накопленные веса рангов 1..count для random.choices."""
+    return list(accumulate(1 / rank ** exponent
+                           for rank in range(1, count + 1)))
+
+
+def to_datetime(timestamp):
+    return datetime.datetime.fromtimestamp(timestamp,
+                                           tz=datetime.timezone.utc)
+
+
+@contextmanager
+def explicit_dates():
+    """Даёт задать pub_date, created и updated вручную."""
+    fields = [Post._meta.get_field('pub_date'),
+              Post._meta.get_field('updated'),
+              Comment._meta.get_field('created')]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+@contextmanager
+def fast_writes():
+    """
+    На SQLite отключает fsync и увеличивает кеш страниц на время
+    генерации: синтетические данные проще создать заново, чем беречь
+    от сбоя питания. Внутри транзакции SQLite не даёт их менять.
+    """
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        yield
+        return
+    pragmas = {'synchronous': 'OFF', 'cache_size': -262144}
+    saved = {}
+    with connection.cursor() as cursor:
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}')
+            saved[name] = cursor.fetchone()[0]
+            cursor.execute(f'PRAGMA {name} = {value}')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            for name, value in saved.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+
+
+class Generator:
+    def __init__(self, users, groups, posts, follows_per_user=20,
+                 comments_per_post=1.0, image_share=0.1, images=16,
+                 days=365, until=None, seed=1, batch_size=5000):
+        self.rng = random.Random(seed)
+        self.fake = Faker('ru_RU')
+        self.fake.seed_instance(seed)
+        self.users = users
+        self.groups = groups
+        self.posts = posts
+        self.follows_per_user = follows_per_user
+        self.comments_per_post = comments_per_post
+        self.image_share = image_share
+        self.images = images
+        self.until = until or datetime.datetime(
+            2024, 1, 1, tzinfo=datetime.timezone.utc)
+        self.since = self.until - datetime.timedelta(days=days)
+        self.batch_size = batch_size
+        self.sentences = [self.fake.sentence(nb_words=12)
+                          for _ in range(SENTENCES)]
+        # Тексты собираются из предложений через пробел, поэтому их HTML
+        # - те же предложения, отрендеренные заранее: экранирование
+        # кириллицы заметно дороже остальной генерации.
+        self.rendered = {
+            model_name: [render_text(model_name, sentence)
+                         for sentence in self.sentences]
+            for model_name in RENDERERS
+        }
+
+    def _bulk_create(self, model, objects):
+        batch = []
+        for obj in objects:
+            batch.append(obj)
+            if len(batch) == self.batch_size:
+                with transaction.atomic():
+                    model.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            with transaction.atomic():
+                model.objects.bulk_create(batch)
+
+    def _new_ids(self, model, last_pk):
+        return array('q', model.objects.filter(pk__gt=last_pk)
+                     .order_by('pk').values_list('pk', flat=True))
+
+    def _last_pk(self, model):
+        return (model.objects.order_by('-pk')
+                .values_list('pk', flat=True).first() or 0)
+
+    def _text(self, model_name, low, high):
+        """Текст из low..high случайных предложений и его HTML."""
+        chosen = [self.rng.randrange(SENTENCES)
+                  for _ in range(self.rng.randint(low, high))]
+        rendered = self.rendered[model_name]
+        return (' '.join(self.sentences[number] for number in chosen),
+                ' '.join(rendered[number] for number in chosen))
+
+    def create_users(self):
+        """Пользователи по убыванию популярности: первый самый читаемый."""
+        last_pk = self._last_pk(User)
+        first_names = [self.fake.first_name() for _ in range(500)]
+        last_names = [self.fake.last_name() for _ in range(500)]
+        prefix = f'synthetic{last_pk}_'
+        self._bulk_create(User, (
+            User(username=f'{prefix}{number}', password='!',
+                 first_name=self.rng.choice(first_names),
+                 last_name=self.rng.choice(last_names),
+                 date_joined=self.since)
+            for number in range(self.users)
+        ))
+        self.user_ids = self._new_ids(User, last_pk)
+
+    def create_groups(self):
+        last_pk = self._last_pk(Group)
+        self._bulk_create(Group, (
+            Group(title=self.fake.catch_phrase()[:200],
+                  slug=f'synthetic-{last_pk}-{number}',
+                  description=self._text('Post', 1, 3)[0])
+            for number in range(self.groups)
+        ))
+        self.group_ids = self._new_ids(Group, last_pk)
+
+    def create_follows(self):
+        weights = zipf_weights(len(self.user_ids), POPULARITY_EXPONENT)
+        ranks = range(len(self.user_ids))
+        mean = max(self.follows_per_user, 1)
+        self.following = []
+        self.followers = [0] * len(ranks)
+
+        def follows():
+            for reader in ranks:
+                wanted = min(int(self.rng.expovariate(1 / mean)) + 1,
+                             len(ranks) - 1)
+                authors = set(self.rng.choices(ranks, cum_weights=weights,
+                                               k=wanted))
+                authors.discard(reader)
+                authors = sorted(authors)
+                self.following.append(authors)
+                for author in authors:
+                    self.followers[author] += 1
+                    yield Follow(user_id=self.user_ids[reader],
+                                 author_id=self.user_ids[author])
+
+        self._bulk_create(Follow, follows())
+
+    def create_images(self):
+        """Небольшой набор картинок в хранилище, общий для записей."""
+        names = []
+        for number in range(self.images):
+            name = f'{IMAGE_DIR}/synthetic_{number}.jpg'
+            if not default_storage.exists(name):
+                color = tuple(self.rng.randrange(256) for _ in range(3))
+                image = Image.new('RGB', IMAGE_SIZE, color)
+                draw = ImageDraw.Draw(image)
+                for _ in range(20):
+                    box = sorted(self.rng.randrange(IMAGE_SIZE[0])
+                                 for _ in range(2))
+                    draw.rectangle(
+                        (box[0], box[0] // 2, box[1], box[1] // 2),
+                        fill=tuple(self.rng.randrange(256)
+                                   for _ in range(3)))
+                buffer = BytesIO()
+                image.save(buffer, 'JPEG', quality=80)
+                name = default_storage.save(name,
+                                            ContentFile(buffer.getvalue()))
+            names.append(name)
+        self.image_names = names
+
+    def _publications(self):
+        """
+        (время, ранг автора) записей по возрастанию времени. Серии
+        начинаются как пуассоновский поток, записи серии идут с
+        паузами в минуты; куча отдаёт записи, раньше которых новых
+        уже не будет.
+        """
+        weights = zipf_weights(len(self.user_ids), ACTIVITY_EXPONENT)
+        ranks = range(len(self.user_ids))
+        start = self.since.timestamp()
+        bursts = self.posts / BURST_MEAN
+        gap = (self.until.timestamp() - start) / bursts
+        pending = []
+        emitted = 0
+        now = start
+        while emitted < self.posts:
+            now += self.rng.expovariate(1 / gap)
+            while pending and pending[0][0] <= now and emitted < self.posts:
+                yield heapq.heappop(pending)
+                emitted += 1
+            author = self.rng.choices(ranks, cum_weights=weights)[0]
+            moment = now
+            for _ in range(int(self.rng.expovariate(1 / BURST_MEAN)) + 1):
+                heapq.heappush(pending, (moment, author))
+                moment += self.rng.expovariate(1 / BURST_GAP_SECONDS)
+
+    def create_posts(self):
+        last_pk = self._last_pk(Post)
+        group_weights = zipf_weights(len(self.group_ids), GROUP_EXPONENT)
+        self.post_authors = array('l')
+        self.post_times = array('d')
+
+        def posts():
+            for moment, author in self._publications():
+                self.post_authors.append(author)
+                self.post_times.append(moment)
+                text, html = self._text('Post', 1, 8)
+                group_id = None
+                if self.group_ids and self.rng.random() < GROUP_SHARE:
+                    group_id = self.rng.choices(
+                        self.group_ids, cum_weights=group_weights)[0]
+                image = ''
+                if self.image_names and self.rng.random() < self.image_share:
+                    image = self.rng.choice(self.image_names)
+                date = to_datetime(moment)
+                yield Post(text=text, text_html=html,
+                           author_id=self.user_ids[author],
+                           group_id=group_id, image=image,
+                           pub_date=date, updated=date)
+
+        with explicit_dates():
+            self._bulk_create(Post, posts())
+        self.post_ids = self._new_ids(Post, last_pk)
+
+    def create_comments(self):
+        """Число комментариев записи растёт с популярностью автора."""
+        readers = zipf_weights(len(self.user_ids), ACTIVITY_EXPONENT)
+        ranks = range(len(self.user_ids))
+        # Вес ранга r из закона Ципфа, нормированный на среднее по
+        # записям, чтобы в среднем было comments_per_post.
+        boosts = [1 / (rank + 1) ** POPULARITY_EXPONENT for rank in ranks]
+        mean_boost = (sum(boosts[author] for author in self.post_authors)
+                      / max(len(self.post_authors), 1))
+        limit = self.until.timestamp()
+
+        def comments():
+            for post_id, author, moment in zip(
+                    self.post_ids, self.post_authors, self.post_times):
+                mean = (self.comments_per_post * boosts[author]
+                        / mean_boost)
+                count = round(self.rng.expovariate(1 / mean)) if mean else 0
+                for _ in range(count):
+                    moment = min(limit, moment + self.rng.expovariate(
+                        1 / COMMENT_DELAY_SECONDS))
+                    text, html = self._text('Comment', 1, 2)
+                    reader = self.rng.choices(ranks, cum_weights=readers)[0]
+                    yield Comment(
+                        post_id=post_id, author_id=self.user_ids[reader],
+                        text=text, text_html=html,
+                        created=to_datetime(moment))
+
+        with explicit_dates():
+            self._bulk_create(Comment, comments())
+
+    def create_timelines(self):
+        """
+        Ленты подписок созданных пользователей по правилам posts.timeline:
+        timeline_length() новых записей авторов, у которых подписчиков
+        не больше fanout_limit(). rebuild_timelines делает запрос на
+        каждую подписку, здесь же ленты сливаются в памяти из уже
+        известных записей: порядок записей совпадает с (pub_date, id).
+        """
+        by_author = [array('l') for _ in self.user_ids]
+        for number, author in enumerate(self.post_authors):
+            by_author[author].append(number)
+        limit = timeline.fanout_limit()
+        length = timeline.timeline_length()
+        quote = connection.ops.quote_name
+        sql = (
+            f'INSERT INTO {quote(TimelineEntry._meta.db_table)} '
+            f'(user_id, post_id, pub_date) VALUES (%s, %s, %s)'
+        )
+        adapt = connection.ops.adapt_datetimefield_value
+        dates = [adapt(to_datetime(moment)) for moment in self.post_times]
+
+        def insert(rows):
+            with transaction.atomic(), connection.cursor() as cursor:
+                cursor.executemany(sql, rows)
+
+        rows = []
+        for reader, authors in enumerate(self.following):
+            sources = [reversed(by_author[author]) for author in authors
+                       if self.followers[author] <= limit]
+            user_id = self.user_ids[reader]
+            rows.extend(
+                (user_id, self.post_ids[number], dates[number])
+                for number in islice(heapq.merge(*sources, reverse=True),
+                                     length)
+            )
+            if len(rows) >= self.batch_size:
+                insert(rows)
+                rows = []
+        if rows:
+            insert(rows)
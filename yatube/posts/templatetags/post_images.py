@@ -0,0 +1,24 @@
+from django import template
+
+from ..thumbnails import enqueue, get_sources, post_thumbnail
+
+register = template.Library()
+
+
+@register.inclusion_tag('posts/includes/post_image.html')
+def post_image(post):
+    """
+    Миниатюра картинки записи с источниками WebP/AVIF. Если миниатюра
+    ещё не готова, выводит заглушку и ставит её создание в очередь пула
+    процессов; сам шаблон картинку не масштабирует.
+    """
+    if not post.image:
+        return {}
+    thumbnail = post_thumbnail(post)
+    if thumbnail is None:
+        enqueue(post.image.name)
+    return {
+        'thumbnail': thumbnail,
+        'placeholder': thumbnail is None,
+        'sources': get_sources(post) if thumbnail else [],
+    }
@@ -0,0 +1,122 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post, User, UserCounters
+
+
+class CountersTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Test Group',
+            slug='testslug',
+            description='Группа для тестов'
+        )
+        cls.group_2 = Group.objects.create(
+            title='Test Group 2',
+            slug='testslug2',
+            description='Группа для тестов'
+        )
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def counters(self, user):
+        return UserCounters.objects.get(user=user)
+
+    def test_post_counters(self):
+        """Создание, перенос и удаление записи меняют счётчики."""
+        post = Post.objects.create(text='Пост', author=CountersTests.author,
+                                   group=CountersTests.group)
+        self.assertEqual(self.counters(CountersTests.author).posts_count, 1)
+        CountersTests.group.refresh_from_db()
+        self.assertEqual(CountersTests.group.posts_count, 1)
+        post.group = CountersTests.group_2
+        post.save()
+        CountersTests.group.refresh_from_db()
+        CountersTests.group_2.refresh_from_db()
+        self.assertEqual(CountersTests.group.posts_count, 0)
+        self.assertEqual(CountersTests.group_2.posts_count, 1)
+        post.delete()
+        CountersTests.group_2.refresh_from_db()
+        self.assertEqual(CountersTests.group_2.posts_count, 0)
+        self.assertEqual(self.counters(CountersTests.author).posts_count, 0)
+
+    def test_comment_and_follow_counters(self):
+        post = Post.objects.create(text='Пост', author=CountersTests.author)
+        Comment.objects.create(post=post, author=CountersTests.reader,
+                               text='Комментарий')
+        Follow.objects.create(user=CountersTests.reader,
+                              author=CountersTests.author)
+        reader = self.counters(CountersTests.reader)
+        self.assertEqual(reader.comments_count, 1)
+        self.assertEqual(reader.following_count, 1)
+        self.assertEqual(
+            self.counters(CountersTests.author).followers_count, 1)
+        Follow.objects.filter(user=CountersTests.reader).delete()
+        self.assertEqual(
+            self.counters(CountersTests.author).followers_count, 0)
+        self.assertEqual(
+            self.counters(CountersTests.reader).following_count, 0)
+
+    def test_missing_counters_are_rebuilt(self):
+        """Пропавшая строка счётчиков восстанавливается по базе."""
+        Post.objects.create(text='Пост', author=CountersTests.author)
+        UserCounters.objects.filter(user=CountersTests.author).delete()
+        Post.objects.create(text='Пост 2', author=CountersTests.author)
+        self.assertEqual(self.counters(CountersTests.author).posts_count, 2)
+
+    def test_rebuild_command(self):
+        Post.objects.create(text='Пост', author=CountersTests.author,
+                            group=CountersTests.group)
+        UserCounters.objects.all().update(posts_count=100)
+        Group.objects.all().update(posts_count=100)
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(self.counters(CountersTests.author).posts_count, 1)
+        self.assertEqual(self.counters(CountersTests.reader).posts_count, 0)
+        CountersTests.group.refresh_from_db()
+        self.assertEqual(CountersTests.group.posts_count, 1)
+
+    def test_deferred_owner_is_not_loaded(self):
+        """.only() без автора и группы не даёт запроса на каждую строку."""
+        for number in range(3):
+            Post.objects.create(text=f'Пост {number}',
+                                author=CountersTests.author)
+        with self.assertNumQueries(1):
+            posts = list(Post.objects.only('id', 'text'))
+        self.assertEqual(len(posts), 3)
+
+    def test_deferred_owner_change(self):
+        """Смена отложенных автора и группы переносит счётчики."""
+        post = Post.objects.create(text='Пост', author=CountersTests.author,
+                                   group=CountersTests.group)
+        post = Post.objects.only('id', 'text').get(pk=post.pk)
+        post.author = CountersTests.reader
+        post.group = CountersTests.group_2
+        post.save()
+        self.assertEqual(self.counters(CountersTests.author).posts_count, 0)
+        self.assertEqual(self.counters(CountersTests.reader).posts_count, 1)
+        CountersTests.group.refresh_from_db()
+        CountersTests.group_2.refresh_from_db()
+        self.assertEqual(CountersTests.group.posts_count, 0)
+        self.assertEqual(CountersTests.group_2.posts_count, 1)
+
+    def test_profile_shows_counter(self):
+        Post.objects.create(text='Пост', author=CountersTests.author)
+        response = Client().get(
+            reverse('posts:profile', kwargs={'username': 'author'}))
+        self.assertContains(response, 'Всего постов: 1')
+
+    def test_user_delete(self):
+        """Удаление пользователя не пересоздаёт его счётчики."""
+        user = User.objects.create_user(username='temporary')
+        Post.objects.create(text='Пост', author=user)
+        Follow.objects.create(user=user, author=CountersTests.author)
+        user.delete()
+        self.assertFalse(UserCounters.objects.filter(user_id=user.pk)
+                         .exists())
+        self.assertEqual(
+            self.counters(CountersTests.author).followers_count, 0)
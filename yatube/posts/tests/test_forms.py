@@ -1,12 +1,15 @@
 import shutil
 import tempfile
+from io import StringIO
 
 from django.conf import settings
+from django.core.management import call_command
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 
-from ..models import Group, Post, User
+from ..forms import CommentForm, PostForm
+from ..models import Comment, Group, Post, User
 from ..views import clear_posts_cache
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
@@ -119,3 +122,70 @@ class PostsCreateFormTests(TestCase):
                          PostsCreateFormTests.group_2)
         self.assertEqual(Post.objects.first().image,
                          'posts/' + PostsCreateFormTests.uploaded_new.name)
+
+
+class TextHtmlTests(TestCase):
+    """HTML текста рендерится при сохранении формы, а не в шаблоне."""
+
+    TEXT = '<b>Первая</b> строка\nвторая'
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    def test_forms_render_text_html(self):
+        form = PostForm(data={'text': self.TEXT})
+        self.assertTrue(form.is_valid())
+        form.instance.author = self.author
+        post = form.save()
+        post.refresh_from_db()
+        self.assertEqual(post.text_html,
+                         '&lt;b&gt;Первая&lt;/b&gt; строка<br>вторая')
+        form = CommentForm(data={'text': self.TEXT})
+        self.assertTrue(form.is_valid())
+        comment = form.save(commit=False)
+        comment.author = self.author
+        comment.post = post
+        comment.save()
+        comment.refresh_from_db()
+        self.assertEqual(comment.text_html,
+                         '&lt;b&gt;Первая&lt;/b&gt; строка\nвторая')
+
+    def test_body_without_text_html(self):
+        post = Post(text=self.TEXT, author=self.author)
+        self.assertEqual(post.body,
+                         '&lt;b&gt;Первая&lt;/b&gt; строка<br>вторая')
+
+    def test_orm_save_renders_text_html(self):
+        """Правка текста через ORM обновляет text_html."""
+        post = Post.objects.create(text='Старый текст', author=self.author)
+        post = Post.objects.get(pk=post.pk)
+        post.text = self.TEXT
+        post.save()
+        comment = Comment.objects.create(post=post, author=self.author,
+                                         text='Старый')
+        comment.text = self.TEXT
+        comment.save(update_fields=['text'])
+        post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(post.text_html,
+                         '&lt;b&gt;Первая&lt;/b&gt; строка<br>вторая')
+        self.assertEqual(comment.text_html,
+                         '&lt;b&gt;Первая&lt;/b&gt; строка\nвторая')
+
+    def test_command_fills_text_html(self):
+        post = Post.objects.create(text=self.TEXT, author=self.author)
+        comment = Comment.objects.create(post=post, author=self.author,
+                                         text=self.TEXT)
+        Post.objects.update(text_html='')
+        Comment.objects.update(text_html='')
+        post.refresh_from_db()
+        updated = post.updated
+        call_command('render_text_html', batch_size=1, stdout=StringIO())
+        post.refresh_from_db()
+        comment.refresh_from_db()
+        self.assertEqual(post.text_html, post.body)
+        self.assertIn('<br>', post.text_html)
+        self.assertEqual(comment.text_html, comment.body)
+        self.assertEqual(post.updated, updated)
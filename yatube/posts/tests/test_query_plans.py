@@ -0,0 +1,76 @@
+from unittest import skipUnless
+
+from django.db import connection
+from django.test import Client, TestCase
+from django.urls import reverse
+
+from core.testing import CaptureQueryPlans, is_full_scan_with_sort
+
+from ..models import Comment, Follow, Group, Post, User
+from ..views import clear_posts_cache
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN из SQLite')
+class FeedQueryPlanTests(TestCase):
+    """Запросы лент используют индексы, а не полный просмотр таблиц."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.group = Group.objects.create(
+            title='Test Group',
+            slug='testslug',
+            description='Группа для тестов'
+        )
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        Post.objects.bulk_create(
+            Post(text=f'Тестовый пост №{i}', author=cls.author,
+                 group=cls.group)
+            for i in range(25)
+        )
+        cls.post = Post.objects.first()
+        for i in range(25):
+            Comment.objects.create(post=cls.post, author=cls.reader,
+                                   text=f'Комментарий №{i}')
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': cls.author.username}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(FeedQueryPlanTests.reader)
+        clear_posts_cache()
+
+    def assertIndexedPlans(self, url, params=None):
+        with CaptureQueryPlans() as captured:
+            response = self.client.get(url, params)
+        for sql, plan in captured.plans:
+            for table in ('posts_post', 'posts_comment'):
+                with self.subTest(url=url, sql=sql):
+                    self.assertFalse(
+                        is_full_scan_with_sort(plan, table),
+                        f'Полный просмотр {table} с сортировкой: {plan}'
+                    )
+        return response
+
+    def test_feed_query_plans(self):
+        for url in FeedQueryPlanTests.urls:
+            response = self.assertIndexedPlans(url)
+            page_obj = response.context.get('page_obj')
+            if page_obj is not None and page_obj.next_cursor:
+                self.assertIndexedPlans(url, {'cursor': page_obj.next_cursor})
+
+    def test_comment_query_plans(self):
+        response = self.assertIndexedPlans(FeedQueryPlanTests.urls[-1])
+        self.assertIndexedPlans(
+            reverse('posts:post_comments',
+                    kwargs={'post_id': FeedQueryPlanTests.post.pk}),
+            {'cursor': response.context['comments'].next_cursor},
+        )
@@ -0,0 +1,106 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from ..models import Post, User
+from ..search import get_backend, parse_query, search_posts
+
+
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    def setUp(self):
+        self.client = Client()
+
+    def found(self, query):
+        return [post.text for post in search_posts(query, per_page=100)]
+
+    def test_index_follows_save_and_delete(self):
+        """Индекс обновляется при создании, правке и удалении записи."""
+        post = Post.objects.create(text='Про Котов и собак',
+                                   author=SearchTests.author)
+        self.assertEqual(self.found('коты котов'), [])
+        self.assertEqual(self.found('котов'), ['Про Котов и собак'])
+        post.text = 'Про птиц'
+        post.save()
+        self.assertEqual(self.found('котов'), [])
+        self.assertEqual(self.found('ПТИЦ'), ['Про птиц'])
+        post.delete()
+        self.assertEqual(self.found('птиц'), [])
+
+    def test_results_ranked_by_relevance(self):
+        Post.objects.create(text='чай и кофе', author=SearchTests.author)
+        Post.objects.create(text='чай, чай, чай', author=SearchTests.author)
+        self.assertEqual(self.found('чай'), ['чай, чай, чай', 'чай и кофе'])
+
+    def test_query_syntax_is_not_interpreted(self):
+        Post.objects.create(text='OR NEAR текст', author=SearchTests.author)
+        self.assertEqual(parse_query('"OR" NEAR(текст*'),
+                         ['or', 'near', 'текст'])
+        self.assertEqual(self.found('"OR" NEAR(текст*'), ['OR NEAR текст'])
+        self.assertEqual(self.found('***'), [])
+
+    def test_search_view_cursor_pagination(self):
+        Post.objects.bulk_create(
+            Post(text=f'запись номер {number}', author=SearchTests.author)
+            for number in range(15)
+        )
+        call_command('rebuild_search_index', stdout=StringIO())
+        url = reverse('posts:search')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'q': 'запись'})
+        first = response.context['page_obj']
+        self.assertEqual(len(first), 10)
+        self.assertTrue(first.has_next())
+        response = self.client.get(
+            url, {'q': 'запись', 'cursor': first.next_cursor})
+        second = response.context['page_obj']
+        self.assertEqual(second.number, 2)
+        self.assertEqual(len(second), 5)
+        self.assertFalse(second.has_next())
+        self.assertFalse(
+            {post.pk for post in first} & {post.pk for post in second})
+
+    @override_settings(POSTS_SEARCH_WINDOW=12)
+    def test_truncated_window_is_shown_and_kept_between_pages(self):
+        """
+        Страница сообщает, что ранжированы не все совпадения, а новые
+        записи не сдвигают окно следующих страниц.
+        """
+        posts = [Post.objects.create(text=f'окно {number}',
+                                     author=SearchTests.author)
+                 for number in range(14)]
+        url = reverse('posts:search')
+        with self.assertNumQueries(2):
+            response = self.client.get(url, {'q': 'окно'})
+        first = response.context['page_obj']
+        self.assertTrue(first.truncated)
+        self.assertContains(response, 'Совпадений слишком много')
+        Post.objects.create(text='окно новое', author=SearchTests.author)
+        response = self.client.get(
+            url, {'q': 'окно', 'cursor': first.next_cursor})
+        second = response.context['page_obj']
+        self.assertTrue(second.truncated)
+        self.assertEqual(
+            {post.pk for post in first} | {post.pk for post in second},
+            {post.pk for post in posts[2:]})
+
+    def test_full_window_is_not_truncated(self):
+        Post.objects.create(text='одно совпадение', author=SearchTests.author)
+        response = self.client.get(reverse('posts:search'),
+                                   {'q': 'совпадение'})
+        self.assertFalse(response.context['page_obj'].truncated)
+        self.assertNotContains(response, 'Совпадений слишком много')
+
+    def test_rebuild_indexes_bulk_created_posts(self):
+        Post.objects.bulk_create(
+            [Post(text='без сигналов', author=SearchTests.author)])
+        self.assertEqual(self.found('сигналов'), [])
+        get_backend().clear()
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self.found('сигналов'), ['без сигналов'])
@@ -0,0 +1,96 @@
+import shutil
+import tempfile
+from io import StringIO
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db.models import F
+from django.test import TestCase, override_settings
+
+from ..models import Comment, Follow, Group, Post, TimelineEntry, User
+from ..rendering import render_text
+from ..search import search_posts
+from ..timeline import rebuild_timelines
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, TIMELINE_LENGTH=20,
+                   TIMELINE_FANOUT_LIMIT=5)
+class GenerateDataTests(TestCase):
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def generate(self, seed=1):
+        call_command('generate_data', users=30, groups=3, posts=300,
+                     follows_per_user=4, comments_per_post=2,
+                     image_share=0.2, seed=seed, stdout=StringIO())
+
+    def snapshot(self):
+        """Данные без id: номера пользователей берутся из username."""
+        def number(username):
+            return username.rsplit('_', 1)[1]
+
+        posts = Post.objects.order_by('pk').values_list(
+            'author__username', 'group__title', 'text', 'image',
+            'pub_date')
+        comments = Comment.objects.order_by('pk').values_list(
+            'author__username', 'post__text', 'text', 'created')
+        follows = Follow.objects.order_by('pk').values_list(
+            'user__username', 'author__username')
+        return (
+            [(number(author), *rest) for author, *rest in posts],
+            [(number(author), *rest) for author, *rest in comments],
+            [(number(user), number(author)) for user, author in follows],
+        )
+
+    def clear(self):
+        User.objects.all().delete()
+        Group.objects.all().delete()
+
+    def test_same_seed_same_data(self):
+        self.generate()
+        first = self.snapshot()
+        self.clear()
+        self.generate()
+        self.assertEqual(self.snapshot(), first)
+        self.clear()
+        self.generate(seed=2)
+        self.assertNotEqual(self.snapshot(), first)
+
+    def test_generated_rows(self):
+        self.generate()
+        self.assertEqual(User.objects.count(), 30)
+        self.assertEqual(Group.objects.count(), 3)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertTrue(Comment.objects.exists())
+        self.assertTrue(Post.objects.exclude(image='').exists())
+        self.assertTrue(Post.objects.exclude(group=None).exists())
+        self.assertFalse(Follow.objects.filter(user=F('author')).exists())
+
+    def test_posts_are_in_publication_order(self):
+        self.generate()
+        dates = list(Post.objects.order_by('pk')
+                     .values_list('pub_date', flat=True))
+        self.assertEqual(dates, sorted(dates))
+        for comment in Comment.objects.select_related('post'):
+            self.assertGreaterEqual(comment.created, comment.post.pub_date)
+
+    def test_derived_data(self):
+        """Счётчики, HTML, поиск и ленты как после обычной публикации."""
+        self.generate()
+        user = User.objects.order_by('pk').first()
+        self.assertEqual(user.counters.posts_count,
+                         Post.objects.filter(author=user).count())
+        post = Post.objects.order_by('-pk').first()
+        self.assertEqual(post.text_html, render_text('Post', post.text))
+        word = post.text.split()[0].strip('.,')
+        self.assertTrue(search_posts(word).object_list)
+        entries = set(TimelineEntry.objects.values_list(
+            'user_id', 'post_id', 'pub_date'))
+        self.assertTrue(entries)
+        rebuild_timelines()
+        self.assertEqual(set(TimelineEntry.objects.values_list(
+            'user_id', 'post_id', 'pub_date')), entries)
@@ -0,0 +1,216 @@
+import json
+import shutil
+import tempfile
+from concurrent.futures import Future
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from core.metrics import render
+
+from ..models import Post, User
+from ..thumbnails import (ThumbnailCache, _finished, generate,
+                          get_cached_thumbnail, post_thumbnail,
+                          prefetch_thumbnails, thumbnail_cache,
+                          variant_formats)
+from ..views import clear_posts_cache
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+def make_image(name='picture.png', size=(50, 30)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color=(200, 0, 0)).save(buffer, 'png')
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type='image/png')
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT, THUMBNAIL_WORKERS=0,
+                   POST_IMAGE_WIDTHS=(480, 960))
+class ThumbnailTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(ThumbnailTests.author)
+        clear_posts_cache()
+        thumbnail_cache.clear()
+
+    def test_thumbnail_created_on_form_save(self):
+        """Миниатюра готова сразу после сохранения формы."""
+        self.client.post(reverse('posts:post_create'),
+                         {'text': 'С картинкой', 'image': make_image()})
+        post = Post.objects.get(text='С картинкой')
+        thumbnail = get_cached_thumbnail(post.image.name)
+        self.assertIsNotNone(thumbnail)
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, thumbnail.url)
+
+    def test_render_does_not_resize(self):
+        """Без готовой миниатюры выводится заглушка."""
+        post = Post.objects.create(text='Без миниатюры',
+                                   author=ThumbnailTests.author,
+                                   image='posts/missing.png')
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        self.assertIsNone(post_thumbnail(post))
+
+    def test_render_only_enqueues(self):
+        """Вывод записи из ORM не создаёт миниатюру, а ставит в очередь."""
+        post = Post.objects.create(text='Из ORM', author=ThumbnailTests.author,
+                                   image=make_image('orm.png'))
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        with mock.patch('posts.thumbnails.process') as process:
+            response = self.client.get(url)
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        process.assert_not_called()
+        clear_posts_cache()
+        executor = mock.Mock()
+        with override_settings(THUMBNAIL_WORKERS=2), \
+                mock.patch('posts.thumbnails.get_executor',
+                           return_value=executor):
+            self.client.get(url)
+        executor.submit.assert_called_once_with(mock.ANY, post.image.name)
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants, '')
+
+    def test_orm_image_change_resets_variants(self):
+        """Смена картинки через ORM делает миниатюру неготовой."""
+        self.client.post(reverse('posts:post_create'),
+                         {'text': 'Из формы', 'image': make_image()})
+        post = Post.objects.get(text='Из формы')
+        self.assertIsNotNone(post_thumbnail(post))
+        post.image = 'posts/other.png'
+        post.save(update_fields=['image'])
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants, '')
+        self.assertIsNone(post_thumbnail(post))
+
+    @override_settings(PAGE_CACHE_ENABLED=True)
+    def test_finished_thumbnail_purges_pages(self):
+        """Готовая миниатюра из пула сбрасывает страницы записи."""
+        post = Post.objects.create(text='Из пула',
+                                   author=ThumbnailTests.author,
+                                   image=make_image('pool.png'))
+        future = Future()
+        future.set_result(generate(post.image.name))
+        guest = Client()
+        urls = (reverse('posts:index'),
+                reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        for url in urls:
+            guest.get(url)
+        _finished(post.image.name, future)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertIsNotNone(guest.get(url).context)
+
+    def test_variants_stored_on_post(self):
+        """Копии для srcset создаются один раз и не шире оригинала."""
+        self.client.post(reverse('posts:post_create'), {
+            'text': 'Широкая', 'image': make_image(size=(600, 400)),
+        })
+        post = Post.objects.get(text='Широкая')
+        variants = json.loads(post.image_variants)
+        self.assertIn('webp', variant_formats())
+        self.assertEqual(
+            sorted((variant['type'], variant['width'], variant['height'])
+                   for variant in variants),
+            sorted((f'image/{ext}', 480, 170) for ext in variant_formats()),
+        )
+        for variant in variants:
+            with post.image.storage.open(variant['name']) as file:
+                self.assertEqual(Image.open(file).size, (480, 170))
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, '_480w.webp 480w')
+
+    def test_variants_reset_on_image_change(self):
+        """Новая картинка получает свои копии вместо старых."""
+        self.client.post(reverse('posts:post_create'),
+                         {'text': 'Меняем', 'image': make_image()})
+        post = Post.objects.get(text='Меняем')
+        old_variants = post.image_variants
+        self.client.post(
+            reverse('posts:post_edit', kwargs={'post_id': post.pk}),
+            {'text': 'Меняем', 'image': make_image('other.png')},
+        )
+        post.refresh_from_db()
+        self.assertNotEqual(post.image_variants, old_variants)
+        self.assertIn('other', post.image_variants)
+
+    def test_lru_cache_hits_on_repeated_render(self):
+        """Повторный вывод миниатюры берётся из LRU-кеша процесса."""
+        self.client.post(reverse('posts:post_create'),
+                         {'text': 'Кешируем', 'image': make_image()})
+        post = Post.objects.get(text='Кешируем')
+        first = get_cached_thumbnail(post.image.name)
+        hits = thumbnail_cache.stats()['hits']
+        self.assertEqual(get_cached_thumbnail(post.image.name), first)
+        self.assertEqual(thumbnail_cache.stats()['hits'], hits + 1)
+
+    def test_prefetch_reads_page_thumbnails_at_once(self):
+        """Миниатюры страницы читаются из общего кеша без запросов."""
+        for number in range(3):
+            self.client.post(reverse('posts:post_create'), {
+                'text': f'Страница {number}',
+                'image': make_image(f'page{number}.png'),
+            })
+        posts = list(Post.objects.filter(text__startswith='Страница'))
+        thumbnail_cache.clear()
+        with self.assertNumQueries(0):
+            self.assertEqual(prefetch_thumbnails(posts), posts)
+        self.assertEqual(thumbnail_cache.stats()['size'], 3)
+        with self.assertNumQueries(0):
+            for post in posts:
+                self.assertIsNotNone(get_cached_thumbnail(post.image.name))
+
+    def test_lru_cache_evicted_on_image_change(self):
+        """Смена картинки записи убирает её миниатюры из LRU-кеша."""
+        self.client.post(reverse('posts:post_create'),
+                         {'text': 'Сменим', 'image': make_image()})
+        post = Post.objects.get(text='Сменим')
+        old_name = post.image.name
+        get_cached_thumbnail(old_name)
+        self.assertEqual(thumbnail_cache.stats()['size'], 1)
+        post.image = 'posts/other.png'
+        post.save()
+        self.assertEqual(thumbnail_cache.stats()['size'], 0)
+
+    def test_lru_cache_stats_in_metrics(self):
+        """Статистика LRU-кеша миниатюр отдаётся в /metrics/."""
+        thumbnail_cache.set(('picture',), 'thumbnail')
+        thumbnail_cache.get(('picture',))
+        thumbnail_cache.get(('other',))
+        text = render()
+        for line in (
+            '# TYPE yatube_thumbnail_cache_hits_total counter',
+            'yatube_thumbnail_cache_hits_total 1',
+            'yatube_thumbnail_cache_misses_total 1',
+            'yatube_thumbnail_cache_size 1',
+        ):
+            self.assertIn(line, text)
+
+    def test_lru_cache_is_bounded(self):
+        cache = ThumbnailCache(maxsize=2)
+        for key in 'abc':
+            cache.set((key,), key)
+        self.assertIsNone(cache.get(('a',)))
+        self.assertEqual(cache.get(('c',)), 'c')
+        self.assertEqual(cache.stats()['size'], 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
@@ -0,0 +1,156 @@
+from django.test import Client, TestCase, override_settings
+from django.urls import reverse
+
+from .. import cache as feed_cache
+from .. import timeline
+from ..models import Follow, Post, TimelineEntry, User, UserCounters
+from ..views import clear_posts_cache
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.writer = User.objects.create_user(username='writer')
+        cls.other = User.objects.create_user(username='other')
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(TimelineTests.reader)
+        clear_posts_cache()
+
+    def timeline(self):
+        return list(
+            TimelineEntry.objects.filter(user=TimelineTests.reader)
+            .values_list('post__text', flat=True)
+        )
+
+    def test_new_post_is_pushed_to_followers(self):
+        Follow.objects.create(user=TimelineTests.reader,
+                              author=TimelineTests.writer)
+        Post.objects.create(text='Новая запись', author=TimelineTests.writer)
+        Post.objects.create(text='Чужая запись', author=TimelineTests.other)
+        self.assertEqual(self.timeline(), ['Новая запись'])
+
+    def test_follow_backfills_and_unfollow_prunes(self):
+        Post.objects.create(text='Старая запись', author=TimelineTests.writer)
+        self.client.get(reverse('posts:profile_follow',
+                                kwargs={'username': 'writer'}))
+        self.assertEqual(self.timeline(), ['Старая запись'])
+        self.client.get(reverse('posts:profile_unfollow',
+                                kwargs={'username': 'writer'}))
+        self.assertEqual(self.timeline(), [])
+
+    @override_settings(TIMELINE_LENGTH=3)
+    def test_timeline_is_bounded(self):
+        Follow.objects.create(user=TimelineTests.reader,
+                              author=TimelineTests.writer)
+        for i in range(5):
+            Post.objects.create(text=f'Запись №{i}',
+                                author=TimelineTests.writer)
+        self.assertEqual(self.timeline(),
+                         ['Запись №4', 'Запись №3', 'Запись №2'])
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_fanout_queries_do_not_grow_with_followers(self):
+        """Раздача и обрезка лент не делают запросов на подписчика."""
+        followers = [User.objects.create_user(username=f'follower{i}')
+                     for i in range(5)]
+        for follower in followers:
+            Follow.objects.create(user=follower, author=TimelineTests.writer)
+        posts = [Post.objects.create(text=f'Запись №{i}',
+                                     author=TimelineTests.writer)
+                 for i in range(3)]
+        # Число подписчиков автора, длины лент, вставка, удаление самых
+        # старых записей и длины переполненных лент.
+        with self.assertNumQueries(5):
+            timeline.push_post(posts[-1])
+        for follower in followers:
+            self.assertEqual(
+                list(TimelineEntry.objects.filter(user=follower)
+                     .values_list('post_id', flat=True)),
+                [posts[2].pk, posts[1].pk]
+            )
+
+    @override_settings(TIMELINE_LENGTH=2)
+    def test_timeline_count_follows_length(self):
+        Follow.objects.create(user=TimelineTests.reader,
+                              author=TimelineTests.writer)
+        Follow.objects.create(user=TimelineTests.reader,
+                              author=TimelineTests.other)
+        counters = UserCounters.objects.filter(user=TimelineTests.reader)
+        steps = (
+            lambda: [Post.objects.create(text=f'Запись №{i}',
+                                         author=TimelineTests.writer)
+                     for i in range(3)],
+            lambda: Post.objects.filter(text='Запись №2').delete(),
+            lambda: Post.objects.create(text='Чужая запись',
+                                        author=TimelineTests.other),
+            lambda: Follow.objects.filter(
+                author=TimelineTests.other).delete(),
+        )
+        for length, step in zip((2, 1, 2, 1), steps):
+            step()
+            self.assertEqual(len(self.timeline()), length)
+            self.assertEqual(
+                counters.values_list('timeline_count', flat=True).get(),
+                length)
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=1)
+    def test_fanout_restored_below_limit(self):
+        """Записи, написанные без раздачи, попадают в ленты позже."""
+        Follow.objects.create(user=TimelineTests.reader,
+                              author=TimelineTests.writer)
+        Follow.objects.create(user=TimelineTests.other,
+                              author=TimelineTests.writer)
+        Post.objects.create(text='Без раздачи', author=TimelineTests.writer)
+        self.assertEqual(self.timeline(), [])
+        Follow.objects.filter(user=TimelineTests.other).delete()
+        self.assertEqual(self.timeline(), ['Без раздачи'])
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Без раздачи')
+
+    def test_edit_bumps_author_not_followers(self):
+        """Правка записи сбрасывает ленты подписок областью автора."""
+        Follow.objects.create(user=TimelineTests.reader,
+                              author=TimelineTests.writer)
+        post = Post.objects.create(text='Старый текст',
+                                   author=TimelineTests.writer)
+        self.client.get(reverse('posts:follow_index'))
+        follower = f'follower:{TimelineTests.reader.pk}'
+        before = feed_cache.get_versions(follower)
+        post.text = 'Новый текст'
+        post.save()
+        self.assertEqual(feed_cache.get_versions(follower), before)
+        self.assertContains(self.client.get(reverse('posts:follow_index')),
+                            'Новый текст')
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_popular_author_is_read_on_request(self):
+        """Записи популярных авторов подмешиваются при чтении."""
+        Follow.objects.create(user=TimelineTests.reader,
+                              author=TimelineTests.writer)
+        Post.objects.create(text='Запись звезды', author=TimelineTests.writer)
+        self.assertEqual(self.timeline(), [])
+        response = self.client.get(reverse('posts:follow_index'))
+        self.assertEqual(
+            [post.text for post in response.context['page_obj']],
+            ['Запись звезды']
+        )
+
+    def test_follow_index_reads_timeline(self):
+        Follow.objects.create(user=TimelineTests.reader,
+                              author=TimelineTests.writer)
+        posts = [
+            Post.objects.create(text=f'Запись №{i}',
+                                author=TimelineTests.writer)
+            for i in range(13)
+        ]
+        response = self.client.get(reverse('posts:follow_index'))
+        page_obj = response.context['page_obj']
+        self.assertEqual(list(page_obj), posts[:-11:-1])
+        response = self.client.get(reverse('posts:follow_index'),
+                                   {'cursor': page_obj.next_cursor})
+        self.assertEqual(list(response.context['page_obj']),
+                         posts[2::-1])
@@ -26,6 +26,7 @@ class PostsURLTests(TestCase):
             f'/group/{cls.group.slug}/': 'posts/group_list.html',
             f'/profile/{cls.author.username}/': 'posts/profile.html',
             f'/posts/{cls.post.pk}/': 'posts/post_detail.html',
+            '/search/?q=пост': 'posts/search.html',
         }
         cls.author_urls = {
             f'/posts/{cls.post.pk}/edit/': 'posts/create_post.html',
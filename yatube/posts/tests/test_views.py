@@ -1,16 +1,25 @@
 import datetime
 import shutil
 import tempfile
+from http import HTTPStatus
+from unittest import mock, skipUnless
 
 from django import forms
 from django.conf import settings
+from django.core.cache import cache
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
+from .. import cache as feed_cache
 from ..forms import CommentForm, PostForm
-from ..models import Comment, Follow, Group, Post, User
+from ..models import (Comment, Follow, Group, Post, User,
+                      UserCounters)
+from ..thumbnails import CachedThumbnail
 from ..views import clear_posts_cache
+from core.testing import QueryBudgetMixin
 
 TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
@@ -35,6 +44,7 @@ class PostCacheTest(TestCase):
 
     def setUp(self):
         self.guest_client = Client()
+        clear_posts_cache()
 
     def test_index_cache(self):
         post = Post.objects.create(
@@ -42,9 +52,175 @@ class PostCacheTest(TestCase):
             author=PostCacheTest.author,
         )
         response1 = self.guest_client.get(reverse('posts:index'))
-        Post.objects.filter(pk=post.pk).delete()
+        # update() не посылает сигналов: лента остаётся в кеше.
+        Post.objects.filter(pk=post.pk).update(text='Без сигналов')
         response2 = self.guest_client.get(reverse('posts:index'))
         self.assertEqual(response1.content, response2.content)
+        # Удаление сбрасывает ленты с записью.
+        Post.objects.filter(pk=post.pk).delete()
+        response3 = self.guest_client.get(reverse('posts:index'))
+        self.assertNotContains(response3, 'Тестовый пост')
+
+    def test_index_cache_per_page(self):
+        """Каждая страница ленты кешируется отдельно."""
+        Post.objects.bulk_create(
+            Post(text=f'Пост №{i}', author=PostCacheTest.author)
+            for i in range(15)
+        )
+        clear_posts_cache()
+        first = self.guest_client.get(reverse('posts:index'))
+        second = self.guest_client.get(
+            reverse('posts:index'),
+            {'cursor': first.context['page_obj'].next_cursor}
+        )
+        self.assertNotEqual(first.content, second.content)
+        self.assertContains(second, 'Пост №0')
+        self.assertNotContains(first, 'Пост №0<')
+
+    def test_follow_cache_per_user(self):
+        """Лента подписок одного пользователя не видна другому."""
+        reader = User.objects.create_user(username='reader')
+        stranger = User.objects.create_user(username='stranger')
+        Post.objects.create(text='Пост для подписчиков',
+                            author=PostCacheTest.author)
+        Follow.objects.create(user=reader, author=PostCacheTest.author)
+        self.guest_client.force_login(reader)
+        response = self.guest_client.get(reverse('posts:follow_index'))
+        self.assertContains(response, 'Пост для подписчиков')
+        self.guest_client.force_login(stranger)
+        response = self.guest_client.get(reverse('posts:follow_index'))
+        self.assertNotContains(response, 'Пост для подписчиков')
+
+    def test_post_create_invalidates_feeds(self):
+        """Новая запись сразу появляется в ленте."""
+        self.guest_client.get(reverse('posts:index'))
+        self.guest_client.force_login(PostCacheTest.author)
+        self.guest_client.post(reverse('posts:post_create'),
+                               {'text': 'Свежая запись'})
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Свежая запись')
+
+    def test_cached_feed_skips_page_query(self):
+        """Страница ленты из кеша фрагмента не выбирается из базы."""
+        Post.objects.create(text='Тестовый пост', author=self.author)
+        self.guest_client.force_login(PostCacheTest.author)
+        self.guest_client.get(reverse('posts:index'))
+        with CaptureQueriesContext(connection) as captured:
+            response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Тестовый пост')
+        self.assertFalse(any('"posts_post"."text"' in query['sql']
+                             for query in captured.captured_queries))
+
+    def test_new_post_keeps_other_follow_feeds(self):
+        """Новая запись сбрасывает ленты подписок только подписчиков."""
+        reader = User.objects.create_user(username='reader')
+        stranger = User.objects.create_user(username='stranger')
+        Follow.objects.create(user=reader, author=PostCacheTest.author)
+        keys = {}
+        for user in (reader, stranger):
+            self.guest_client.force_login(user)
+            response = self.guest_client.get(reverse('posts:follow_index'))
+            keys[user] = response.context['feed_cache_key']
+        self.guest_client.force_login(PostCacheTest.author)
+        self.guest_client.post(reverse('posts:post_create'),
+                               {'text': 'Свежая запись'})
+        for user, changed in ((reader, True), (stranger, False)):
+            self.guest_client.force_login(user)
+            response = self.guest_client.get(reverse('posts:follow_index'))
+            self.assertEqual(
+                response.context['feed_cache_key'] != keys[user], changed)
+
+    def test_post_card_is_shared_between_pages(self):
+        """Карточка записи рендерится один раз для всех лент."""
+        post = Post.objects.create(text='Карточка', author=self.author)
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=post.pk).update(text='Не из кеша')
+        response = self.guest_client.get(
+            reverse('posts:profile', kwargs={'username': 'author'}))
+        self.assertContains(response, 'Карточка')
+
+    def test_card_shows_renamed_author_and_group(self):
+        """Правка автора и группы видна в уже закешированной карточке."""
+        group = Group.objects.create(title='Старая группа', slug='renamed')
+        Post.objects.create(text='Карточка', author=self.author, group=group)
+        urls = (reverse('posts:profile', kwargs={'username': 'author'}),
+                reverse('posts:group_list', kwargs={'slug': 'renamed'}))
+        for url in urls:
+            self.guest_client.get(url)
+        self.author.first_name = 'Новое'
+        self.author.last_name = 'Имя'
+        self.author.save()
+        group.title = 'Новая группа'
+        group.save()
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, 'Новое Имя')
+                self.assertContains(response, 'Новая группа')
+
+    def test_card_shows_ready_thumbnail(self):
+        """Готовая миниатюра заменяет заглушку в закешированной карточке."""
+        post = Post.objects.create(text='Картинка', author=self.author,
+                                   image='posts/ready.png')
+        url = reverse('posts:profile', kwargs={'username': 'author'})
+        self.assertContains(self.guest_client.get(url), 'aspect-ratio')
+        Post.objects.filter(pk=post.pk).update(image_variants='[]')
+        clear_posts_cache()
+        with self.settings(THUMBNAIL_WORKERS=0), \
+                mock.patch('posts.thumbnails.get_cached_thumbnail',
+                           return_value=CachedThumbnail('/ready.png', 1, 1)):
+            response = self.guest_client.get(url)
+        self.assertContains(response, 'src="/ready.png"')
+
+    def test_post_version_rerenders_only_its_card(self):
+        edited = Post.objects.create(text='Старый текст', author=self.author)
+        other = Post.objects.create(text='Другая запись', author=self.author)
+        self.guest_client.get(reverse('posts:index'))
+        Post.objects.filter(pk=other.pk).update(text='Не из кеша')
+        edited.text = 'Новый текст'
+        edited.save()
+        clear_posts_cache(edited)
+        response = self.guest_client.get(reverse('posts:index'))
+        self.assertContains(response, 'Новый текст')
+        self.assertContains(response, 'Другая запись')
+
+    def test_orm_edit_invalidates_feeds(self):
+        """Правка записи через ORM сбрасывает и старую, и новую ленту."""
+        group = Group.objects.create(title='Группа', slug='orm-group')
+        post = Post.objects.create(text='Старый текст', author=self.author,
+                                   group=group)
+        group_url = reverse('posts:group_list', kwargs={'slug': 'orm-group'})
+        self.guest_client.get(reverse('posts:index'))
+        self.guest_client.get(group_url)
+        post.text = 'Текст из ORM'
+        post.group = None
+        post.save()
+        self.assertContains(self.guest_client.get(reverse('posts:index')),
+                            'Текст из ORM')
+        self.assertNotContains(self.guest_client.get(group_url),
+                               'Текст из ORM')
+
+    def test_invalidate_increments_versions(self):
+        """Версия области растёт и после вытеснения из кеша."""
+        first, = feed_cache.get_versions('index')[1:]
+        feed_cache.invalidate('index')
+        second, = feed_cache.get_versions('index')[1:]
+        self.assertEqual(second, first + 1)
+        cache.delete(feed_cache.VERSION_KEY.format('index'))
+        feed_cache.invalidate('index')
+        third, = feed_cache.get_versions('index')[1:]
+        self.assertNotIn(third, (first, second))
+
+    def test_login_keeps_author_feed(self):
+        """Вход автора (last_login) не сбрасывает его ленту."""
+        before = feed_cache.get_versions(f'author:{self.author.pk}')
+        self.guest_client.force_login(PostCacheTest.author)
+        self.assertEqual(
+            feed_cache.get_versions(f'author:{self.author.pk}'), before)
+        self.author.first_name = 'Новое имя'
+        self.author.save()
+        self.assertNotEqual(
+            feed_cache.get_versions(f'author:{self.author.pk}'), before)
 
 
 @override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
@@ -410,3 +586,431 @@ class PaginatorViewsTest(TestCase):
                     len(response.context['page_obj']),
                     page['posts_num']
                 )
+
+    def test_cursor_paginator(self):
+        """Курсоры ведут на соседние страницы без OFFSET."""
+        for page in PaginatorViewsTest.pages:
+            with self.subTest(url=page['url']):
+                first = self.client.get(page['url']).context['page_obj']
+                self.assertIsNone(first.previous_cursor)
+                response = self.client.get(
+                    page['url'], {'cursor': first.next_cursor})
+                second = response.context['page_obj']
+                self.assertEqual(second.number, 2)
+                self.assertEqual(len(second), page['posts_num'])
+                self.assertFalse(second.has_next())
+                self.assertTrue(
+                    set(first).isdisjoint(set(second))
+                )
+                response = self.client.get(
+                    page['url'], {'cursor': second.previous_cursor})
+                back = response.context['page_obj']
+                self.assertEqual(back.number, 1)
+                self.assertEqual(list(back), list(first))
+
+    def test_page_window_and_last_page(self):
+        """Окно номеров страниц и ссылка на последнюю страницу."""
+        response = self.client.get(reverse('posts:index'))
+        first = response.context['page_obj']
+        self.assertEqual(first.page_window, [1, 2])
+        self.assertEqual([number for number, _ in first.page_links], [1, 2])
+        self.assertEqual(first.last_number, 2)
+        self.assertContains(response, 'Последняя (2)')
+        response = self.client.get(reverse('posts:index'),
+                                   {'cursor': first.last_cursor})
+        last = response.context['page_obj']
+        self.assertEqual(last.number, 2)
+        self.assertFalse(last.has_next())
+        self.assertIsNone(last.last_cursor)
+        self.assertIn(Post.objects.order_by('pub_date', 'id').first(), last)
+
+    def test_window_links_use_keyset(self):
+        """Ссылки окна и последней страницы без OFFSET и COUNT."""
+        Post.objects.bulk_create(
+            Post(text=f'Ещё пост №{i}', author=PaginatorViewsTest.author2)
+            for i in range(28)
+        )
+        clear_posts_cache()
+        url = reverse('posts:index')
+        posts = list(Post.objects.order_by('-pub_date', '-id'))
+
+        def follow(page_obj, number):
+            cursor = dict(page_obj.page_links)[number]
+            page_obj = self.client.get(
+                url, {'cursor': cursor}).context['page_obj']
+            self.assertEqual(page_obj.number, number)
+            self.assertEqual(list(page_obj),
+                             posts[(number - 1) * 10:number * 10])
+            return page_obj
+
+        response = self.client.get(url)
+        self.assertNotContains(response, '?page=')
+        first = response.context['page_obj']
+        self.assertEqual(first.last_number, 5)
+        with CaptureQueriesContext(connection) as captured:
+            third = follow(first, 3)
+            fifth = follow(third, 5)
+            follow(fifth, 3)
+            last = self.client.get(
+                url, {'cursor': first.last_cursor}).context['page_obj']
+            self.assertEqual((last.number, list(last)), (5, posts[40:]))
+            follow(last, 4)
+        self.assertFalse(any(
+            'OFFSET' in query['sql'] or 'COUNT(' in query['sql']
+            for query in captured.captured_queries
+        ))
+
+    def test_count_is_cached_until_write(self):
+        url = reverse('posts:index')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as captured:
+            self.client.get(url)
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in captured.captured_queries))
+        Post.objects.bulk_create(
+            Post(text=f'Ещё пост №{i}', author=PaginatorViewsTest.author2)
+            for i in range(10)
+        )
+        self.client.post(reverse('posts:post_create'), {'text': 'Новый'})
+        response = self.client.get(url)
+        self.assertEqual(response.context['page_obj'].last_number, 3)
+
+    @skipUnless(connection.vendor == 'sqlite', 'статистика SQLite')
+    @override_settings(PAGINATOR_ESTIMATE_THRESHOLD=1)
+    def test_count_estimated_from_statistics(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('posts:index'))
+        self.assertFalse(any('COUNT(' in query['sql']
+                             for query in captured.captured_queries))
+        self.assertEqual(response.context['page_obj'].last_number, 2)
+
+    def test_invalid_cursor(self):
+        """Испорченный курсор возвращает первую страницу."""
+        response = self.client.get(reverse('posts:index'),
+                                   {'cursor': 'broken'})
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertEqual(len(response.context['page_obj']), 10)
+
+
+class CommentPaginationTests(QueryBudgetMixin, TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.post = Post.objects.create(text='Популярный пост',
+                                       author=cls.author)
+        for i in range(25):
+            commenter = User.objects.create_user(username=f'reader{i}')
+            Comment.objects.create(post=cls.post, author=commenter,
+                                   text=f'Комментарий №{i}')
+
+    def test_first_page_and_fragment(self):
+        """Первые 20 комментариев на странице, остальные во фрагменте."""
+        response = self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': self.post.pk}))
+        comments = response.context['comments']
+        self.assertEqual(len(comments), 20)
+        self.assertEqual(comments[0].text, 'Комментарий №24')
+        self.assertTrue(comments.has_next())
+        self.assertContains(response, 'Показать ещё')
+        response = self.client.get(
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': comments.next_cursor},
+        )
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        rest = response.context['comments']
+        self.assertEqual([comment.text for comment in rest],
+                         [f'Комментарий №{i}' for i in range(4, -1, -1)])
+        self.assertFalse(rest.has_next())
+        self.assertNotContains(response, 'Показать ещё')
+
+    def test_query_count_does_not_depend_on_comments(self):
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.assertQueryBudget(3, url)
+        cursor = response.context['comments'].next_cursor
+        self.assertQueryBudget(
+            3,
+            reverse('posts:post_comments', kwargs={'post_id': self.post.pk}),
+            {'cursor': cursor},
+        )
+
+
+class ConditionalGetTests(TestCase):
+    """Неизменившиеся страницы отдаются ответом 304 без рендеринга."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Test Group',
+            slug='testslug',
+            description='Группа для тестов'
+        )
+        cls.post = Post.objects.create(text='Тестовый пост',
+                                       author=cls.author, group=cls.group)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:follow_index'),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        )
+
+    def setUp(self):
+        self.client = Client()
+        self.client.force_login(ConditionalGetTests.reader)
+        clear_posts_cache()
+
+    def revalidate(self, url, response):
+        return self.client.get(
+            url,
+            HTTP_IF_NONE_MATCH=response['ETag'],
+            HTTP_IF_MODIFIED_SINCE=response['Last-Modified'],
+        )
+
+    def test_not_modified(self):
+        for url in ConditionalGetTests.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, HTTPStatus.OK)
+                self.assertIn('Cookie', response['Vary'])
+                cached = self.revalidate(url, response)
+                self.assertEqual(cached.status_code,
+                                 HTTPStatus.NOT_MODIFIED)
+                self.assertIsNone(cached.context)
+
+    def test_modified_after_changes(self):
+        responses = {url: self.client.get(url)
+                     for url in ConditionalGetTests.urls}
+        author_client = Client()
+        author_client.force_login(ConditionalGetTests.author)
+        author_client.post(reverse('posts:post_create'),
+                           {'text': 'Новый пост', 'group': self.group.pk})
+        self.client.post(
+            reverse('posts:add_comment',
+                    kwargs={'post_id': ConditionalGetTests.post.pk}),
+            {'text': 'Комментарий'},
+        )
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url, response).status_code,
+                                 HTTPStatus.OK)
+
+    def test_modified_after_delete(self):
+        """Удаление не самой новой записи тоже меняет ETag ленты."""
+        Post.objects.create(text='Новый пост', author=self.author)
+        url = ConditionalGetTests.urls[0]
+        response = self.client.get(url)
+        Post.objects.filter(pk=ConditionalGetTests.post.pk).delete()
+        self.assertEqual(self.revalidate(url, response).status_code,
+                         HTTPStatus.OK)
+
+    def test_post_detail_modified_after_author_and_group_changes(self):
+        """Автор, его счётчик и группа меняются без Post.updated."""
+        url = ConditionalGetTests.urls[-1]
+        changes = (
+            lambda: User.objects.filter(pk=self.author.pk).update(
+                first_name='Новое имя'),
+            lambda: UserCounters.objects.filter(
+                user=self.author).update(posts_count=10),
+            lambda: Group.objects.filter(pk=self.group.pk).update(
+                title='Новая группа'),
+        )
+        for change in changes:
+            response = self.client.get(url)
+            change()
+            self.assertEqual(self.revalidate(url, response).status_code,
+                             HTTPStatus.OK)
+
+    def test_etag_depends_on_user(self):
+        url = ConditionalGetTests.urls[0]
+        response = self.client.get(url)
+        guest = Client().get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(guest.status_code, HTTPStatus.OK)
+
+
+@override_settings(PAGE_CACHE_ENABLED=True)
+class PageCacheTests(TestCase):
+    """Анонимным читателям страницы отдаются из кеша без представления."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Test Group',
+            slug='testslug',
+            description='Группа для тестов'
+        )
+        cls.post = Post.objects.create(text='Тестовый пост',
+                                       author=cls.author, group=cls.group)
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile', kwargs={'username': 'author'}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        )
+
+    def setUp(self):
+        self.guest_client = Client()
+        self.reader_client = Client()
+        self.reader_client.force_login(PageCacheTests.reader)
+        clear_posts_cache()
+
+    def assertRendered(self, url):
+        response = self.guest_client.get(url)
+        self.assertEqual(response.status_code, HTTPStatus.OK)
+        self.assertIsNotNone(response.context)
+        return response
+
+    def test_anonymous_page_is_cached(self):
+        for url in PageCacheTests.urls:
+            with self.subTest(url=url):
+                response = self.assertRendered(url)
+                with self.assertNumQueries(0):
+                    cached = self.guest_client.get(url)
+                self.assertIsNone(cached.context)
+                self.assertEqual(cached.content, response.content)
+
+    def test_query_string_is_part_of_key(self):
+        url = PageCacheTests.urls[0]
+        self.assertRendered(url)
+        self.assertRendered(f'{url}?page=2')
+
+    def test_session_cookie_bypasses_cache(self):
+        url = PageCacheTests.urls[0]
+        self.assertRendered(url)
+        response = self.reader_client.get(url)
+        self.assertIsNotNone(response.context)
+
+    def test_not_modified_from_cache(self):
+        url = PageCacheTests.urls[0]
+        response = self.assertRendered(url)
+        cached = self.guest_client.get(url,
+                                       HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, HTTPStatus.NOT_MODIFIED)
+
+    def test_purge_on_post_create_and_edit(self):
+        for url in PageCacheTests.urls:
+            self.assertRendered(url)
+        author_client = Client()
+        author_client.force_login(PageCacheTests.author)
+        author_client.post(
+            reverse('posts:post_edit',
+                    kwargs={'post_id': PageCacheTests.post.pk}),
+            {'text': 'Изменённый пост', 'group': self.group.pk},
+        )
+        for url in PageCacheTests.urls:
+            with self.subTest(url=url):
+                self.assertContains(self.assertRendered(url),
+                                    'Изменённый пост')
+        author_client.post(reverse('posts:post_create'),
+                           {'text': 'Новый пост', 'group': self.group.pk})
+        for url in PageCacheTests.urls[:2]:
+            with self.subTest(url=url):
+                self.assertContains(self.assertRendered(url), 'Новый пост')
+
+    def test_purge_on_orm_edit_and_delete(self):
+        """Правка и удаление через ORM (админку) сбрасывают страницы."""
+        post = Post.objects.create(text='Пост из ORM',
+                                   author=PageCacheTests.author,
+                                   group=PageCacheTests.group)
+        detail = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        for url in (*PageCacheTests.urls, detail):
+            self.assertRendered(url)
+        post.text = 'Правка из админки'
+        post.save()
+        for url in (*PageCacheTests.urls[:3], detail):
+            with self.subTest(url=url):
+                self.assertContains(self.assertRendered(url),
+                                    'Правка из админки')
+        post.delete()
+        for url in PageCacheTests.urls[:3]:
+            with self.subTest(url=url):
+                self.assertNotContains(self.assertRendered(url),
+                                       'Правка из админки')
+        self.assertEqual(self.guest_client.get(detail).status_code,
+                         HTTPStatus.NOT_FOUND)
+
+    def test_unknown_params_share_key(self):
+        """Параметры, кроме page и cursor, не входят в ключ страницы."""
+        url = PageCacheTests.urls[0]
+        self.assertRendered(url)
+        cached = self.guest_client.get(url, {'utm_source': 'mail'})
+        self.assertIsNone(cached.context)
+
+    def test_purge_on_comment(self):
+        url = PageCacheTests.urls[3]
+        self.assertRendered(url)
+        self.reader_client.post(
+            reverse('posts:add_comment',
+                    kwargs={'post_id': PageCacheTests.post.pk}),
+            {'text': 'Комментарий читателя'},
+        )
+        self.assertContains(self.assertRendered(url), 'Комментарий читателя')
+
+    def test_purge_on_follow(self):
+        url = PageCacheTests.urls[2]
+        self.assertRendered(url)
+        self.reader_client.get(reverse('posts:profile_follow',
+                                       kwargs={'username': 'author'}))
+        self.assertContains(self.assertRendered(url), 'Подписчиков: 1')
+        self.reader_client.get(reverse('posts:profile_unfollow',
+                                       kwargs={'username': 'author'}))
+        self.assertContains(self.assertRendered(url), 'Подписчиков: 0')
+
+
+class QueryBudgetTests(QueryBudgetMixin, TestCase):
+    """Число запросов страницы не зависит от числа записей на ней."""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.reader = User.objects.create_user(username='reader')
+        cls.group = Group.objects.create(
+            title='Test Group',
+            slug='testslug',
+            description='Группа для тестов'
+        )
+        for i in range(10):
+            author = User.objects.create_user(
+                username=f'author{i}', first_name=f'Имя{i}')
+            group = Group.objects.create(
+                title=f'Группа {i}',
+                slug=f'group{i}',
+                description='Группа для тестов'
+            )
+            post = Post.objects.create(text=f'Пост №{i}', author=author,
+                                       group=group)
+            Post.objects.create(text=f'Пост в группе №{i}', author=author,
+                                group=cls.group)
+            Comment.objects.create(post=post, author=author,
+                                   text='Комментарий')
+            Comment.objects.create(post=post, author=cls.reader,
+                                   text='Комментарий')
+            Follow.objects.create(user=cls.reader, author=author)
+        cls.post = post
+        # Включая запросы валидаторов условного GET (posts.conditional)
+        # и подсчёт записей для паджинатора на холодном кеше.
+        cls.budgets = (
+            (reverse('posts:index'), 6),
+            (reverse('posts:group_list', kwargs={'slug': 'testslug'}), 7),
+            (reverse('posts:profile', kwargs={'username': 'author9'}), 9),
+            (reverse('posts:follow_index'), 6),
+            (reverse('posts:post_detail', kwargs={'post_id': post.pk}), 5),
+        )
+
+    def setUp(self):
+        self.client.force_login(QueryBudgetTests.reader)
+        clear_posts_cache()
+
+    def test_feed_query_budget(self):
+        for url, budget in QueryBudgetTests.budgets:
+            with self.subTest(url=url):
+                self.assertQueryBudget(budget, url)
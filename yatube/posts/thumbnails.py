@@ -0,0 +1,390 @@
+"""
+Подготовка миниатюр картинок записей вне цикла запроса.
+
+Миниатюры создаются при сохранении записи через PostForm в пуле
+процессов (THUMBNAIL_WORKERS > 0) или сразу при сохранении
+(THUMBNAIL_WORKERS = 0), а для существующих записей - командой
+generate_thumbnails. Шаблон никогда не создаёт миниатюру: пока её нет,
+он показывает заглушку и, если есть пул, ставит её создание в очередь.
+
+Миниатюра готова, когда заполнено Post.image_variants: копии
+пишутся в запись после миниатюры, а смена картинки их сбрасывает.
+Готовую миниатюру открытый get_thumbnail sorl-thumbnail возвращает без
+масштабирования.
+
+Адреса и размеры готовых миниатюр запоминаются в ограниченном LRU-кеше
+процесса и в общем кеше Django, так что повторный вывод ленты не
+обращается к хранилищу sorl-thumbnail. Миниатюры страницы ленты,
+которых нет в LRU-кеше, prefetch_thumbnails читает из общего кеша
+одним запросом. Имена загруженных картинок уникальны, поэтому в других
+процессах записи старой картинки просто вытесняются.
+
+Вместе с миниатюрой один раз на загрузку создаются уменьшенные копии
+в WebP и AVIF (если Pillow его поддерживает) для srcset. Их имена и
+размеры хранятся в Post.image_variants, так что шаблону не нужно
+обращаться к хранилищу.
+"""
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+from sorl.thumbnail import default, get_thumbnail
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import (deserialize_image_file,
+                                   serialize_image_file)
+
+from core import pagecache, querylog
+
+from . import cache as feed_cache
+
+logger = logging.getLogger(__name__)
+
+FEED_GEOMETRY = '960x339'
+FEED_OPTIONS = {'crop': 'center', 'upscale': True}
+FEED_RATIO = 339 / 960
+
+# расширение и формат Pillow: MIME-тип для <source type>
+VARIANT_FORMATS = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+VARIANT_QUALITY = 80
+
+CachedThumbnail = namedtuple('CachedThumbnail', 'url width height')
+SHARED_KEY = 'thumbnail:{}'
+
+_executor = None
+_pending = set()
+_lock = threading.Lock()
+
+
+def thumbnail_workers():
+    return getattr(settings, 'THUMBNAIL_WORKERS', 0)
+
+
+class ThumbnailCache:
+    """
+    Потокобезопасный LRU-кеш: (картинка, геометрия, опции) -> адрес и
+    размеры миниатюры. Хранит только готовые миниатюры.
+    """
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        # Без учёта в статистике попаданий.
+        with self._lock:
+            return key in self._data
+
+    def get(self, key):
+        with self._lock:
+            try:
+                value = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def evict(self, name):
+        """Удаляет все миниатюры картинки name."""
+        with self._lock:
+            for key in [key for key in self._data if key[0] == name]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._data), 'maxsize': self.maxsize}
+
+
+thumbnail_cache = ThumbnailCache(
+    getattr(settings, 'THUMBNAIL_CACHE_SIZE', 1024))
+
+
+def cache_metrics():
+    """Статистика thumbnail_cache для core.metrics.register_collector."""
+    stats = thumbnail_cache.stats()
+    return (
+        ('thumbnail_cache_hits_total', 'counter',
+         'Попадания в LRU-кеш миниатюр.', stats['hits']),
+        ('thumbnail_cache_misses_total', 'counter',
+         'Промахи LRU-кеша миниатюр.', stats['misses']),
+        ('thumbnail_cache_size', 'gauge',
+         'Миниатюр в LRU-кеше.', stats['size']),
+        ('thumbnail_cache_maxsize', 'gauge',
+         'Размер LRU-кеша миниатюр.', stats['maxsize']),
+    )
+
+
+def variant_widths():
+    return getattr(settings, 'POST_IMAGE_WIDTHS', (480, 960, 1440))
+
+
+def variant_formats():
+    """Форматы копий, которые умеет записывать установленный Pillow."""
+    return [ext for ext in VARIANT_FORMATS
+            if ext in features.modules and features.check_module(ext)]
+
+
+def is_ready(post):
+    """Истина, если миниатюра картинки записи уже создана."""
+    return bool(post.image) and bool(post.image_variants)
+
+
+def get_cached_thumbnail(name, geometry=FEED_GEOMETRY, **options):
+    """
+    Адрес и размеры готовой миниатюры (см. is_ready). Без записи в
+    кешах берёт её открытым get_thumbnail sorl-thumbnail, который
+    создал бы недостающую миниатюру, поэтому для неготовой не
+    вызывается.
+    """
+    options = options or FEED_OPTIONS
+    key = _cache_key(name, geometry, options)
+    cached = thumbnail_cache.get(key)
+    if cached is not None:
+        return cached
+    cached = cache.get(_shared_key(key))
+    if cached is None:
+        return remember(name, get_thumbnail(name, geometry, **options),
+                        geometry, options)
+    thumbnail_cache.set(key, cached)
+    return cached
+
+
+def post_thumbnail(post):
+    """Миниатюра картинки записи или None, если она ещё не готова."""
+    if not is_ready(post):
+        return None
+    return get_cached_thumbnail(post.image.name)
+
+
+def prefetch_thumbnails(posts, geometry=FEED_GEOMETRY):
+    """
+    Загружает в LRU-кеш готовые миниатюры записей из общего кеша одним
+    запросом. Возвращает список записей, поэтому годится как transform
+    паджинатора.
+    """
+    posts = list(posts)
+    keys = {}
+    for post in posts:
+        if is_ready(post):
+            key = _cache_key(post.image.name, geometry, FEED_OPTIONS)
+            if key not in thumbnail_cache:
+                keys[_shared_key(key)] = key
+    if keys:
+        for shared, cached in cache.get_many(list(keys)).items():
+            thumbnail_cache.set(keys[shared], cached)
+    return posts
+
+
+def remember(name, thumbnail, geometry=FEED_GEOMETRY, options=None):
+    """Запоминает адрес и размеры миниатюры в LRU-кеше и общем кеше."""
+    key = _cache_key(name, geometry, options or FEED_OPTIONS)
+    cached = CachedThumbnail(thumbnail.url, thumbnail.width,
+                             thumbnail.height)
+    thumbnail_cache.set(key, cached)
+    cache.set(_shared_key(key), cached,
+              sorl_settings.THUMBNAIL_CACHE_TIMEOUT)
+    return cached
+
+
+def _cache_key(name, geometry, options):
+    return (name, geometry, tuple(sorted(options.items())))
+
+
+def _shared_key(key):
+    return SHARED_KEY.format(hashlib.md5(repr(key).encode()).hexdigest())
+
+
+def generate(name, geometry=FEED_GEOMETRY, **options):
+    """
+    Создаёт миниатюру картинки; вызывается в рабочем процессе.
+    Возвращает сериализованную миниатюру.
+    """
+    options = options or FEED_OPTIONS
+    thumbnail = get_thumbnail(name, geometry, **options)
+    remember(name, thumbnail, geometry, options)
+    return serialize_image_file(thumbnail)
+
+
+def generate_variants(name, storage=default_storage):
+    """
+    Создаёт копии картинки шириной из POST_IMAGE_WIDTHS (не шире
+    оригинала) в каждом поддерживаемом формате. Возвращает список
+    словарей name/type/width/height.
+    """
+    with storage.open(name) as file:
+        image = Image.open(file)
+        image.load()
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGB')
+    widths = sorted(variant_widths())
+    widths = [width for width in widths if width <= image.width] or widths[:1]
+    stem = os.path.splitext(name)[0]
+    variants = []
+    for width in widths:
+        height = round(width * FEED_RATIO)
+        resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        for ext in variant_formats():
+            buffer = BytesIO()
+            resized.save(buffer, ext.upper(), quality=VARIANT_QUALITY)
+            variants.append({
+                'name': storage.save(f'{stem}_{width}w.{ext}',
+                                     ContentFile(buffer.getvalue())),
+                'type': VARIANT_FORMATS[ext],
+                'width': width,
+                'height': height,
+            })
+    return variants
+
+
+def process(name):
+    """
+    Создаёт миниатюру и, если их ещё нет, копии для srcset; копии
+    записываются во все записи с этой картинкой. Возвращает
+    сериализованную миниатюру.
+    """
+    Post = global_apps.get_model('posts', 'Post')
+    thumbnail = generate(name)
+    posts = Post.objects.filter(image=name)
+    changes = {'updated': timezone.now()}
+    if posts.filter(image_variants='').exists():
+        changes['image_variants'] = json.dumps(generate_variants(name))
+    # Страница записи меняется: заглушка уступает место картинке.
+    posts.update(**changes)
+    return thumbnail
+
+
+def get_sources(post):
+    """
+    Источники <picture> записи: MIME-тип и srcset для каждого формата.
+    Читает только Post.image_variants.
+    """
+    if not post.image_variants:
+        return []
+    storage = post.image.storage
+    sources = {}
+    for variant in json.loads(post.image_variants):
+        sources.setdefault(variant['type'], []).append(
+            f'{storage.url(variant["name"])} {variant["width"]}w'
+        )
+    return [{'type': mime, 'srcset': ', '.join(candidates)}
+            for mime, candidates in sources.items()]
+
+
+def generate_safely(name):
+    """Как process, но возвращает текст ошибки вместо исключения."""
+    try:
+        process(name)
+    except Exception as error:
+        return f'{name}: {error}'
+    return None
+
+
+def init_worker():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'yatube.settings')
+    import django
+    django.setup()
+
+
+def get_executor(workers=None):
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=workers or thumbnail_workers(),
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=init_worker,
+            )
+        return _executor
+
+
+def _finished(name, future):
+    with _lock:
+        _pending.discard(name)
+    if future.exception() is not None:
+        logger.error('Thumbnail for %s failed', name,
+                     exc_info=future.exception())
+        return
+    # Рабочий процесс записал миниатюру в своё хранилище, а в кеше этого
+    # процесса мог остаться ответ «миниатюры нет»: перезаписываем его.
+    # Ленты подписок сбрасывает область автора из post_scopes.
+    try:
+        thumbnail = deserialize_image_file(future.result())
+        default.kvstore.set(thumbnail)
+        remember(name, thumbnail)
+        Post = global_apps.get_model('posts', 'Post')
+        posts = Post.objects.filter(image=name).only('author', 'group')
+        scopes = {scope for post in posts
+                  for scope in feed_cache.post_scopes(post)}
+        feed_cache.invalidate(*scopes)
+        pagecache.purge(*scopes, *(f'post:{post.pk}' for post in posts))
+    finally:
+        connections.close_all()
+
+
+def enqueue(name):
+    """
+    Ставит создание миниатюры в очередь пула процессов. Без пула
+    (THUMBNAIL_WORKERS = 0) ничего не делает: миниатюры создают
+    PostForm и команда generate_thumbnails.
+    """
+    if not name or not thumbnail_workers():
+        return
+    with _lock:
+        if name in _pending:
+            return
+        _pending.add(name)
+    future = get_executor().submit(process, name)
+    future.add_done_callback(lambda future: _finished(name, future))
+
+
+def schedule(name):
+    """
+    Создаёт миниатюру сохранённой картинки: в пуле процессов или, без
+    пула, сразу.
+    """
+    if not name:
+        return
+    if thumbnail_workers():
+        enqueue(name)
+        return
+    try:
+        # Разовая работа, а не N+1 представления (core.querylog).
+        with querylog.ignored():
+            process(name)
+    except Exception:
+        logger.exception('Thumbnail for %s failed', name)
@@ -0,0 +1,291 @@
+"""
+Материализованная лента подписок (fan-out-on-write).
+
+При публикации записи её id добавляется в ограниченную ленту каждого
+подписчика автора, и follow_index читает ленту по индексу
+(user, -pub_date, -post) без соединения Follow и Post. Для авторов, у
+которых подписчиков больше TIMELINE_FANOUT_LIMIT, раздача не делается:
+их записи подмешиваются в ленту при чтении (fan-out-on-read). Когда
+подписчиков снова становится не больше предела, записи автора
+добавляются в ленты подписчиков (restore_fanout).
+
+Длину ленты хранит UserCounters.timeline_count, поэтому раздача
+записи не перебирает ленты: она делает несколько запросов с числом
+строк по числу подписчиков и удаляет по одной самой старой записи из
+переполненных лент.
+
+Фрагменты ленты подписок зависят от версий областей авторов
+(follow_scopes), так что правка записи сбрасывает одну область автора,
+а не ленту каждого подписчика.
+"""
+from django.apps import apps as global_apps
+from django.conf import settings
+from django.db import connections, router
+from django.db.models import F, OuterRef, Q, Subquery
+
+from . import cache as feed_cache
+from . import counters
+from .paginators import CursorPaginator
+from .thumbnails import prefetch_thumbnails
+
+
+def timeline_length():
+    return getattr(settings, 'TIMELINE_LENGTH', 1000)
+
+
+def fanout_limit():
+    return getattr(settings, 'TIMELINE_FANOUT_LIMIT', 10000)
+
+
+def is_fanout_author(author_id, apps=global_apps):
+    """Истина, если записи автора раздаются по лентам подписчиков."""
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    followers = (UserCounters.objects.filter(user_id=author_id)
+                 .values_list('followers_count', flat=True).first())
+    return (followers or 0) <= fanout_limit()
+
+
+def followers_of(author_id, apps=global_apps):
+    """Подзапрос id подписчиков автора."""
+    Follow = apps.get_model('posts', 'Follow')
+    return Follow.objects.filter(author_id=author_id).values('user_id')
+
+
+def trim(user_id, apps=global_apps):
+    """
+    Оставляет в ленте пользователя только TIMELINE_LENGTH записей и
+    пересчитывает её длину.
+    """
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    entries = TimelineEntry.objects.filter(user_id=user_id)
+    boundary = (entries.order_by('-pub_date', '-post_id')
+                .values_list('pub_date', 'post_id')[timeline_length():]
+                .first())
+    if boundary is not None:
+        pub_date, post_id = boundary
+        entries.filter(
+            Q(pub_date__lt=pub_date)
+            | Q(pub_date=pub_date, post_id__lte=post_id)
+        ).delete()
+    counters.recount_users('timeline_count', [user_id], apps=apps)
+
+
+def trim_followers(author_id, apps=global_apps):
+    """
+    Обрезает ленты всех подписчиков автора одним запросом DELETE:
+    ROW_NUMBER() нумерует записи каждой ленты от новых к старым. Читает
+    ленты целиком, поэтому нужен только в restore_fanout.
+    """
+    Follow = apps.get_model('posts', 'Follow')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    using = router.db_for_write(TimelineEntry)
+    connection = connections[using]
+    entries = connection.ops.quote_name(TimelineEntry._meta.db_table)
+    follows = connection.ops.quote_name(Follow._meta.db_table)
+    sql = (
+        f'DELETE FROM {entries} WHERE id IN ('
+        f'SELECT id FROM ('
+        f'SELECT id, ROW_NUMBER() OVER ('
+        f'PARTITION BY user_id ORDER BY pub_date DESC, post_id DESC'
+        f') AS position FROM {entries} WHERE user_id IN ('
+        f'SELECT user_id FROM {follows} WHERE author_id = %s)'
+        f') ranked WHERE position > %s)'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [author_id, timeline_length()])
+    counters.recount_users('timeline_count', followers_of(author_id, apps),
+                           apps=apps)
+
+
+def drop_oldest(author_id, apps=global_apps):
+    """
+    Удаляет самую старую запись из каждой переполненной ленты
+    подписчиков автора. После раздачи одной записи лента длиннее
+    TIMELINE_LENGTH не больше чем на одну запись.
+    """
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    overflowing = UserCounters.objects.filter(
+        user_id__in=followers_of(author_id, apps),
+        timeline_count__gt=timeline_length(),
+    )
+    oldest = (TimelineEntry.objects.filter(user_id=OuterRef('user_id'))
+              .order_by('pub_date', 'post_id').values('pk')[:1])
+    TimelineEntry.objects.filter(
+        pk__in=overflowing.annotate(oldest=Subquery(oldest))
+        .values('oldest')
+    ).delete()
+    overflowing.update(timeline_count=F('timeline_count') - 1)
+
+
+def _insert_sql(connection, TimelineEntry, select):
+    """INSERT в ленты с пропуском уже добавленных записей."""
+    ops = connection.ops
+    return (
+        f'{ops.insert_statement(ignore_conflicts=True)} '
+        f'{ops.quote_name(TimelineEntry._meta.db_table)} '
+        f'(user_id, post_id, pub_date) {select} '
+        f'{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}'
+    )
+
+
+def push_post(post, apps=global_apps):
+    """
+    Раздаёт новую запись по лентам подписчиков автора: увеличение
+    длин лент, в которых её ещё нет, вставка одним запросом
+    INSERT ... SELECT и обрезка переполненных лент.
+    """
+    if not is_fanout_author(post.author_id, apps=apps):
+        return
+    Follow = apps.get_model('posts', 'Follow')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    connection = connections[router.db_for_write(TimelineEntry)]
+    follows = connection.ops.quote_name(Follow._meta.db_table)
+    sql = _insert_sql(connection, TimelineEntry,
+                      f'SELECT user_id, %s, %s FROM {follows} '
+                      f'WHERE author_id = %s')
+    pub_date = connection.ops.adapt_datetimefield_value(post.pub_date)
+    UserCounters.objects.filter(
+        user_id__in=followers_of(post.author_id, apps)
+    ).exclude(
+        user__timeline__post_id=post.pk
+    ).update(timeline_count=F('timeline_count') + 1)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [post.pk, pub_date, post.author_id])
+    drop_oldest(post.author_id, apps=apps)
+
+
+def restore_fanout(author_id, apps=global_apps):
+    """
+    Вызывается, когда у автора стало ровно TIMELINE_FANOUT_LIMIT
+    подписчиков: его записи снова раздаются, а записи, написанные без
+    раздачи, добавляются в ленты подписчиков. Редкая и тяжёлая
+    операция: ленты подписчиков обрезаются целиком.
+    """
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    followers = (UserCounters.objects.filter(user_id=author_id)
+                 .values_list('followers_count', flat=True).first())
+    if followers != fanout_limit():
+        return
+    Follow = apps.get_model('posts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    connection = connections[router.db_for_write(TimelineEntry)]
+    quote = connection.ops.quote_name
+    sql = _insert_sql(
+        connection, TimelineEntry,
+        f'SELECT follow.user_id, post.id, post.pub_date '
+        f'FROM {quote(Follow._meta.db_table)} follow, ('
+        f'SELECT id, pub_date FROM {quote(Post._meta.db_table)} '
+        f'WHERE author_id = %s ORDER BY pub_date DESC, id DESC LIMIT %s'
+        f') post WHERE follow.author_id = %s',
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [author_id, timeline_length(), author_id])
+    trim_followers(author_id, apps=apps)
+
+
+def backfill(user_id, author_id, apps=global_apps):
+    """Добавляет в ленту последние записи автора после подписки."""
+    if not is_fanout_author(author_id, apps=apps):
+        return
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    posts = (Post.objects.filter(author_id=author_id)
+             .order_by('-pub_date', '-id')
+             .values_list('pk', 'pub_date')[:timeline_length()])
+    TimelineEntry.objects.bulk_create(
+        (TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+         for pk, pub_date in posts),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+    trim(user_id, apps=apps)
+
+
+def prune(user_id, author_id, apps=global_apps):
+    """Убирает из ленты записи автора после отписки."""
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    deleted, _ = TimelineEntry.objects.filter(
+        user_id=user_id, post__author_id=author_id
+    ).delete()
+    if deleted:
+        counters.change_user_counter(user_id, 'timeline_count', -deleted,
+                                     apps=apps)
+
+
+def rebuild_timelines(apps=global_apps):
+    """Заполняет ленты всех пользователей заново по подпискам."""
+    Follow = apps.get_model('posts', 'Follow')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    UserCounters = apps.get_model('posts', 'UserCounters')
+    TimelineEntry.objects.all().delete()
+    UserCounters.objects.update(timeline_count=0)
+    follows = Follow.objects.order_by().values_list('user_id', 'author_id')
+    for user_id, author_id in follows.iterator():
+        backfill(user_id, author_id, apps=apps)
+
+
+def followed_authors(request):
+    """
+    [(id автора, число его подписчиков)] подписок пользователя.
+    Запоминается на время запроса.
+    """
+    if not hasattr(request, '_followed_authors'):
+        Follow = global_apps.get_model('posts', 'Follow')
+        request._followed_authors = list(
+            Follow.objects.filter(user=request.user).order_by()
+            .values_list('author_id', 'author__counters__followers_count')
+        )
+    return request._followed_authors
+
+
+def read_authors(request):
+    """
+    Авторы из подписок пользователя, чьи записи не раздаются по лентам
+    и читаются при чтении ленты.
+    """
+    return [author_id for author_id, followers in followed_authors(request)
+            if (followers or 0) > fanout_limit()]
+
+
+def follow_scopes(request):
+    """
+    Области кеша ленты подписок: лента читателя (её сбрасывают подписка
+    и отписка) и все авторы из подписок (их сбрасывают новые записи и
+    правки).
+    """
+    return (f'follower:{request.user.pk}',
+            *(f'author:{author_id}'
+              for author_id, _ in followed_authors(request)))
+
+
+def get_timeline_page(request, posts_per_page=10):
+    """Страница ленты подписок текущего пользователя."""
+    Post = global_apps.get_model('posts', 'Post')
+    TimelineEntry = global_apps.get_model('posts', 'TimelineEntry')
+    user = request.user
+    authors = read_authors(request)
+    number = request.GET.get('page')
+    cursor = request.GET.get('cursor')
+    scopes = follow_scopes(request)
+    if authors:
+        # Записи популярных авторов не раздавались: читаем их напрямую.
+        posts = Post.objects.filter(
+            Q(pk__in=TimelineEntry.objects.filter(user=user)
+              .values('post_id'))
+            | Q(author_id__in=authors)
+        ).select_related('author', 'group')
+        return CursorPaginator(
+            posts, posts_per_page, lazy=True, transform=prefetch_thumbnails,
+            count_func=lambda: feed_cache.cached_count(posts, *scopes),
+        ).get_page(number, cursor=cursor)
+    entries = TimelineEntry.objects.filter(user=user).select_related(
+        'post__author', 'post__group')
+    return CursorPaginator(
+        entries, posts_per_page, keys=('pub_date', 'post_id'), lazy=True,
+        count_func=lambda: feed_cache.cached_count(entries, *scopes),
+        transform=lambda rows: prefetch_thumbnails(
+            entry.post for entry in rows),
+    ).get_page(number, cursor=cursor)
@@ -1,7 +1,37 @@
-from django.core.paginator import Paginator
+from . import cache as feed_cache
+from .paginators import CursorPaginator
+from .thumbnails import prefetch_thumbnails
 
 
-def get_posts_page(request, post_list, posts_per_page=10):
-    paginator = Paginator(post_list, posts_per_page)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+def get_posts_page(request, post_list, posts_per_page=10, scopes=()):
+    """
+    Страница ленты. scopes - области кеша ленты: по ним кешируется
+    общее число записей для номеров страниц и ссылки на последнюю.
+    Записи выбираются при первом обращении к ним, так что при попадании
+    в кеш фрагмента ленты запроса нет; миниатюры их картинок читаются
+    вместе (prefetch_thumbnails).
+    """
+    count_func = None
+    if scopes:
+        def count_func():
+            return feed_cache.cached_count(post_list, *scopes)
+    paginator = CursorPaginator(post_list, posts_per_page,
+                                count_func=count_func, lazy=True,
+                                transform=prefetch_thumbnails)
+    return paginator.get_page(
+        request.GET.get('page'),
+        cursor=request.GET.get('cursor'),
+    )
+
+
+def get_comments_page(request, post, comments_per_page=20):
+    """
+    Страница комментариев записи, новые первыми. Следующая страница
+    выбирается только по курсору, без COUNT(*) и OFFSET.
+    """
+    paginator = CursorPaginator(
+        post.comments.select_related('author'),
+        comments_per_page,
+        keys=('created', 'id'),
+    )
+    return paginator.get_page(cursor=request.GET.get('cursor'))
@@ -1,24 +1,40 @@
 from django.contrib.auth.decorators import login_required
-from django.core.cache import cache
-from django.core.cache.utils import make_template_fragment_key
 from django.shortcuts import get_object_or_404, redirect, render
 
+from core import pagecache
+from core.replicas import read_from_replica
+
+from . import cache as feed_cache
+from . import conditional
 from .forms import CommentForm, PostForm
 from .models import Follow, Group, Post, User
-from .utils import get_posts_page
+from .search import search_posts
+from .timeline import follow_scopes, get_timeline_page
+from .utils import get_comments_page, get_posts_page
 
 
-def clear_posts_cache():
-    for cache_name in ['index_page', 'follow_page']:
-        cache_key = make_template_fragment_key(cache_name)
-        cache.delete(cache_key)
+def clear_posts_cache(*posts):
+    """
+    Сбрасывает кеш лент и страниц, в которых показываются записи.
+    Без аргументов сбрасывает кеш всех лент и страниц. Сохранение
+    записи сбрасывает её ленты и страницы само (posts.signals).
+    """
+    if not posts:
+        feed_cache.invalidate(feed_cache.ALL_FEEDS)
+        pagecache.purge(pagecache.ALL_PAGES)
+    for post in posts:
+        scopes = feed_cache.post_scopes(post)
+        feed_cache.invalidate(*scopes)
+        pagecache.purge(*scopes, f'post:{post.pk}')
 
 
-def clear_follow_cache():
-    cache_key = make_template_fragment_key('follow_page')
-    cache.delete(cache_key)
+def clear_follow_cache(user):
+    """Сбрасывает кеш ленты подписок пользователя."""
+    feed_cache.invalidate(f'follower:{user.pk}')
 
 
+@read_from_replica
+@conditional.conditional(conditional.index_validators)
 def index(request):
     """
     Главная страница проложеия post.
@@ -26,14 +42,19 @@ def index(request):
     """
     page_obj = get_posts_page(
         request,
-        Post.objects.all()
+        Post.objects.select_related('author', 'group'),
+        scopes=('index',),
     )
+    pagecache.tag(request, 'index')
     context = {
         'page_obj': page_obj,
+        'feed_cache_key': feed_cache.feed_cache_key(request, 'index'),
     }
     return render(request, 'posts/index.html', context)
 
 
+@read_from_replica
+@conditional.conditional(conditional.group_validators)
 def group_posts(request, slug):
     """
     Страница группы.
@@ -42,21 +63,32 @@ def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     page_obj = get_posts_page(
         request,
-        group.posts.all(),
+        group.posts.select_related('author', 'group'),
+        scopes=(f'group:{group.pk}',),
     )
+    pagecache.tag(request, f'group:{group.pk}')
     context = {
         'group': group,
         'page_obj': page_obj,
+        'feed_cache_key': feed_cache.feed_cache_key(
+            request, f'group:{group.pk}'),
     }
     return render(request, 'posts/group_list.html', context)
 
 
+@read_from_replica
+@conditional.conditional(conditional.profile_validators)
 def profile(request, username):
-    user = get_object_or_404(User, username=username)
+    user = get_object_or_404(
+        User.objects.select_related('counters'),
+        username=username,
+    )
     page_obj = get_posts_page(
         request,
-        user.posts.all(),
+        user.posts.select_related('author', 'group'),
+        scopes=(f'author:{user.pk}',),
     )
+    pagecache.tag(request, f'author:{user.pk}')
     following = False
     if (request.user.is_authenticated
             and Follow.objects.filter(user=request.user,
@@ -66,24 +98,62 @@ def profile(request, username):
         'author': user,
         'page_obj': page_obj,
         'following': following,
+        'feed_cache_key': feed_cache.feed_cache_key(
+            request, f'author:{user.pk}'),
     }
     return render(request, 'posts/profile.html', context)
 
 
+def search(request):
+    """
+    Поиск записей по тексту.
+    Показывает 10 самых релевантных записей на странице.
+    """
+    query = request.GET.get('q', '').strip()
+    page_obj = None
+    if query:
+        page_obj = search_posts(query, cursor=request.GET.get('cursor'))
+    context = {
+        'query': query,
+        'page_obj': page_obj,
+    }
+    return render(request, 'posts/search.html', context)
+
+
+@read_from_replica
+@conditional.conditional(conditional.post_validators)
 def post_detail(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related('author__counters', 'group'),
+        pk=post_id,
+    )
     form = CommentForm(
         request.POST or None,
     )
-    comments = post.comments.all()
+    # На странице записи есть и счётчик записей автора.
+    pagecache.tag(request, f'post:{post.pk}', f'author:{post.author_id}')
     context = {
         'post': post,
         'form': form,
-        'comments': comments,
+        'comments': get_comments_page(request, post),
     }
     return render(request, 'posts/post_detail.html', context)
 
 
+@read_from_replica
+def post_comments(request, post_id):
+    """
+    Фрагмент со следующей страницей комментариев записи:
+    подгружается кнопкой «Показать ещё» на странице записи.
+    """
+    post = get_object_or_404(Post, pk=post_id)
+    context = {
+        'post': post,
+        'comments': get_comments_page(request, post),
+    }
+    return render(request, 'posts/includes/comments.html', context)
+
+
 @login_required
 def post_create(request):
     form = PostForm(
@@ -91,10 +161,8 @@ def post_create(request):
         files=request.FILES or None
     )
     if form.is_valid():
-        post = form.save(commit=False)
-        post.author = request.user
-        post.save()
-        clear_posts_cache()
+        form.instance.author = request.user
+        form.save()
         return redirect("posts:profile", username=request.user.username)
     return render(request, 'posts/create_post.html', {'form': form})
 
@@ -111,7 +179,6 @@ def post_edit(request, post_id):
     )
     if form.is_valid():
         form.save()
-        clear_posts_cache()
         return redirect("posts:post_detail", post_id=post_id)
     return render(
         request,
@@ -132,17 +199,18 @@ def add_comment(request, post_id):
     return redirect('posts:post_detail', post_id=post_id)
 
 
+@read_from_replica
 @login_required
+@conditional.conditional(conditional.follow_validators)
 def follow_index(request):
     """
     Отображает список постов авторов на которые подписан пользователь
     """
-    page_obj = get_posts_page(
-        request,
-        Post.objects.filter(author__following__user=request.user)
-    )
+    page_obj = get_timeline_page(request)
     context = {
         'page_obj': page_obj,
+        'feed_cache_key': feed_cache.feed_cache_key(
+            request, *follow_scopes(request)),
     }
     return render(request, 'posts/follow.html', context)
 
@@ -157,7 +225,7 @@ def profile_follow(request, username):
             and not Follow.objects.filter(user=request.user,
                                           author=author).exists()):
         Follow.objects.create(user=request.user, author=author)
-        clear_follow_cache()
+        clear_follow_cache(request.user)
     return redirect('posts:profile', username=username)
 
 
@@ -168,5 +236,5 @@ def profile_unfollow(request, username):
     """
     author = get_object_or_404(User, username=username)
     Follow.objects.filter(user=request.user, author=author).delete()
-    clear_follow_cache()
+    clear_follow_cache(request.user)
     return redirect('posts:profile', username=username)
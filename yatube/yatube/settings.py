@@ -11,6 +11,9 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import sys
+
+from django.core.exceptions import ImproperlyConfigured
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -19,18 +22,38 @@ BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/2.2/howto/deployment/checklist/
 
-# SECURITY WARNING: keep the secret key used in production secret!
-SECRET_KEY = '@mwuludxmuj!+dal7der^1^!77%b#2!%$o%p!g7nxm%t1f_!he'
+# Профиль настроек выбирается переменной окружения YATUBE_ENV:
+# development (по умолчанию) или production. В production выключены
+# DEBUG и инструменты отладки, шаблоны кешируются, а соединения с базой
+# данных переиспользуются. Другое значение (например, опечатка prod)
+# - ошибка, а не тихо включённый DEBUG.
+ENVIRONMENTS = ('development', 'production')
+ENVIRONMENT = os.environ.get('YATUBE_ENV', 'development')
+if ENVIRONMENT not in ENVIRONMENTS:
+    raise ImproperlyConfigured(
+        f'YATUBE_ENV must be one of {", ".join(ENVIRONMENTS)}, '
+        f'got {ENVIRONMENT!r}'
+    )
 
 # SECURITY WARNING: don't run with debug turned on in production!
-DEBUG = True
+DEBUG = ENVIRONMENT != 'production'
 
-ALLOWED_HOSTS = [
-    'localhost',
-    '127.0.0.1',
-    '[::1]',
-    'testserver',
-]
+# SECURITY WARNING: keep the secret key used in production secret!
+# В production ключ обязателен: без YATUBE_SECRET_KEY Django не
+# запустится.
+SECRET_KEY = os.environ.get(
+    'YATUBE_SECRET_KEY',
+    '@mwuludxmuj!+dal7der^1^!77%b#2!%$o%p!g7nxm%t1f_!he' if DEBUG else ''
+)
+
+ALLOWED_HOSTS = os.environ.get('YATUBE_ALLOWED_HOSTS', '').split(',')
+if ALLOWED_HOSTS == ['']:
+    ALLOWED_HOSTS = [
+        'localhost',
+        '127.0.0.1',
+        '[::1]',
+        'testserver',
+    ]
 
 INTERNAL_IPS = [
     '127.0.0.1',
@@ -48,20 +71,27 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'sorl.thumbnail',
-    'debug_toolbar',
 ]
 
 MIDDLEWARE = [
+    'core.metrics.MetricsMiddleware',
+    'core.querylog.QueryLogMiddleware',
+    'core.pagecache.PageCacheMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.profiling.ProfilerMiddleware',
+    'core.replicas.ReplicaPinMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
-    'debug_toolbar.middleware.DebugToolbarMiddleware',
 ]
 
+if DEBUG:
+    INSTALLED_APPS.append('debug_toolbar')
+    MIDDLEWARE.append('debug_toolbar.middleware.DebugToolbarMiddleware')
+
 ROOT_URLCONF = 'yatube.urls'
 
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
@@ -69,7 +99,7 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
-        'APP_DIRS': True,
+        'APP_DIRS': DEBUG,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -81,6 +111,14 @@ TEMPLATES = [
         },
     },
 ]
+if not DEBUG:
+    # В production шаблоны компилируются один раз на процесс.
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
 
 WSGI_APPLICATION = 'yatube.wsgi.application'
 
@@ -92,9 +130,43 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': 0 if DEBUG else 600,
+        'OPTIONS': {'timeout': 20},
     }
 }
 
+# Реплики только для чтения лент (core.replicas), например копии
+# основной базы, которые обновляет команда sync_replicas:
+# YATUBE_DB_REPLICAS=replica1.sqlite3,replica2.sqlite3
+DATABASE_REPLICAS = []
+for number, name in enumerate(
+        filter(None, os.environ.get('YATUBE_DB_REPLICAS', '').split(',')),
+        start=1):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        'NAME': os.path.join(BASE_DIR, name),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(f'replica{number}')
+
+DATABASE_ROUTERS = ['core.replicas.ReplicaRouter']
+# Сколько секунд после записи пользователь читает основную базу и
+# записи в какие приложения его закрепляют (не last_login и сессии).
+REPLICA_PIN_SECONDS = 30
+REPLICA_PIN_APPS = ('posts',)
+
+# PRAGMA, которые выполняются при каждом новом соединении с SQLite
+# (core.db). WAL позволяет читать во время записи, synchronous=NORMAL
+# в WAL не теряет целостность, а кеш страниц и mmap живут столько же,
+# сколько соединение.
+SQLITE_PRAGMAS = {} if DEBUG else {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'cache_size': -20000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -134,6 +206,14 @@ USE_TZ = True
 
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+# В production /media/ отдаёт веб-сервер прямо из MEDIA_ROOT, без
+# Django. Если к медиафайлам понадобится проверка доступа, переменная
+# YATUBE_MEDIA_ACCEL_REDIRECT задаёт внутренний location веб-сервера:
+# тогда /media/ обслуживает core.views.media заголовком
+# X-Accel-Redirect.
+MEDIA_ACCEL_REDIRECT = (
+    None if DEBUG else os.environ.get('YATUBE_MEDIA_ACCEL_REDIRECT') or None
+)
 
 STATIC_URL = '/static/'
 STATICFILES_DIRS = [os.path.join(BASE_DIR, 'static')]
@@ -147,8 +227,88 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 
+# Кеш в файле SQLite общий для всех рабочих процессов. Сервер
+# разработки работает в одном процессе, ему хватает LocMemCache.
 CACHES = {
     'default': {
         'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    } if DEBUG else {
+        'BACKEND': 'core.cache.SQLiteCache',
+        'LOCATION': os.environ.get(
+            'YATUBE_CACHE_PATH',
+            os.path.join(BASE_DIR, 'cache', 'cache.sqlite3'),
+        ),
+        'OPTIONS': {'MAX_ENTRIES': 100000},
     }
 }
+
+# Длина материализованной ленты подписок и число подписчиков автора,
+# начиная с которого его записи подмешиваются в ленты при чтении.
+TIMELINE_LENGTH = 1000
+TIMELINE_FANOUT_LIMIT = 10000
+
+# Число процессов, готовящих миниатюры картинок. При 0 миниатюры
+# создаются без пула процессов при сохранении записи через форму;
+# записям из админки и ORM их создаёт generate_thumbnails --missing.
+THUMBNAIL_WORKERS = 0 if DEBUG else 2
+
+# Ширины копий картинок записей для srcset (WebP и AVIF).
+POST_IMAGE_WIDTHS = (480, 960, 1440)
+
+# Сколько миниатюр помнит LRU-кеш каждого процесса.
+THUMBNAIL_CACHE_SIZE = 1024
+
+# Бэкенд полнотекстового поиска по записям и число самых новых
+# совпадений, среди которых результаты ранжируются по релевантности.
+POSTS_SEARCH_BACKEND = 'posts.search.SQLiteFTSBackend'
+POSTS_SEARCH_WINDOW = 1000
+
+# Сколько секунд хранится число записей ленты для номеров страниц,
+# сколько ещё оно отдаётся устаревшим, пока пересчитывается в фоне, и
+# с какого размера таблицы оно оценивается по статистике SQLite.
+PAGINATOR_COUNT_TTL = 300
+PAGINATOR_COUNT_GRACE = 600
+PAGINATOR_ESTIMATE_THRESHOLD = 100000
+
+# Кеш целых страниц для анонимных читателей (core.pagecache). При
+# разработке выключен, чтобы изменения шаблонов были видны сразу.
+PAGE_CACHE_ENABLED = not DEBUG
+PAGE_CACHE_TIMEOUT = 600
+
+# Метрики запросов по представлениям (core.metrics). /metrics/
+# доступен staff, Prometheus с заголовком Authorization: Bearer
+# <METRICS_TOKEN> и адресам (сетям) из METRICS_ALLOWED_IPS. Метрики у
+# каждого процесса свои: опрашивать нужно каждый процесс.
+METRICS_ENABLED = True
+METRICS_TOKEN = os.environ.get('YATUBE_METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = list(filter(
+    None, os.environ.get('YATUBE_METRICS_ALLOWED_IPS', '').split(',')
+))
+
+# Профилирование запросов (core.profiling): staff запрашивает профиль
+# параметром ?profile, и ещё профилируется каждый PROFILER_SAMPLE_RATE-й
+# запрос (0 - ни один). Профили пишутся в PROFILER_DIR, где остаются
+# PROFILER_KEEP_FILES самых новых.
+PROFILER_DIR = os.path.join(BASE_DIR, 'profiles')
+PROFILER_KEEP_FILES = 100
+PROFILER_INTERVAL = 0.001
+PROFILER_SAMPLE_RATE = int(
+    os.environ.get('YATUBE_PROFILER_SAMPLE_RATE', '0')
+)
+
+# Журнал SQL (core.querylog): запросы дольше SLOW_QUERY_SECONDS пишутся
+# в лог с планом, а HTTP-запрос, повторивший один и тот же SQL больше
+# QUERY_DUPLICATE_LIMIT раз, - предупреждение о N+1. Бюджет отдельного
+# представления задаётся в QUERY_DUPLICATE_BUDGETS; в тестах
+# превышение роняет тест. manage.py test включает это раннером
+# StrictQueriesRunner, а pytest-django берёт настройки как есть, поэтому
+# под pytest строгий режим включается здесь.
+QUERY_LOG_ENABLED = True
+SLOW_QUERY_SECONDS = float(
+    os.environ.get('YATUBE_SLOW_QUERY_SECONDS', '0.1')
+)
+QUERY_DUPLICATE_LIMIT = 5
+QUERY_DUPLICATE_BUDGETS = {}
+QUERY_DUPLICATE_STRICT = (ENVIRONMENT != 'production'
+                          and 'pytest' in sys.modules)
+TEST_RUNNER = 'core.testing.StrictQueriesRunner'
@@ -3,12 +3,15 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import include, path
 
+from core import views as core_views
+
 urlpatterns = [
     path('', include('posts.urls', namespace='posts')),
     path('admin/', admin.site.urls),
     path('auth/', include('users.urls')),
     path('auth/', include('django.contrib.auth.urls')),
     path('about/', include('about.urls', namespace='about')),
+    path('metrics/', core_views.metrics, name='metrics'),
 ]
 
 handler403 = 'core.views.permission_denied'
@@ -21,3 +24,7 @@ if settings.DEBUG:
     )
     import debug_toolbar
     urlpatterns += (path('__debug__/', include(debug_toolbar.urls)),)
+elif settings.MEDIA_ACCEL_REDIRECT:
+    urlpatterns += (
+        path(f'{settings.MEDIA_URL.strip("/")}/<path:path>', core_views.media),
+    )